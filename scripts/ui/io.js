@@ -6,6 +6,176 @@ import { DATAPATH, METADATA, THUMBNAILS } from "../base/base.js";
 import { downloadArrAsCsv, downloadObjectAsJson, loadJSON, showError } from "../utils.js";
 
 /**definitions */
+const THUMP_MAGIC = "THMP";     //magic bytes of binary containers
+const THUMP_VERSION = 1;        //supported container version
+const THUMP_ARRAYS = {          //typed array and sentinel for `null` of every storage type
+    u1: [Uint8Array, 255],
+    i2: [Int16Array, -32768],
+    u2: [Uint16Array, 65535],
+    f4: [Float32Array, undefined],
+};
+
+/**
+ * decodes a single thumbnail of a binary container
+ * @param {ArrayBuffer} buffer
+ *  - complete container
+ * @param {Number} dataStart
+ *  - byte offset of the data section
+ * @param {Object} info
+ *  - array info as stored in the header
+ * @returns {Array}
+ *  - thumbnail as nested array (same as the json files)
+ */
+function decodeThumpArray(buffer, dataStart, info) {
+    const rows = (info.rows !== undefined) ? info.rows : Array(info.shape[0]).fill(info.shape[1]);
+    const n = rows.reduce((a, b) => a + b, 0);
+    //typed arrays use the platform byte order (little-endian in all supported browsers)
+    const [TypedArray, nullValue] = THUMP_ARRAYS[info.dtype];
+    const arr = new TypedArray(buffer, dataStart + info.offset, n);
+    const scale = (info.decimals === null) ? 1 : 10**info.decimals;
+    
+    let img = [];
+    let pos = 0;
+    for (const len of rows) {
+        const row = new Array(len);
+        for (let j = 0; j < len; j++) {
+            const v = arr[pos + j];
+            if (info.dtype !== "f4") {
+                row[j] = (v === nullValue) ? null : v / scale;
+            } else {
+                //re-round to undo the `float32` representation error
+                row[j] = Number.isNaN(v) ? null : ((info.decimals === null) ? v : Math.round(v * scale) / scale);
+            }
+        }
+        img.push(row);
+        pos += len;
+    }
+    return img;
+}
+
+/**
+ * undoes the quantization of `thump.data.preprocessing`
+ * @param {Array} thumbnails
+ *  - quantized thumbnails of a single object
+ * @param {Array} scales
+ *  - `thumbnailScales` of the object
+ *  - `undefined` if the object is not quantized
+ * @param {Array} offsets
+ *  - `thumbnailOffsets` of the object
+ * @returns {Array}
+ *  - dequantized thumbnails
+ */
+function dequantize(thumbnails, scales, offsets) {
+    if (scales === undefined) {
+        return thumbnails;
+    }
+    return thumbnails.map((img, thi) => img.map(row => row.map(v => (v === null) ? null : v * scales[thi] + offsets[thi])));
+}
+
+/**
+ * parses a binary container (`.thump`) as written by `thump.data.container`
+ * - only the json header is parsed upfront
+ * - thumbnails of an object are decoded upon first access of `thumbnails`
+ * @param {ArrayBuffer} buffer
+ *  - content of the container
+ * @returns {Object}
+ *  - objects in `ThumP!` format (same as parsing the respective json file)
+ */
+export function parseThumpContainer(buffer) {
+    const view = new DataView(buffer);
+    const magic = new TextDecoder().decode(new Uint8Array(buffer, 0, 4));
+    if (magic !== THUMP_MAGIC) {
+        throw new Error("not a `ThumP!` container");
+    }
+    const version = view.getUint32(4, true);
+    if (version !== THUMP_VERSION) {
+        throw new Error(`unsupported container version ${version} (expected ${THUMP_VERSION})`);
+    }
+    const headerLength = view.getUint32(8, true);
+    const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 12, headerLength)));
+    const dataStart = 12 + headerLength;
+
+    let data = {};
+    for (const [objId, meta] of Object.entries(header["objects"])) {
+        let obj = {};
+        for (const [key, value] of Object.entries(meta)) {
+            if ((key === "thumbnailScales") || (key === "thumbnailOffsets")) {
+                continue;   //not exposed (would end up as auxiliary columns)
+            }
+            if (key !== "thumbnails") {
+                obj[key] = value;
+                continue;
+            }
+            //decode lazily (replaced by the decoded thumbnails upon first access)
+            Object.defineProperty(obj, "thumbnails", {
+                get() {
+                    const thumbnails = dequantize(value.map(info => decodeThumpArray(buffer, dataStart, info)), meta["thumbnailScales"], meta["thumbnailOffsets"]);
+                    Object.defineProperty(obj, "thumbnails", {value: thumbnails, writable: true, enumerable: true, configurable: true});
+                    return thumbnails;
+                },
+                enumerable: true,
+                configurable: true,
+            });
+        }
+        data[objId] = obj;
+    }
+    return data;
+}
+
+/**
+ * decompresses an uploaded file natively (`DecompressionStream`)
+ * - gzip (`.gz`) is supported by all browsers
+ * - zstd (`.zst`) only if the browser supports it
+ * @param {File} file
+ *  - some compressed file
+ * @param {String} format
+ *  - format passed to `DecompressionStream`
+ * @returns {Response}
+ *  - decompressed content (use `.text()` or `.arrayBuffer()`)
+ */
+function decompressFile(file, format) {
+    let stream;
+    try {
+        stream = file.stream().pipeThrough(new DecompressionStream(format));
+    } catch (err) {
+        throw new Error(`${format} is not supported by this browser. decompress ${file.name} before uploading it (or write gzip compressed files)`);
+    }
+    return new Response(stream);
+}
+
+/**
+ * reads an uploaded `ThumP!` file
+ * - binary containers (`.thump`) and json files are supported
+ * - gzip (`.gz`) and zstd (`.zst`) compressed files are decompressed while reading
+ * @param {File} file
+ *  - some file to read
+ * @returns {Object}
+ *  - objects in `ThumP!` format
+ */
+export async function readThumpFile(file) {
+    let name = file.name;
+    let content = file;     //anything with `.text()` and `.arrayBuffer()`
+    if (name.endsWith(".gz")) {
+        content = decompressFile(file, "gzip");
+        name = name.slice(0, -".gz".length);
+    } else if (name.endsWith(".zst")) {
+        content = decompressFile(file, "zstd");
+        name = name.slice(0, -".zst".length);
+    }
+
+    if (name.endsWith(".thump")) {
+        return parseThumpContainer(await content.arrayBuffer());
+    }
+    const text = await content.text();  //read file
+    const data = JSON.parse(text);      //parse JSON
+    for (const obj of Object.values(data)) {
+        obj["thumbnails"] = dequantize(obj["thumbnails"], obj["thumbnailScales"], obj["thumbnailOffsets"]);
+        delete obj["thumbnailScales"];     //not exposed (would end up as auxiliary columns)
+        delete obj["thumbnailOffsets"];
+    }
+    return data;
+}
+
 /**
  * returs quantities describing the schema of some file
  * @param {File} file
@@ -14,8 +184,7 @@ import { downloadArrAsCsv, downloadObjectAsJson, loadJSON, showError } from "../
  *  - inferred schema parameters
  */
 export async function getSchema(file) {
-    const text = await file.text();     //read file
-    const data = JSON.parse(text);      //parse JSON
+    const data = await readThumpFile(file);     //read and parse file
 
     return {
         length: Object.keys(data).length,
@@ -46,6 +215,7 @@ export async function fillThumbnails() {
     let curRenderedObj = 0;
     let objIdx = 0;                                                         //global object index
     let objIdxFile = 0;                                                     //object index in the current file
+    let parsed = {file: undefined, data: undefined};                        //last parsed file (every file is only parsed once)
     METADATA["objPerPage"] = objPerPage                                     //for status report
     METADATA["fileIdxStart"] = fileIdx;                                     //for status report
     while ((curRenderedObj < objPerPage) & (fileIdx < METADATA["filesUploaded"].length)) {
@@ -58,8 +228,10 @@ export async function fillThumbnails() {
 
         //read relevant file
         try {
-            const text = await curFile.text();  //read file
-            const data = JSON.parse(text);      //parse JSON
+            if (parsed.file !== curFile) {
+                parsed = {file: curFile, data: await readThumpFile(curFile)};   //read and parse file
+            }
+            const data = parsed.data;
             const objIds = Object.keys(data);
             THUMBNAILS[objIds[objIdxFile]] = data[objIds[objIdxFile]];
             // console.log(objIds[objIdxFile])
@@ -12,6 +12,40 @@ import { abcRange, generateColorWay } from "../utils.js";
 const resizeObservers = [];
 
 /**definitions */
+/**
+ * - determines the color limits of a thumbnail
+ * - priority
+ *  - `zmin`/`zmax` set by the user
+ *  - precomputed `thumbnailLimits` of the object (if present, pixel math gets applied to them)
+ *  - range of `img`
+ * @param {Array} img
+ *  - 2d-array
+ *  - thumbnail (pixel math applied already)
+ * @param {Array|null} limits
+ *  - precomputed `[zmin, zmax]` of the thumbnail (before pixel math)
+ *  - `null` or `undefined` if not available
+ * @param {Object} globalOptions
+ *  - global options extracted from the UI input
+ * @returns {Array}
+ *  - `[zmin, zmax]` to use for displaying `img`
+ */
+function displayLimits(img, limits, globalOptions) {
+    let [zmin, zmax] = [undefined, undefined];
+    if (Array.isArray(limits) && (limits[0] !== null) && (limits[1] !== null)) {
+        const transformed = limits.map(z => parseMath(globalOptions["pixelmath"], {z: z}));
+        if (transformed.every(Number.isFinite)) {
+            [zmin, zmax] = [Math.min(...transformed), Math.max(...transformed)];    //pixel math can invert the order
+        }
+    }
+    if (zmin === undefined) {
+        [zmin, zmax] = [Math.min(...img.flat()), Math.max(...img.flat())];
+    }
+    return [
+        (globalOptions["zmin"].length > 0) ? parseFloat(globalOptions["zmin"]) : zmin,
+        (globalOptions["zmax"].length > 0) ? parseFloat(globalOptions["zmax"]) : zmax,
+    ];
+}
+
 /**
  * - plots `img` in `thumbnailElement` 
  * @param {Array} img
@@ -192,7 +226,7 @@ export function fillGrid({
                 selection.value = kind;                             //for determining the quality/category
                 selection.dataset["objectId"] = objIds[i];          //for saving the objId
                 let auxCols = Object.keys(THUMBNAILS[objIds[i]]);
-                auxCols = auxCols.filter(c => (!["objectId","thumbnails","thumbnailTypes"].includes(c)))
+                auxCols = auxCols.filter(c => (!["objectId","thumbnails","thumbnailTypes","thumbnailLimits"].includes(c)))
                 for (const auxCol of auxCols) {
                     selection.dataset[auxCol] = THUMBNAILS[objIds[i]][auxCol];
                 }
@@ -313,11 +347,12 @@ export function updateGridCell({
             let traceUpdate = [];     //init update
             let layoutUpdate = {};    //init update
             if (globalOptions["seriestype"] === "heatmap") {
+                const [zmin, zmax] = displayLimits(img, THUMBNAILS[objId]["thumbnailLimits"]?.[thId], globalOptions);
                 traceUpdate = [{
                     z: img,
                     colorscale: curColorScale,
-                    zmin: (globalOptions["zmin"].length > 0) ? parseFloat(globalOptions["zmin"]) : Math.min(...img.flat()),
-                    zmax: (globalOptions["zmax"].length > 0) ? parseFloat(globalOptions["zmax"]) : Math.max(...img.flat()),
+                    zmin: zmin,
+                    zmax: zmax,
                     type: globalOptions["seriestype"],
                     showscale: false,
                 }];
@@ -0,0 +1,6 @@
+"""allows running `ThumP!` commands via `python3 -m thump SUBCOMMAND [ARGS ...]` (see `thump.commands.dispatch`)"""
+
+from thump.commands import dispatch
+
+if __name__ == "__main__":
+    dispatch.main()
@@ -0,0 +1,18 @@
+"""benchmarks for the `ThumP!` processing pipeline
+
+- all benchmarks run offline on synthetic data
+
+Exceptions
+
+Classes
+	  
+Functions
+    - `encoding.run()` -- compares the json thumbnail encoder to the plain `json` path
+    - `cutouts.run()` -- checks the lightweight FITS cutout decoder against astropy and compares runtimes
+    - `container.run()` -- compares size and parse time of json files and binary containers
+    - `pipeline.run()` -- end-to-end throughput, latency percentiles and peak RSS of the processing pipeline
+    - `pipeline.compare()` -- flags regressions between two results of `pipeline.run()`
+    - `startup.run()` -- startup time of every `thump` subcommand against its budget
+
+Other Objects
+"""
@@ -0,0 +1,147 @@
+"""size and parse-time comparison of json files and binary containers
+
+- compares `thump.data.encoding` (json) to `thump.data.container` (`.thump`)
+    - file size
+    - encoding time
+    - parse time (`json.loads()` vs. `thump.data.container.load()`)
+- checks that every container decodes to the same objects as the respective json file
+- exits with a non-zero status if any container is not equivalent
+
+Usage
+```bash
+    python3 -m thump.benchmarks.container [--nobj NOBJ] [--npix NPIX] [--nrep NREP]
+```
+
+"""
+
+#%%imports
+import argparse
+import io
+import json
+import numpy as np
+import sys
+import time
+from typing import Callable, Dict, Tuple
+
+from thump.benchmarks import encoding as thbe
+from thump.data import container as thct
+from thump.data import encoding as thden
+
+#%%definitions
+def _best(func:Callable, nrep:int) -> Tuple[float,object]:
+    """best runtime of `nrep` calls to `func` and its last return value"""
+    runtimes = []
+    for _ in range(nrep):
+        start = time.perf_counter()
+        out = func()
+        runtimes.append(time.perf_counter() - start)
+    return min(runtimes), out
+
+def equivalent(reference:dict, decoded:dict) -> bool:
+    """whether `decoded` (from a container) contains the same objects as `reference` (from json)"""
+    if list(reference.keys()) != list(decoded.keys()):
+        return False
+    for k, ref in reference.items():
+        dec = decoded[k]
+        if list(ref.keys()) != list(dec.keys()):
+            return False
+        for key, value in ref.items():
+            if key != "thumbnails":
+                if value != dec[key]: return False
+                continue
+            for th_ref, th_dec in zip(value, dec[key]):
+                th_ref = np.array(th_ref, dtype=np.float64)
+                if not np.allclose(th_ref, th_dec, rtol=1e-6, atol=0, equal_nan=True): return False
+    return True
+
+def run(nobj:int=100, npix:int=30, nrep:int=5) -> Dict[str,Dict[str,float]]:
+    """runs the benchmark
+
+    Parameters
+        - `nobj`
+            - `int`, optional
+            - number of objects per file
+            - the default is `100`
+        - `npix`
+            - `int`, optional
+            - side length of every thumbnail
+            - the default is `30`
+        - `nrep`
+            - `int`, optional
+            - number of repetitions
+            - the best repetition is reported
+            - the default is `5`
+
+    Returns
+        - `results`
+            - `Dict[str,Dict[str,float]]`
+            - size in bytes and best encoding and parse times in seconds for each format
+            - contains `failed` (number of containers that are not equivalent)
+    """
+    objs = thbe.make_objs(nobj, npix)
+
+    def _json(indent:int) -> Callable:
+        def dump() -> bytes:
+            f = io.StringIO()
+            thden.dump(objs, f, decimals=1, indent=indent)
+            return f.getvalue().encode("utf-8")
+        return dump
+
+    formats:Dict[str,Tuple[Callable,Callable]] = {
+        "json (pretty)":        (_json(2),                                                          json.loads),
+        "json (compact)":       (_json(None),                                                       json.loads),
+        "thump (int16)":        (lambda: thct.dumps(objs, decimals=1, dtype="int16"),               lambda b: thct.load(io.BytesIO(b))),
+        "thump (float32)":      (lambda: thct.dumps(objs, decimals=1, dtype="float32"),             lambda b: thct.load(io.BytesIO(b))),
+    }
+    results = dict()
+    failed = 0
+    reference = None
+    for name, (dump, load) in formats.items():
+        t_dump, buf = _best(dump, nrep)
+        t_load, out = _best(lambda: load(buf), nrep)
+        if reference is None:
+            reference = out
+        elif name.startswith("thump"):
+            ok = equivalent(reference, out)
+            failed += not ok
+            if not ok: print(f"{name}: decoded objects differ from json")
+        results[name] = dict(size=len(buf), dump=t_dump, load=t_load)
+        base = results["json (pretty)"]
+        print(f"{name:16s} {len(buf)/1e6:7.3f} MB ({base['size']/len(buf):5.1f}x smaller) dump {t_dump*1e3:8.2f} ms   parse {t_load*1e3:8.2f} ms ({base['load']/t_load:5.1f}x faster)")
+    results["failed"] = failed
+
+    return results
+
+#%%main
+def main():
+    parser = argparse.ArgumentParser(
+    )
+    parser.add_argument(
+        "--nobj",
+        type=int,
+        default=100,
+        required=False,
+        help="number of objects per file"
+    )
+    parser.add_argument(
+        "--npix",
+        type=int,
+        default=30,
+        required=False,
+        help="side length of every thumbnail"
+    )
+    parser.add_argument(
+        "--nrep",
+        type=int,
+        default=5,
+        required=False,
+        help="number of repetitions"
+    )
+    args=vars(parser.parse_args())
+
+    results = run(**args)
+
+    sys.exit(1 if results["failed"] > 0 else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""equivalence check and microbenchmark of the lightweight FITS cutout decoder
+
+- checks that `thump.fink_lsst.cutouts` reproduces `astropy.io.fits.open(...)[0].data` exactly
+    - plain images of every `BITPIX`, NaN, long headers with WCS and comments
+    - cases handled by the astropy fallback (scaled data, unsigned integers, extensions, compressed images)
+- compares the runtime to decoding every cutout via `astropy.io.fits.open()`
+- exits with a non-zero status if any case is not equivalent
+
+Usage
+```bash
+    python3 -m thump.benchmarks.cutouts [--nobj NOBJ] [--npix NPIX] [--nrep NREP]
+```
+
+"""
+
+#%%imports
+import argparse
+from astropy.io import fits
+from io import BytesIO
+import numpy as np
+import sys
+import time
+from typing import Dict, List
+
+from thump.fink_lsst import cutouts as thco
+
+#%%definitions
+def _to_bytes(hdul:fits.HDUList) -> bytes:
+    buf = BytesIO()
+    hdul.writeto(buf)
+    return buf.getvalue()
+
+def make_cases(npix:int=30, seed:int=0) -> Dict[str,bytes]:
+    """generates FITS cutouts covering the fast path and the fallback"""
+    rng = np.random.default_rng(seed)
+    img = rng.normal(100, 30, size=(npix,npix))
+    img_nan = img.astype(np.float32)
+    img_nan[rng.random(img_nan.shape) < 0.05] = np.nan
+
+    header = fits.Header()
+    header["CTYPE1"] = ("RA---TAN", "projection / with slash")
+    header["CTYPE2"] = "DEC--TAN"
+    header["CRVAL1"] = 10.123456789
+    header["CRVAL2"] = -5.5
+    header["COMMENT"] = "some comment = with equal sign"
+    header["OBJECT"] = "a / b"
+    for i in range(40): header[f"DUMMY{i:03d}"] = i   #header spanning several blocks
+
+    cases = {
+        "float32":              _to_bytes(fits.HDUList([fits.PrimaryHDU(img.astype(np.float32))])),
+        "float32 (nan)":        _to_bytes(fits.HDUList([fits.PrimaryHDU(img_nan)])),
+        "float32 (long header)":_to_bytes(fits.HDUList([fits.PrimaryHDU(img_nan, header=header)])),
+        "float64":              _to_bytes(fits.HDUList([fits.PrimaryHDU(img)])),
+        "uint8":                _to_bytes(fits.HDUList([fits.PrimaryHDU(np.clip(img, 0, 255).astype(np.uint8))])),
+        "int16":                _to_bytes(fits.HDUList([fits.PrimaryHDU(img.astype(np.int16))])),
+        "int32":                _to_bytes(fits.HDUList([fits.PrimaryHDU(img.astype(np.int32))])),
+        "int64":                _to_bytes(fits.HDUList([fits.PrimaryHDU(img.astype(np.int64))])),
+        "non-square":           _to_bytes(fits.HDUList([fits.PrimaryHDU(img[:npix//2].astype(np.float32))])),
+        #fallback
+        "uint16 (bzero)":       _to_bytes(fits.HDUList([fits.PrimaryHDU(np.clip(img, 0, None).astype(np.uint16))])),
+        "3d":                   _to_bytes(fits.HDUList([fits.PrimaryHDU(np.stack([img_nan]*2))])),
+        "extension":            _to_bytes(fits.HDUList([fits.PrimaryHDU(), fits.ImageHDU(img_nan)])),
+        "compressed":           _to_bytes(fits.HDUList([fits.PrimaryHDU(), fits.CompImageHDU(img_nan)])),
+    }
+    scaled = fits.PrimaryHDU(img.astype(np.float32))
+    scaled.scale("int16", bscale=0.01, bzero=100)
+    cases["int16 (bscale)"] = _to_bytes(fits.HDUList([scaled]))
+    return cases
+
+def decode_astropy(buf:bytes) -> np.ndarray:
+    """reference path"""
+    hdul = fits.open(BytesIO(buf))
+    data = hdul[0].data
+    hdul.close()
+    return data
+
+def verify(cases:Dict[str,bytes]) -> List[str]:
+    """compares `thump.fink_lsst.cutouts.decode_cutout()` to astropy for every case
+
+    Returns
+        - `failed`
+            - `List[str]`
+            - names of the cases that are not equivalent
+    """
+    failed = []
+    for name, buf in cases.items():
+        ref = decode_astropy(buf)
+        out = thco.decode_cutout(buf)
+        fast = thco._decode_fast(buf) is not None
+        if ref is None:
+            ok = out is None
+        else:
+            ok = (out is not None) and (out.dtype == ref.dtype) and (out.shape == ref.shape) and np.array_equal(out, ref, equal_nan=(ref.dtype.kind == "f"))
+        print(f"{name:22s} {'fast' if fast else 'astropy':8s} {'ok' if ok else 'FAILED'}")
+        if not ok: failed.append(name)
+    return failed
+
+def run(nobj:int=100, npix:int=30, nrep:int=5) -> Dict[str,float]:
+    """runs the equivalence check and the benchmark
+
+    Parameters
+        - `nobj`
+            - `int`, optional
+            - number of alerts (with three cutouts each) per batch
+            - the default is `100`
+        - `npix`
+            - `int`, optional
+            - side length of every cutout
+            - the default is `30`
+        - `nrep`
+            - `int`, optional
+            - number of repetitions
+            - the best repetition is reported
+            - the default is `5`
+
+    Returns
+        - `results`
+            - `Dict[str,float]`
+            - best runtime per batch for each path in seconds
+            - contains `failed` (number of cases that are not equivalent)
+    """
+    failed = verify(make_cases(npix))
+
+    rng = np.random.default_rng(1)
+    batch = [
+        [_to_bytes(fits.HDUList([fits.PrimaryHDU(rng.normal(size=(npix,npix)).astype(np.float32))])) for _ in range(3)]
+        for _ in range(nobj)
+    ]
+    paths = {
+        "astropy":              lambda b: [[decode_astropy(c) for c in row] for row in b],
+        "decode_cutouts()":     thco.decode_cutouts,
+    }
+    results = dict()
+    for name, path in paths.items():
+        runtimes = []
+        for _ in range(nrep):
+            start = time.perf_counter()
+            path(batch)
+            runtimes.append(time.perf_counter() - start)
+        results[name] = min(runtimes)
+        print(f"{name:20s} {results[name]*1e3:9.2f} ms/batch ({results[name]/nobj*1e6:7.1f} us/alert, speedup {results['astropy']/results[name]:5.1f}x)")
+    results["failed"] = len(failed)
+
+    return results
+
+#%%main
+def main():
+    parser = argparse.ArgumentParser(
+    )
+    parser.add_argument(
+        "--nobj",
+        type=int,
+        default=100,
+        required=False,
+        help="number of alerts (three cutouts each) per batch"
+    )
+    parser.add_argument(
+        "--npix",
+        type=int,
+        default=30,
+        required=False,
+        help="side length of every cutout"
+    )
+    parser.add_argument(
+        "--nrep",
+        type=int,
+        default=5,
+        required=False,
+        help="number of repetitions"
+    )
+    args=vars(parser.parse_args())
+
+    results = run(**args)
+
+    sys.exit(1 if results["failed"] > 0 else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""microbenchmark of the json thumbnail encoder
+
+- compares `thump.data.encoding` to the previous path
+    - `np.round()` -> object array with `None` for NaN -> `.tolist()` -> `json.dump(..., indent=2)`
+
+Usage
+```bash
+    python3 -m thump.benchmarks.encoding [--nobj NOBJ] [--npix NPIX] [--nrep NREP]
+```
+
+"""
+
+#%%imports
+import argparse
+import io
+import json
+import numpy as np
+import time
+from typing import Callable, Dict
+
+from thump.data import encoding as thden
+
+#%%definitions
+def make_objs(nobj:int=100, npix:int=30, seed:int=0) -> dict:
+    """generates `nobj` lsst-like objects with three `npix`x`npix` float32 thumbnails containing some NaN"""
+    rng = np.random.default_rng(seed)
+    objs = dict()
+    for i in range(nobj):
+        thumbnails = [rng.normal(100, 30, size=(npix,npix)).astype(np.float32) for _ in range(3)]
+        for th in thumbnails: th[rng.random(th.shape) < 0.01] = np.nan
+        objs[str(i)] = dict(
+            link=f"https://lsst.fink-portal.org/{i}",
+            thumbnailTypes=["science", "template", "differece"],
+            thumbnails=thumbnails,
+            midpointMjdTai=60000.1234,
+            comment="",
+        )
+    return objs
+
+def dump_plain(objs:dict, f:io.StringIO):
+    """previous path"""
+    objs = {
+        k:{**v, "thumbnails":[np.where(np.isnan(x), None, np.round(x, 1)).tolist() for x in v["thumbnails"]]}
+        for k, v in objs.items()
+    }
+    json.dump(objs, f, indent=2)
+    return
+
+def run(nobj:int=100, npix:int=30, nrep:int=5) -> Dict[str,float]:
+    """runs the benchmark
+
+    Parameters
+        - `nobj`
+            - `int`, optional
+            - number of objects per encoded file
+            - the default is `100`
+        - `npix`
+            - `int`, optional
+            - side length of every thumbnail
+            - the default is `30`
+        - `nrep`
+            - `int`, optional
+            - number of repetitions
+            - the best repetition is reported
+            - the default is `5`
+
+    Returns
+        - `results`
+            - `Dict[str,float]`
+            - best runtime per encoded file for each path in seconds
+    """
+    objs = make_objs(nobj, npix)
+
+    paths:Dict[str,Callable] = {
+        "json (indent=2)":      dump_plain,
+        "thden (pretty)":       lambda o, f: thden.dump(o, f, decimals=1, indent=2),
+        "thden (compact)":      lambda o, f: thden.dump(o, f, decimals=1, indent=None),
+    }
+    results = dict()
+    for name, path in paths.items():
+        runtimes = []
+        for _ in range(nrep):
+            f = io.StringIO()
+            start = time.perf_counter()
+            path(objs, f)
+            runtimes.append(time.perf_counter() - start)
+        results[name] = min(runtimes)
+        print(f"{name:20s} {results[name]*1e3:9.2f} ms/file ({len(f.getvalue())/1e6:6.2f} MB, speedup {results['json (indent=2)']/results[name]:5.1f}x)")
+
+    return results
+
+#%%main
+def main():
+    parser = argparse.ArgumentParser(
+    )
+    parser.add_argument(
+        "--nobj",
+        type=int,
+        default=100,
+        required=False,
+        help="number of objects per encoded file"
+    )
+    parser.add_argument(
+        "--npix",
+        type=int,
+        default=30,
+        required=False,
+        help="side length of every thumbnail"
+    )
+    parser.add_argument(
+        "--nrep",
+        type=int,
+        default=5,
+        required=False,
+        help="number of repetitions"
+    )
+    args=vars(parser.parse_args())
+
+    _ = run(**args)
+
+    return
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,451 @@
+"""end-to-end benchmarks of the `ThumP!` processing pipeline with regression tracking
+
+- runs offline on synthetic alert packages (see `thump.data.examples.make_alerts()`)
+- covers
+    - `add_batch` -- `thump.fink_lsst.accumulator.ChunkAccumulator.add_batch()` (latency per chunk of decoded alerts)
+    - `stream_pipeline` -- `thump.fink_lsst.pipeline.StreamPipeline` replaying the alert packages via `thump.fink_lsst.replay.ReplaySource` (latency per run, includes decoding)
+    - `compile_file` -- `thump.fink_lsst.process_data.compile_file()` (latency per chunk)
+    - `compile_files` -- `thump.fink_lsst.process_data.compile_files()` (latency per run)
+    - `concat` -- `thump.data.output.concat()` (latency per run, every run ingests all output files)
+    - `remove_inspected` -- `thump.data.output.remove_inspected()` (latency per run, dry run)
+- reports for every case
+    - throughput (items per second)
+    - latency percentiles (`p50`, `p90`, `p99`) in milliseconds
+    - peak resident set size (RSS) in MiB
+        - every case runs in a fresh process, i.e., the peak is not inflated by previous cases
+        - includes the interpreter and all imports (`baseline_rss_mib` is the peak before the case started)
+- results are written as json (`--save`)
+- `--compare BASELINE CURRENT` flags regressions between two results files
+    - lower throughput, higher latency (`p50`, `p99`) or higher peak RSS by more than `--threshold`
+    - exits with a non-zero status if any case regressed
+- the stream cases (`add_batch`, `stream_pipeline`) require `fink_client`
+
+Usage
+```bash
+    python3 -m thump.benchmarks.pipeline \
+        [--cases CASE [CASE ...]] [--nfiles NFILES] [--nalerts NALERTS] [--npix NPIX] \
+        [--chunklen CHUNKLEN] [--format {json,binary}] [--njobs NJOBS] [--nrep NREP] [--seed SEED] \
+        [--save FILENAME.json]
+    python3 -m thump.benchmarks.pipeline --compare BASELINE.json CURRENT.json [--threshold THRESHOLD]
+```
+
+"""
+
+#%%imports
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import json
+import multiprocessing as mp
+import numpy as np
+import os
+import platform
+import polars as pl
+import resource
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Tuple
+
+from thump.data import examples as thde
+
+#%%definitions
+def _peak_rss() -> float:
+    """peak resident set size of the current process in MiB"""
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / 2**20 if sys.platform == "darwin" else maxrss / 2**10   #bytes on macos, KiB otherwise
+
+def _timed(func:Callable, *args, **kwargs) -> float:
+    """runtime of a single call to `func` in seconds"""
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - start
+
+def _source_ids(fnames:List[str]) -> List[str]:
+    """ids (`diaSourceId`) of all alerts with a `diaObjectId` (i.e., all alerts that get processed)"""
+    return (pl.scan_parquet(fnames)
+        .filter(pl.col("diaObject").struct.field("diaObjectId").is_not_null())
+        .select(pl.col("diaSource").struct.field("diaSourceId").cast(pl.Utf8))
+        .collect()
+        .to_series().to_list()
+    )
+
+def _write_outputs(save_dir:str, ids:List[str], nfiles:int) -> List[str]:
+    """writes `ThumP!` output files (`thump_{sessionId}_{page}.csv`) classifying `ids`"""
+    os.makedirs(save_dir, exist_ok=True)
+    fnames = []
+    for page, part in enumerate(np.array_split(np.asarray(ids, dtype=object), nfiles)):
+        fn = os.path.join(save_dir, f"thump_20260101000000_{page}.csv")
+        pl.DataFrame({
+            "class":    np.array(["good", "bad", "maybe"])[np.arange(len(part)) % 3],
+            "objectId": part.astype(str),
+            "comment":  ["benchmark"] * len(part),
+        }).write_csv(fn)
+        fnames.append(fn)
+    return fnames
+
+def _decoded_alerts(fnames:List[str]) -> List[dict]:
+    """all alerts with a `diaObjectId` decoded into `ThumP!` format (see `thump.fink_lsst.decoding.decode_alert()`)"""
+    from thump.fink_lsst import decoding as thdc
+    from thump.fink_lsst import replay as thrp
+    with thrp.ReplaySource(fnames, shuffle=False) as source:
+        alerts = [source.alert(i) for i in range(len(source))]
+    return [thdc.decode_alert(a) for a in alerts if a[1]["diaObject"]["diaObjectId"] is not None]
+
+def bench_add_batch(fnames:List[str], work:str, nrep:int, chunklen:int, fmt:str, **kwargs) -> Tuple[int,List[float]]:
+    from thump.fink_lsst import accumulator as thac
+    data_jsons = _decoded_alerts(fnames)
+    latencies = []
+    for r in range(nrep):
+        save_dir = os.path.join(work, f"add_batch_{r}", "")
+        os.makedirs(save_dir)
+        with thac.ChunkAccumulator(save_dir, chunklen=chunklen, fmt=fmt) as accumulator:
+            #one poll worth (`chunklen` alerts) per call, i.e., every call writes a chunk
+            latencies += [
+                _timed(accumulator.add_batch, data_jsons[i:i+chunklen])
+                for i in range(0, len(data_jsons), chunklen)
+            ]
+    return len(data_jsons) * nrep, latencies
+
+def bench_stream_pipeline(fnames:List[str], work:str, nrep:int, chunklen:int, fmt:str, njobs:int, **kwargs) -> Tuple[int,List[float]]:
+    from thump.fink_lsst import accumulator as thac
+    from thump.fink_lsst import decoding as thdc
+    from thump.fink_lsst import pipeline as thpl
+    from thump.fink_lsst import replay as thrp
+    latencies = []
+    for r in range(nrep):
+        save_dir = os.path.join(work, f"stream_pipeline_{r}", "")
+        os.makedirs(save_dir)
+        with thrp.ReplaySource(fnames, rate=0, shuffle=False) as source:    #emits alerts as fast as possible
+            accumulator = thac.ChunkAccumulator(save_dir, chunklen=chunklen, fmt=fmt)
+            pipeline = thpl.StreamPipeline(
+                consume=lambda: source.consume(num_alerts=chunklen, timeout=1),
+                process=thdc.decode_alert,
+                write_batch=accumulator.add_batch,
+                nworkers=njobs,
+                npolls=int(np.ceil(len(source) / chunklen)),
+            )
+            start = time.perf_counter()
+            pipeline.run()
+            accumulator.close()
+            latencies.append(time.perf_counter() - start)
+        nitems = len(source)
+    return nitems * nrep, latencies
+
+def bench_compile_file(fnames:List[str], work:str, nrep:int, chunklen:int, fmt:str, **kwargs) -> Tuple[int,List[float]]:
+    from thump.fink_lsst import process_data as thpd
+    plan = thpd.plan_chunks(fnames, chunklen)
+    latencies = []
+    for r in range(nrep):
+        save_dir = os.path.join(work, f"compile_file_{r}", "")
+        os.makedirs(save_dir)
+        latencies += [
+            _timed(thpd.compile_file, thpd.read_chunk(pieces), chunkidx=f"{c:04d}", chunklen=chunklen, save_dir=save_dir, fmt=fmt)
+            for c, pieces in enumerate(plan)
+        ]
+    return len(_source_ids(fnames)) * nrep, latencies
+
+def bench_compile_files(fnames:List[str], work:str, nrep:int, chunklen:int, fmt:str, njobs:int, **kwargs) -> Tuple[int,List[float]]:
+    from thump.fink_lsst import process_data as thpd
+    latencies = []
+    for r in range(nrep):
+        save_dir = os.path.join(work, f"compile_files_{r}", "")
+        os.makedirs(save_dir)
+        latencies.append(_timed(thpd.compile_files, fnames, chunklen=chunklen, save_dir=save_dir, n_jobs=njobs, fmt=fmt))
+    return len(_source_ids(fnames)) * nrep, latencies
+
+def bench_concat(fnames:List[str], work:str, nrep:int, chunklen:int, **kwargs) -> Tuple[int,List[float]]:
+    from thump.data import output as thdo
+    ids = _source_ids(fnames)
+    out_dir = os.path.join(work, "concat_outputs", "")
+    _write_outputs(out_dir, ids, max(1, len(ids) // chunklen))
+    latencies = [
+        _timed(thdo.concat, out_dir, dataset=os.path.join(work, f"concat_dataset_{r}"))
+        for r in range(nrep)
+    ]
+    return len(ids) * nrep, latencies
+
+def bench_remove_inspected(fnames:List[str], work:str, nrep:int, chunklen:int, fmt:str, **kwargs) -> Tuple[int,List[float]]:
+    from thump.data import output as thdo
+    from thump.fink_lsst import process_data as thpd
+    in_dir = os.path.join(work, "remove_inspected_inputs", "")
+    out_dir = os.path.join(work, "remove_inspected_outputs", "")
+    os.makedirs(in_dir)
+    thpd.compile_files(fnames, chunklen=chunklen, save_dir=in_dir, fmt=fmt)
+    ids = _source_ids(fnames)
+    _write_outputs(out_dir, ids[:len(ids)//2], max(1, len(ids) // (2*chunklen)))     #half of the alerts got inspected
+    latencies = [
+        _timed(thdo.remove_inspected, f"{in_dir}processed_*", f"{out_dir}thump_*", dry_run=True, store=os.path.join(work, f"remove_inspected_store_{r}"))
+        for r in range(nrep)
+    ]
+    return len(ids) * nrep, latencies
+
+CASES:Dict[str,Callable] = {
+    "add_batch":            bench_add_batch,
+    "stream_pipeline":      bench_stream_pipeline,
+    "compile_file":         bench_compile_file,
+    "compile_files":        bench_compile_files,
+    "concat":               bench_concat,
+    "remove_inspected":     bench_remove_inspected,
+}
+
+def _run_case(name:str, kwargs:dict) -> dict:
+    """runs case `name` (in a fresh process) and summarizes it"""
+    baseline = _peak_rss()
+    os.makedirs(kwargs["work"])
+    nitems, latencies = CASES[name](**kwargs)
+    latencies = np.array(latencies)
+    return dict(
+        nitems=nitems,
+        ncalls=len(latencies),
+        total_seconds=float(latencies.sum()),
+        throughput=float(nitems / latencies.sum()),
+        latency_ms={
+            "mean": float(latencies.mean() * 1e3),
+            **{f"p{q}": float(np.percentile(latencies, q) * 1e3) for q in (50, 90, 99)},
+            "max":  float(latencies.max() * 1e3),
+        },
+        peak_rss_mib=_peak_rss(),
+        baseline_rss_mib=baseline,
+    )
+
+def run(
+    cases:List[str]=None,
+    nfiles:int=2, nalerts:int=500, npix:int=30,
+    chunklen:int=100, fmt:str="json", njobs:int=1,
+    nrep:int=3, seed:int=0,
+    ) -> dict:
+    """runs the benchmark
+
+    Parameters
+        - `cases`
+            - `List[str]`, optional
+            - cases to run (keys of `CASES`)
+            - the default is `None`
+                - all cases
+        - `nfiles`
+            - `int`, optional
+            - number of synthetic alert packages
+            - the default is `2`
+        - `nalerts`
+            - `int`, optional
+            - number of alerts per alert package
+            - the default is `500`
+        - `npix`
+            - `int`, optional
+            - side length of the cutouts
+            - the default is `30`
+        - `chunklen`
+            - `int`, optional
+            - number of objects per written chunk
+            - the default is `100`
+        - `fmt`
+            - `str`, optional
+            - format of the written chunks (`"json"` or `"binary"`)
+            - the default is `"json"`
+        - `njobs`
+            - `int`, optional
+            - number of parallel jobs in `compile_files` (workers in `stream_pipeline`)
+            - the default is `1`
+        - `nrep`
+            - `int`, optional
+            - number of repetitions of every case
+            - the default is `3`
+        - `seed`
+            - `int`, optional
+            - seed of the synthetic data
+            - the default is `0`
+
+    Returns
+        - `results`
+            - `dict`
+            - `meta` (parameters and environment) and `results` (summary of every case)
+    """
+    if cases is None: cases = list(CASES.keys())
+    params = dict(nfiles=nfiles, nalerts=nalerts, npix=npix, chunklen=chunklen, fmt=fmt, njobs=njobs, nrep=nrep, seed=seed)
+    results = dict(
+        meta=dict(
+            params=params,
+            python=platform.python_version(),
+            platform=platform.platform(),
+            ncpus=os.cpu_count(),
+            timestamp=time.strftime("%Y-%m-%dT%H:%M:%S"),
+        ),
+        results=dict(),
+    )
+    with tempfile.TemporaryDirectory(prefix="thump_benchmark_") as tmp:
+        fnames = thde.make_alerts(nfiles=nfiles, nalerts_per_file=nalerts, save_dir=os.path.join(tmp, "alerts"), npix=npix, seed=seed, njobs=nfiles)
+        for name in cases:
+            kwargs = dict(fnames=fnames, work=os.path.join(tmp, name), nrep=nrep, chunklen=chunklen, fmt=fmt, njobs=njobs)
+            with ProcessPoolExecutor(max_workers=1, mp_context=mp.get_context("spawn")) as pool:
+                res = pool.submit(_run_case, name, kwargs).result()
+            results["results"][name] = res
+            print(
+                f"{name:22s} {res['throughput']:10.1f} items/s   "
+                f"p50 {res['latency_ms']['p50']:9.2f} ms   p90 {res['latency_ms']['p90']:9.2f} ms   p99 {res['latency_ms']['p99']:9.2f} ms   "
+                f"peak RSS {res['peak_rss_mib']:7.1f} MiB"
+            )
+
+    return results
+
+def compare(baseline:dict, current:dict, threshold:float=0.2) -> List[str]:
+    """compares two results of `run()`
+
+    Parameters
+        - `baseline`
+            - `dict`
+            - reference results
+        - `current`
+            - `dict`
+            - results to check for regressions
+        - `threshold`
+            - `float`, optional
+            - maximum tolerated relative change for the worse
+            - the default is `0.2`
+
+    Returns
+        - `regressions`
+            - `List[str]`
+            - description of every metric that regressed by more than `threshold`
+    """
+    if baseline["meta"]["params"] != current["meta"]["params"]:
+        print(f"warning: parameters differ ({baseline['meta']['params']} vs. {current['meta']['params']})")
+
+    regressions = []
+    for name, cur in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            print(f"{name:22s} not in baseline")
+            continue
+        metrics = [
+            #name, baseline, current, whether higher is better
+            ("throughput",   base["throughput"],         cur["throughput"],          True),
+            ("latency p50",  base["latency_ms"]["p50"],  cur["latency_ms"]["p50"],   False),
+            ("latency p99",  base["latency_ms"]["p99"],  cur["latency_ms"]["p99"],   False),
+            ("peak RSS",     base["peak_rss_mib"],       cur["peak_rss_mib"],        False),
+        ]
+        for metric, b, c, higher_is_better in metrics:
+            change = (c - b) / b if b != 0 else 0.0
+            worse = -change if higher_is_better else change
+            flag = "REGRESSION" if worse > threshold else ""
+            print(f"{name:22s} {metric:12s} {b:12.2f} -> {c:12.2f} ({change:+7.1%}) {flag}")
+            if flag: regressions.append(f"{name}: {metric} {b:.2f} -> {c:.2f} ({change:+.1%})")
+
+    return regressions
+
+#%%main
+def main():
+    parser = argparse.ArgumentParser(
+    )
+    parser.add_argument(
+        "--cases",
+        type=str,
+        nargs="+",
+        choices=list(CASES.keys()),
+        default=None,
+        required=False,
+        help="cases to run. all cases if omitted"
+    )
+    parser.add_argument(
+        "--nfiles",
+        type=int,
+        default=2,
+        required=False,
+        help="number of synthetic alert packages"
+    )
+    parser.add_argument(
+        "--nalerts",
+        type=int,
+        default=500,
+        required=False,
+        help="number of alerts per alert package"
+    )
+    parser.add_argument(
+        "--npix",
+        type=int,
+        default=30,
+        required=False,
+        help="side length of the cutouts"
+    )
+    parser.add_argument(
+        "--chunklen",
+        type=int,
+        default=100,
+        required=False,
+        help="number of objects per written chunk"
+    )
+    parser.add_argument(
+        "--format",
+        type=str,
+        choices=["json", "binary"],
+        default="json",
+        required=False,
+        help="format of the written chunks"
+    )
+    parser.add_argument(
+        "--njobs",
+        type=int,
+        default=1,
+        required=False,
+        help="number of parallel jobs in `compile_files` (workers in `stream_pipeline`)"
+    )
+    parser.add_argument(
+        "--nrep",
+        type=int,
+        default=3,
+        required=False,
+        help="number of repetitions of every case"
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        required=False,
+        help="seed of the synthetic data"
+    )
+    parser.add_argument(
+        "--save",
+        type=str,
+        default=None,
+        required=False,
+        help="json file to save the results to"
+    )
+    parser.add_argument(
+        "--compare",
+        type=str,
+        nargs=2,
+        default=None,
+        required=False,
+        help="compare two results files (baseline, current) instead of running the benchmark"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        required=False,
+        help="maximum tolerated relative change for the worse in `--compare`"
+    )
+    args=vars(parser.parse_args())
+
+    if args["compare"] is not None:
+        with open(args["compare"][0], "r") as f: baseline = json.load(f)
+        with open(args["compare"][1], "r") as f: current = json.load(f)
+        regressions = compare(baseline, current, threshold=args["threshold"])
+        if len(regressions) > 0:
+            print(f"{len(regressions)} regressions:\n    " + "\n    ".join(regressions))
+            sys.exit(1)
+        return
+
+    results = run(
+        cases=args["cases"],
+        nfiles=args["nfiles"], nalerts=args["nalerts"], npix=args["npix"],
+        chunklen=args["chunklen"], fmt=args["format"], njobs=args["njobs"],
+        nrep=args["nrep"], seed=args["seed"],
+    )
+    if args["save"] is not None:
+        with open(args["save"], "w") as f:
+            json.dump(results, f, indent=2)
+
+    return
+
+if __name__ == "__main__":
+    main()
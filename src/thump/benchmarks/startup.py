@@ -0,0 +1,115 @@
+"""startup-time budget of the `ThumP!` commands
+
+- measures the wall time of `python3 -m thump SUBCOMMAND --help` for every subcommand (see `thump.commands.dispatch`)
+    - in a fresh interpreter, i.e., including all imports of the subcommand
+    - the best of `--nrep` runs is reported
+    - the startup time of the bare interpreter is reported for reference
+- subcommands used in cron-driven jobs and interactively have a budget (`BUDGETS`)
+    - exits with a non-zero status if any of them exceeds its budget
+    - i.e., if a heavy dependency got imported at module level again
+
+Usage
+```bash
+    python3 -m thump.benchmarks.startup [--subcommands SUBCOMMAND [SUBCOMMAND ...]] [--nrep NREP]
+```
+
+"""
+
+#%%imports
+import argparse
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+from thump.commands import dispatch as thcd
+
+#%%definitions
+BUDGETS = {     #subcommand -> maximum startup time in seconds
+    "concat_output":    0.5,
+    "remove_inspected": 0.5,
+    "query":            0.5,
+    "mag2absmag":       0.5,
+}
+
+def startup_time(cmd:List[str], nrep:int=5) -> float:
+    """best wall time of `nrep` runs of `cmd` in seconds"""
+    runtimes = []
+    for _ in range(nrep):
+        start = time.perf_counter()
+        subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        runtimes.append(time.perf_counter() - start)
+    return min(runtimes)
+
+def run(subcommands:List[str]=None, nrep:int=5) -> Dict[str,float]:
+    """runs the benchmark
+
+    Parameters
+        - `subcommands`
+            - `List[str]`, optional
+            - subcommands to measure
+            - the default is `None`
+                - all subcommands in `thump.commands.dispatch.SUBCOMMANDS`
+        - `nrep`
+            - `int`, optional
+            - number of repetitions
+            - the best repetition is reported
+            - the default is `5`
+
+    Returns
+        - `results`
+            - `Dict[str,float]`
+            - best startup time in seconds for every subcommand
+            - contains `interpreter` (bare interpreter) and `failed` (number of subcommands exceeding their budget or failing to start although budgeted)
+    """
+    if subcommands is None: subcommands = list(thcd.SUBCOMMANDS.keys())
+
+    results = dict(interpreter=startup_time([sys.executable, "-c", "pass"], nrep))
+    print(f"{'interpreter':30s} {results['interpreter']*1e3:8.1f} ms")
+    failed = 0
+    for sub in subcommands:
+        try:
+            results[sub] = startup_time([sys.executable, "-m", "thump", sub, "--help"], nrep)
+        except subprocess.CalledProcessError:
+            #a budgeted subcommand that can not even start exceeds its budget
+            failed += (sub in BUDGETS)
+            print(f"{sub:30s}   failed (missing dependency?)" + (", EXCEEDED budget" if sub in BUDGETS else ""))
+            continue
+        budget = BUDGETS.get(sub)
+        over = (budget is not None) and (results[sub] > budget)
+        failed += over
+        print(f"{sub:30s} {results[sub]*1e3:8.1f} ms" + ("" if budget is None else f" (budget {budget*1e3:.0f} ms{', EXCEEDED' if over else ''})"))
+    results["failed"] = failed
+
+    return results
+
+#%%main
+def main():
+    parser = argparse.ArgumentParser(
+    )
+    parser.add_argument(
+        "--subcommands",
+        type=str,
+        nargs="+",
+        choices=list(thcd.SUBCOMMANDS.keys()),
+        default=None,
+        required=False,
+        help="subcommands to measure. all if omitted"
+    )
+    parser.add_argument(
+        "--nrep",
+        type=int,
+        default=5,
+        required=False,
+        help="number of repetitions"
+    )
+    args=vars(parser.parse_args())
+
+    results = run(**args)
+    if results["failed"] > 0:
+        sys.exit(1)
+
+    return
+
+if __name__ == "__main__":
+    main()
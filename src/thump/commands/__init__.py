@@ -1,5 +1,7 @@
 """module hosting scripts for CLI
 
+- every script can also be run as `thump SUBCOMMAND` (see `dispatch`)
+
 Exceptions
 
 Classes
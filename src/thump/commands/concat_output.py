@@ -1,11 +1,16 @@
-"""combines all `ThumP!` output files in `dir` into a single csv
+"""combines all `ThumP!` output files in `dir` into a single table
 
 - finds all files matching `thump_*.csv` in `dir`
-- saves them to `--save`
+    - including gzip or zstd compressed ones (`thump_*.csv.gz`, `thump_*.csv.zst`)
+- appends new ones to a parquet dataset partitioned by date or session (`--dataset`, see `thump.data.verdicts`)
+    - output files ingested by a previous run are not read again
+    - sessions with different auxiliary columns are unified
+- keeps only the latest verdict of every object
+- saves them to `--save` (csv, or parquet if it ends with `.parquet`)
 
 Usage
 ```bash
-    thump_concat_output dir [--save FILENAME.csv]
+    thump_concat_output dir [--save FILENAME.csv] [--dataset DIRECTORY] [--partition {date,session}]
 ```
 
 """
@@ -32,7 +37,22 @@ def main():
         type=str,
         default=False,
         required=False,
-        help="file to save result to"
+        help="file to save result to. written as parquet if it ends with `.parquet` and as csv otherwise"
+    )
+    parser.add_argument(
+        "--dataset",
+        type=str,
+        default=None,
+        required=False,
+        help="directory of the parquet dataset output files get appended to. defaults to `<dir>thump_verdicts/`"
+    )
+    parser.add_argument(
+        "--partition",
+        type=str,
+        choices=["date", "session"],
+        default="date",
+        required=False,
+        help="how to partition the parquet dataset"
     )
 
     args=vars(parser.parse_args())
@@ -0,0 +1,60 @@
+"""single entry point for all `ThumP!` commands
+
+- `thump SUBCOMMAND [ARGS ...]` runs `thump.commands.SUBCOMMAND.main()` with `ARGS`
+    - i.e., `thump concat_output dir --save verdicts.parquet` is equivalent to `thump_concat_output dir --save verdicts.parquet`
+- only the module of the requested subcommand is imported
+    - heavy dependencies (i.e., `fink_client`, `astropy`, `joblib`) are only imported by the subcommands that need them
+    - `thump --help` lists all subcommands without importing any of them
+- see `python3 -m thump.benchmarks.startup` for the startup time of every subcommand
+
+Usage
+```bash
+    thump SUBCOMMAND [ARGS ...]
+    thump SUBCOMMAND --help
+```
+
+"""
+
+#%%imports
+import argparse
+import importlib
+import sys
+from typing import List
+
+#%%definitions
+SUBCOMMANDS = {     #module in `thump.commands` -> description
+    "concat_output":                "combine `ThumP!` output files into a single table (latest verdict per object)",
+    "remove_inspected":             "remove fully inspected `ThumP!` input files",
+    "query":                        "join reviewer verdicts to alert packages downloaded via datatransfer",
+    "mag2absmag":                   "convert apparent to absolute magnitudes",
+    "make_examples":                "generate example files and synthetic alert packages",
+    "fink_from_datatransfer_lsst":  "reformat alert packages downloaded via datatransfer to `ThumP!` files",
+    "fink_stream_alerts_lsst":      "listen to the fink stream and reformat alerts to `ThumP!` files",
+}
+
+#%%main
+def main(argv:List[str]=None):
+    argv = sys.argv[1:] if argv is None else argv
+    parser = argparse.ArgumentParser(
+        prog="thump",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="subcommands:\n" + "\n".join(f"  {k:30s}{v}" for k, v in SUBCOMMANDS.items()),
+    )
+    parser.add_argument(
+        "subcommand",
+        type=str,
+        choices=list(SUBCOMMANDS.keys()),
+        metavar="SUBCOMMAND",
+        help="command to run. `thump SUBCOMMAND --help` shows its arguments"
+    )
+    #only parse the subcommand, everything after it is parsed by the subcommand itself
+    args = vars(parser.parse_args(argv[:1]))
+
+    module = importlib.import_module(f"thump.commands.{args['subcommand']}")
+    sys.argv = [f"thump {args['subcommand']}", *argv[1:]]
+    module.main()
+
+    return
+
+if __name__ == "__main__":
+    main()
@@ -3,13 +3,26 @@
 - only designed for lsst alerts
 - finds all files matching `pat`
 - reformats them according to `ThumP!` schema
+- setting `--incremental` only processes files that are new or changed since the last run
+    - processed files are recorded in `<save>manifest.json`
+    - chunk numbering continues where the last run stopped
+- setting `--group_radius` writes repeat detections of the same position next to each other (and into the same chunk where possible)
+- setting `--format binary` writes binary containers (`.thump`, see `thump.data.container`) instead of json files
+- setting `--compression` writes gzip or zstd compressed files (see `thump.data.compression`)
+- thumbnails can be cropped (`--crop`), downsampled (`--downsample`) and quantized (`--bits`) to trade fidelity for file size
+- setting `--limits` precomputes robust display limits of every thumbnail (stored in `thumbnailLimits`)
 
 Usage
 ```bash
     thump_from_fink_datatransfer \
         pat [--save DIRECTORY] \
-        [--chunklen CHUNKLEN] [--chunk_start CHUNK_START] [--nchunks NCHUNKS] \
-        [--njobs NJOBS]
+        [--chunklen CHUNKLEN] [--chunk_start CHUNK_START] [--nchunks NCHUNKS] [--group_radius GROUP_RADIUS] \
+        [--incremental INCREMENTAL] [--checksum CHECKSUM] \
+        [--njobs NJOBS] [--batch_size BATCH_SIZE] [--max_bytes MAX_BYTES] \
+        [--decimals DECIMALS] [--layout {pretty,compact}] [--format {json,binary}] [--dtype {int16,float32}] \
+        [--crop CROP] [--downsample DOWNSAMPLE] [--bits {8,16}] \
+        [--limits {none,percentile,zscale}] [--percentiles LOWER UPPER] \
+        [--compression {none,gzip,zstd}]
 ```
 
 """
@@ -20,6 +33,8 @@ import glob
 import os
 os.environ["POLARS_MAX_THREADS"] = "1"  #to allow parallelization over chunks
 
+from thump.data import preprocessing as thpp
+from thump.fink_lsst import manifest as thmf
 from thump.fink_lsst import process_data as thpd
 
 
@@ -61,6 +76,29 @@ def main():
         required=False,
         help="number of chunks to process, starting from --chunk_start. used to process subset. `None` denotes processing all chunks until the end."
     )
+    parser.add_argument(
+        "--group_radius",
+        type=float,
+        default=None,
+        required=False,
+        help="linking length in arcsec. if set, alerts are grouped by position (friends-of-friends) and ordered and chunked by group, i.e., repeat detections end up next to each other. alerts are chunked in the order they are stored in if omitted"
+    )
+    parser.add_argument(
+        "--incremental",
+        type=lambda v: True if v.lower() == "true" else False,
+        nargs="?",
+        default=False,
+        required=False,
+        help="whether to only process files that are not yet recorded in `<save>manifest.json` (or changed since). chunk numbering continues after the last recorded chunk and `--chunk_start` is relative to it"
+    )
+    parser.add_argument(
+        "--checksum",
+        type=lambda v: True if v.lower() == "true" else False,
+        nargs="?",
+        default=False,
+        required=False,
+        help="whether to detect changed files via their sha256 hash in addition to size and modification time. only used if `--incremental` is set"
+    )
     parser.add_argument(
         "--njobs",
         type=int,
@@ -68,6 +106,97 @@ def main():
         required=False,
         help="number of jobs to use for parallel processing chunks. -1 denotes all available cores"
     )
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=256,
+        required=False,
+        help="maximum number of alerts read from the parquet files and decoded at once"
+    )
+    parser.add_argument(
+        "--max_bytes",
+        type=int,
+        default=None,
+        required=False,
+        help="maximum size (uncompressed, in bytes) of the batches read from the parquet files. only bounded by `--batch_size` if omitted"
+    )
+    parser.add_argument(
+        "--decimals",
+        type=int,
+        default=1,
+        required=False,
+        help="number of decimals to write for thumbnails"
+    )
+    parser.add_argument(
+        "--layout",
+        type=str,
+        choices=["pretty", "compact"],
+        default="pretty",
+        required=False,
+        help="layout of the written json files. `pretty` writes every thumbnail row on its own line. `compact` omits all whitespace"
+    )
+    parser.add_argument(
+        "--format",
+        type=str,
+        choices=["json", "binary"],
+        default="json",
+        required=False,
+        help="format of the written files. `binary` writes `.thump` containers (typed arrays and a json header) that are much smaller and faster to load in the browser"
+    )
+    parser.add_argument(
+        "--dtype",
+        type=str,
+        choices=["int16", "float32"],
+        default="int16",
+        required=False,
+        help="storage type of the thumbnails in binary containers. `int16` stores values scaled by `10**--decimals` in the smallest integer type that fits (uint8, int16, uint16) and falls back to `float32` for thumbnails that do not fit"
+    )
+    parser.add_argument(
+        "--crop",
+        type=int,
+        default=None,
+        required=False,
+        help="side length (in pixels) to center crop thumbnails to. not cropped if omitted"
+    )
+    parser.add_argument(
+        "--downsample",
+        type=int,
+        default=1,
+        required=False,
+        help="downsampling factor. thumbnails are averaged over blocks of `--downsample`x`--downsample` pixels (after cropping)"
+    )
+    parser.add_argument(
+        "--bits",
+        type=int,
+        choices=[8, 16],
+        default=None,
+        required=False,
+        help="number of bits to quantize thumbnails to. scale and offset are stored per thumbnail and undone when loading the files. `--decimals` is ignored for quantized thumbnails. not quantized if omitted"
+    )
+    parser.add_argument(
+        "--limits",
+        type=str,
+        choices=["none", "percentile", "zscale"],
+        default="none",
+        required=False,
+        help="method to precompute robust display limits of every thumbnail with. stored in `thumbnailLimits` and used by the mosaic unless `zmin`/`zmax` are set. computed after cropping and downsampling but before quantization"
+    )
+    parser.add_argument(
+        "--percentiles",
+        type=float,
+        nargs=2,
+        default=[1.0, 99.0],
+        required=False,
+        help="lower and upper percentile used as display limits if `--limits percentile`"
+    )
+    parser.add_argument(
+        "--compression",
+        type=str,
+        choices=["none", "gzip", "zstd"],
+        default="none",
+        required=False,
+        help="compression of the written files. files are compressed while being written and get the suffix `.gz` or `.zst`. gzip files are decompressed natively by the browser. zstd requires `zstandard`"
+    )
     args=vars(parser.parse_args())
 
     #create `./data/` if it does not exist and is requested
@@ -76,8 +205,16 @@ def main():
 
     #"./data/*/*.parquet"
     fnames = sorted(glob.glob(args["pat"]))
-    df = thpd.read_files(fnames)
-    thpd.compile_files(df, chunklen=args["chunklen"], chunk_start=args["chunk_start"], nchunks=args["nchunks"], save_dir=args["save"], n_jobs=args["njobs"])
+    manifest = thmf.Manifest(f"{args['save']}manifest.json", checksum=args["checksum"]) if args["incremental"] else None
+    thpd.compile_files(fnames, chunklen=args["chunklen"], chunk_start=args["chunk_start"], nchunks=args["nchunks"], save_dir=args["save"], n_jobs=args["njobs"],
+        decimals=args["decimals"], indent=2 if args["layout"] == "pretty" else None,
+        batch_size=args["batch_size"], max_bytes=args["max_bytes"],
+        group_radius=args["group_radius"],
+        manifest=manifest,
+        fmt=args["format"], dtype=args["dtype"],
+        preprocess=thpp.ThumbnailPreprocessor(crop=args["crop"], factor=args["downsample"], bits=args["bits"], limits=None if args["limits"] == "none" else args["limits"], percentiles=args["percentiles"]),
+        compression=None if args["compression"] == "none" else args["compression"],
+    )
     
     return
 
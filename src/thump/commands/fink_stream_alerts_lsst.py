@@ -4,37 +4,57 @@
 - listens to the stream and extracts
 - reformats extracted data according to `ThumP!` schema
 - setting `--pat` will simulate a stream from files extracted via datatransfer
+    - alerts are replayed following the rate profile set via `--replay_*`
+- chunks are written atomically
+    - with `--checkpoint` (the default) kafka offsets are only committed once the alerts are durable (written to a chunk or the spill log)
+        - `--checkpoint false` restores auto-committing offsets upon consumption
+    - `SIGTERM` (i.e., the SLURM time limit being reached) flushes the partial chunk before exiting
+- setting `--format binary` writes binary containers (`.thump`, see `thump.data.container`) instead of json files
+- setting `--compression` writes gzip or zstd compressed files (see `thump.data.compression`)
+- thumbnails can be cropped (`--crop`), downsampled (`--downsample`) and quantized (`--bits`) to trade fidelity for file size
+- setting `--limits` precomputes robust display limits of every thumbnail (stored in `thumbnailLimits`)
+- setting `--adaptive` adapts the number of alerts and the timeout of every poll to the current load
 
 Usage
 ```bash
     thump_fink_stream_lsst \
         [--pat PATTERN] \
+        [--replay_profile {constant,burst,night}] [--replay_rate REPLAY_RATE] \
+        [--replay_burstsize REPLAY_BURSTSIZE] [--replay_speedup REPLAY_SPEEDUP] [--replay_loop REPLAY_LOOP] [--replay_shuffle REPLAY_SHUFFLE] [--seed SEED] \
         [--save DIRECTORY] \
-        [--chunklen CHUNKLEN] [--reformat_every REFORMAT_EVERY] \
-        [--njobs NJOBS] [--max_timeout MAX_TIMEOUT]
+        [--chunklen CHUNKLEN] [--reformat_every REFORMAT_EVERY] [--spill SPILL] \
+        [--decimals DECIMALS] [--layout {pretty,compact}] [--format {json,binary}] [--dtype {int16,float32}] \
+        [--crop CROP] [--downsample DOWNSAMPLE] [--bits {8,16}] [--limits {none,percentile,zscale}] [--percentiles LOWER UPPER] \
+        [--compression {none,gzip,zstd}] \
+        [--njobs NJOBS] [--max_timeout MAX_TIMEOUT] [--decoder {thread,process}] \
+        [--checkpoint CHECKPOINT] \
+        [--adaptive ADAPTIVE] [--minalerts MINALERTS] [--mintimeout MINTIMEOUT] [--target_latency TARGET_LATENCY] \
+        [--runtime {joblib,pipeline}] [--nconsumers NCONSUMERS] [--nwriters NWRITERS] [--queuesize QUEUESIZE] \
+        [--metrics_prom FILENAME.prom] [--metrics_jsonl FILENAME.jsonl] [--metrics_interval METRICS_INTERVAL]
 ```
 
 """
 
 #%%imports
 import argparse
-from astropy.io import fits
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
 from datetime import timedelta
-from fink_client.consumer import AlertConsumer
-from fink_client.configuration import load_credentials
-from fink_broker.rubin import decoding_utils as fink_du
 import glob
-from io import BytesIO
-import json
-from joblib.parallel import Parallel, delayed
 import logging
-import numpy as np
-import polars as pl
 import os
-import sys
+import signal
 import time
-from typing import Any, List, Tuple
+from typing import Any, Callable, List, Tuple
+
+from thump.data import preprocessing as thpp
+from thump.fink_lsst import accumulator as thac
+from thump.fink_lsst import batching as thba
+from thump.fink_lsst import checkpoint as thcp
+from thump.fink_lsst import decoding as thdc
+from thump.fink_lsst import metrics as thmt
+from thump.fink_lsst import pipeline as thpl
+from thump.fink_lsst import replay as thrp
 
 os.environ["POLARS_MAX_THREADS"] = "1"  #to allow parallelization over chunks
 
@@ -42,130 +62,19 @@ logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO, force=True)
 
 #%%definitions
-def simulate_alert_stream(fnames:List[str],
-    ) -> Tuple[str,pl.LazyFrame,str]:
-    """simulates a single alert arriving
-
-    - simulates an alert arriving by drawing from a set of downloaded alerts (defined via `pat`)
-
-    Parameters
-        - `fnames`
-            - `List[str]`
-            - list of files to use for drawing alerts from
-
-    Returns
-        - `topic`
-            - `str`
-            - subscribed topic
-            - `None` if no alert was retrieved
-        - `alert`
-            - `dict`
-            - alert that got emitted
-            - `None` if no alert was retrieved
-        - `key`
-            - `dict`
-            - alert schema
-            - ignored here
-            - `None` if no alert was retrieved
-    """
-
-    #alerts found
-    f = np.random.choice(fnames)    #choose random file
-    alert = pl.scan_parquet(f)
-    nalerts = alert.select(alert.collect_schema().names()[0]).collect().height
-    alert = alert.slice(np.random.randint(0, nalerts), 1)   #select single alert to emit
-
-    topic = "testing"
-    alert = alert.collect().to_dicts()[0]    #generate a single alert
-
-    key = dict(comment="testing")
-
-    return topic, alert, key
-
-def process_single_alert(
-    alert:List[Any],
-    save_dir:str=None,
-    ):
-    """processes and a single alert and saves it as `ThumP!` format
-
-    Parameters
-        - `alert`
-            - `List[Any]`
-            - single alert to be processed
-        - `save_dir`
-            - `str`, optional
-            - directory to save processed alerts to
-            - the default is `None`
-                - not saved
-    """
-    topic, alert, key = alert
-
-    start = datetime.now()
-
-    #select/preprocess cutouts
-    hdul = fits.open(BytesIO(alert["cutoutScience"]))
-    science = np.round(hdul[0].data, 1)
-    science = np.where(np.isnan(science), None, science)    #NaN is not supported in json
-    hdul.close()
-    hdul = fits.open(BytesIO(alert["cutoutTemplate"]))
-    template = np.round(hdul[0].data, 1)
-    template = np.where(np.isnan(template), None, template) #NaN is not supported in json
-    hdul.close()
-    hdul = fits.open(BytesIO(alert["cutoutDifference"]))
-    difference = np.round(hdul[0].data, 1)
-    difference = np.where(np.isnan(difference), None, difference)   #NaN is not supported in json
-    hdul.close()
-
-    #compile file
-    data_json = {
-        alert['diaSource']['diaSourceId']: dict(
-            link=f"https://lsst.fink-portal.org/{alert['diaObject']['diaObjectId']}",
-            thumbnailTypes=[
-                "science",
-                "template",
-                "differece",
-            ],
-            thumbnails=[
-                science.tolist(),
-                template.tolist(),
-                difference.tolist(),
-            ],
-            diaObjectId=str(alert["diaObject"]["diaObjectId"]),
-            diaSourceId=str(alert["diaSource"]["diaSourceId"]),
-            midpointMjdTai=np.round(alert["diaSource"]["midpointMjdTai"], decimals=4),
-            ra=np.round(alert["diaObject"]["ra"], decimals=7) if alert["diaObject"]["ra"] is not None else None,
-            dec=np.round(alert["diaObject"]["dec"], decimals=7) if alert["diaObject"]["dec"] is not None else None,
-            comment="",
-        )
-    }
-
-    if isinstance(save_dir, str):
-        with open(f"{save_dir}processed_{datetime.now()}.json", "w") as f:
-            json.dump(data_json, f, indent=2)
-    else:
-        logger.info("process_single_alert(): alert received but not saved because `--save` is unset or `False`")
-
-    logger.info(f"process_single_alert(): runtime alert processing: {datetime.now() - start}")
-    return
-
 def consume_alerts(
     consumer,
     maxtimeout:int=-1,
     maxalerts:int=1,
-    files:List[str]=None,
-    simulate_alert_stream_kwargs:dict=None,
     ) -> Tuple[List[List[Any]], bool]:
     """consumes a batch of alerts
 
-    - function to poll the database for a batch of alerts
+    - function to poll the servers (or the replay of a simulated stream) for a batch of alerts
 
     Parameters
-        - `myconfig`
-            - `dict`
-            - confgurationt of the server
-        - `topics`
-            - `list`
-            - topics to listen to
+        - `consumer`
+            - `AlertConsumer`, `CheckpointedConsumer`, `ReplaySource`
+            - consumer as returned by `setup_stream()`
         - `maxtimeout`
             - `int`
             - maximum amount of time to wait until returning
@@ -173,14 +82,6 @@ def consume_alerts(
             - `int`, optional
             - maximum number of alerts to retrieve in one poll
             - the default is `-1`
-        - `files`
-            - `List[str]`
-            - list of files to use for drawing alerts from
-        - `simulate_alert_stream_kwargs`
-            - `dict`, optional
-            - additional kwargs to pass to `simulate_alert_stream()`
-            - the default is `None`
-                - set to `dict()`
 
     Returns
         - `alerts`
@@ -190,31 +91,13 @@ def consume_alerts(
             - `bool`
             - whether an alert was retrieved or not
     """
-    if simulate_alert_stream_kwargs is None: simulate_alert_stream_kwargs = dict()
-
-    if files is not None:
-        logger.info("consume_alerts(): simulated stream")
-        #simulated alert stream
-        alerts = []
-        alerts_exist = np.random.choice([0,1], p=[0.3,0.7]).astype(bool)
-        if not alerts_exist:
-            #no alerts generated
-            time.sleep(maxtimeout * (maxtimeout != -1))
-        else:
-            #generate alerts
-            for i in range(0, np.random.randint(maxalerts)):
-                topic, alert, key = simulate_alert_stream(files, **simulate_alert_stream_kwargs)
-                alerts.append([topic, alert, key])
-            time.sleep(maxtimeout * (maxtimeout != -1)) #simulate timeout
-    else:
-        start = datetime.now()
-        logger.info("consume_alerts(): polling servers")
-        #actual alerts
+    start = datetime.now()
+    logger.info("consume_alerts(): polling servers")
 
-        #poll the servers
-        alerts = consumer.consume(num_alerts=maxalerts, timeout=maxtimeout)
+    #poll the servers
+    alerts = consumer.consume(num_alerts=maxalerts, timeout=maxtimeout)
 
-        logger.info(f"consume_alerts(consuming alerts): {datetime.now()-start}")
+    logger.info(f"consume_alerts(consuming alerts): {datetime.now()-start}")
 
     logger.info(f"consume_alerts(): extracted {len(alerts)} alerts")
 
@@ -223,70 +106,47 @@ def consume_alerts(
 
     return alerts, state
 
-def reformat_processed(
-    save_dir:str,
-    chunklen:int,
-    ):
-    """reformats processed alerts (.json files)
+#%%frameworks
+def setup_stream(args) -> "AlertConsumer":
+    """sets up everything needed to listen to the stream
 
-    - reformats processed alerts (.json files) such that each reformatted file contains `chunklen` objects
+    - creates the output directory if requested
+    - instantiates the consumer
+        - `thump.fink_lsst.replay.ReplaySource` replaying files matching `--pat` for simulated streams
+        - `AlertConsumer` connected to the fink servers otherwise
 
     Parameters
-        - `save_dir`
-            - `str`
-            - directory containing processed alerts
-            - also used to save reformatted alerts to
-        - `chunklen`
-            - `int`
-            - desired length for each chunk in the reformatted files
+        - `args`
+            - `dict`
+            - parsed command line arguments
 
     Returns
-    """
-
-    fnames = sorted(glob.glob(f"{save_dir}processed*.json"))
-    if len(fnames) < chunklen:
-        #nothing to process
-        return
-    else:
-        #merge into one file (every file contains one object)
-
-        ##load pieces
-        fnames = fnames[0:chunklen]
-        objs = {}
-        for fn in fnames:
-            with open(fn, "r") as f:
-                objs = {**objs, **json.load(f)}
-        ##save as reformatted
-        fnames_reformatted = glob.glob(f"{save_dir}reformatted*.json")  #reformatted files
-        with open(f"{save_dir}reformatted_{len(fnames_reformatted)+1:04d}.json", "w") as f:
-            json.dump(objs, f, indent=2)
-
-        #delete formatted alerts
-        for fn in fnames:
-            # logger.info(f"removing {fn}")
-            os.remove(fn)
-    return
-
-#%%frameworks
-def run_joblib(args):
-    """run stream using joblib
+        - `consumer`
+            - `AlertConsumer`, `CheckpointedConsumer`, `ReplaySource`
+            - consumer to poll alerts from
+            - `thump.fink_lsst.checkpoint.CheckpointedConsumer` if `--checkpoint` is set
     """
     #create `./data/` if it does not exist and is requested
     if not os.path.isdir("data/fink_stream/") and ("data/fink_stream" in args["save"]):
         os.makedirs("./data/fink_stream/")
 
-    #global configs
-    if args["pat"] is None:
-        #stream real alerts
-        fnames = None
-    else:
+    if args["pat"] is not None:
         #artificial alerts
         if not args["pat"].endswith(".parquet"):
             raise ValueError("`--pat` has to end with `.parquet`")
-        fnames = sorted(glob.glob(args["pat"]))
+        consumer = thrp.ReplaySource(sorted(glob.glob(args["pat"])),
+            profile=args["replay_profile"],
+            rate=args["replay_rate"],
+            burstsize=args["replay_burstsize"],
+            speedup=args["replay_speedup"],
+            shuffle=args["replay_shuffle"],
+            loop=args["replay_loop"],
+            seed=args["seed"],
+        )
+        return consumer
 
-    #saving
-    save_dir = args["save"]
+    from fink_client.configuration import load_credentials
+    from fink_client.consumer import AlertConsumer
 
     #fink configs
     creds = load_credentials(survey="lsst")  #fink credentials
@@ -296,12 +156,225 @@ def run_joblib(args):
     }
 
     #instantiate a consumer
-    consumer = AlertConsumer(creds["mytopics"], myconfig, "lsst")
+    if args["checkpoint"]:
+        consumer = thcp.CheckpointedConsumer(creds["mytopics"], myconfig, "lsst")
+    else:
+        consumer = AlertConsumer(creds["mytopics"], myconfig, "lsst")
 
     #adjust poll starting date
+    # from fink_broker.rubin import decoding_utils as fink_du
     # fink_du.reset_offsets(consumer, "2026-01-20", creds["mytopics"], timeout=90, verbose=False)
 
+    return consumer
+
+def setup_metrics(args) -> Tuple[thmt.Metrics,thmt.MetricsExporter]:
+    """sets up metrics and their periodic export
+
+    Parameters
+        - `args`
+            - `dict`
+            - parsed command line arguments
+
+    Returns
+        - `metrics`
+            - `thump.fink_lsst.metrics.Metrics`
+            - registry to record metrics in
+            - `None` if neither `--metrics_prom` nor `--metrics_jsonl` is set
+        - `exporter`
+            - `thump.fink_lsst.metrics.MetricsExporter`
+            - exporter of `metrics` (already started)
+            - `None` if neither `--metrics_prom` nor `--metrics_jsonl` is set
+    """
+    if (args["metrics_prom"] is None) and (args["metrics_jsonl"] is None):
+        return None, None
+    metrics = thmt.Metrics()
+    exporter = thmt.MetricsExporter(metrics, prom_path=args["metrics_prom"], jsonl_path=args["metrics_jsonl"], interval=args["metrics_interval"])
+    exporter.start()
+    return metrics, exporter
+
+def setup_batcher(args,
+    parallelism:int=1,
+    free=None,
+    stopped=None,
+    metrics:thmt.Metrics=None,
+    ) -> thba.AdaptiveBatcher:
+    """sets up the controller adapting `maxalerts` and `maxtimeout` of every poll
+
+    Parameters
+        - `args`
+            - `dict`
+            - parsed command line arguments
+        - `parallelism`
+            - `int`, optional
+            - number of alerts processed concurrently
+            - the default is `1`
+        - `free`
+            - `Callable[[], int]`, optional
+            - number of alerts downstream can take without blocking
+            - at most `--queuesize`
+            - the default is `None`
+        - `stopped`
+            - `Callable[[], bool]`, optional
+            - whether a shutdown was requested
+            - the default is `None`
+        - `metrics`
+            - `thump.fink_lsst.metrics.Metrics`, optional
+            - registry to record metrics in
+            - the default is `None`
+
+    Raises
+        - `ValueError`
+            - if `free` is set and `--minalerts` exceeds a bounded `--queuesize`
+                - polling would pause forever
+
+    Returns
+        - `batcher`
+            - `thump.fink_lsst.batching.AdaptiveBatcher`
+            - controller to query `maxalerts` and `maxtimeout` from
+            - `None` if `--adaptive` is not set
+                - `--maxalerts` and `--maxtimeout` are used for every poll
+    """
+    if not args["adaptive"]:
+        return None
+    capacity = args["queuesize"] if (free is not None) and (args["queuesize"] > 0) else None
+    if (capacity is not None) and (args["minalerts"] > capacity):
+        raise ValueError(f"`--minalerts` has to be smaller or equal to `--queuesize` but they are {args['minalerts']} and {args['queuesize']}")
+    return thba.AdaptiveBatcher(
+        min_alerts=args["minalerts"], max_alerts=args["maxalerts"],
+        min_timeout=args["mintimeout"], max_timeout=args["maxtimeout"],
+        target_latency=args["target_latency"],
+        parallelism=parallelism,
+        free=free,
+        capacity=capacity,
+        stopped=stopped,
+        metrics=metrics,
+    )
+
+def setup_checkpointing(consumer) -> Callable[[List[str]], None]:
+    """sets up checkpointing of the stream
+
+    - `SIGTERM` is handled like `KeyboardInterrupt` (i.e., for SLURM reaching `--time`)
+
+    Parameters
+        - `consumer`
+            - `AlertConsumer`, `CheckpointedConsumer`, `ReplaySource`
+            - consumer as returned by `setup_stream()`
+
+    Returns
+        - `done`
+            - `Callable[[List[str]], None]`
+            - to be called with the keys of alerts (see `thump.fink_lsst.checkpoint.alert_key()`) that are durable or got discarded
+            - no-op unless `consumer` is a `thump.fink_lsst.checkpoint.CheckpointedConsumer`
+    """
+    def on_sigterm(signum, frame):
+        logger.info("received SIGTERM... shutting down")
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, on_sigterm)
+
+    if isinstance(consumer, thcp.CheckpointedConsumer):
+        return consumer.done
+    return lambda keys: None
+
+def setup_accumulator(args,
+    save_dir:str,
+    metrics:thmt.Metrics=None,
+    done:Callable[[List[str]], None]=None,
+    ) -> thac.ChunkAccumulator:
+    """sets up the in-memory chunks alerts are collected in before being written
+
+    Parameters
+        - `args`
+            - `dict`
+            - parsed command line arguments
+        - `save_dir`
+            - `str`
+            - directory to save the chunks to
+            - nothing is saved if not a `str`
+        - `metrics`
+            - `thump.fink_lsst.metrics.Metrics`, optional
+            - registry to record metrics in
+            - the default is `None`
+        - `done`
+            - `Callable[[List[str]], None]`, optional
+            - called with the keys of alerts once they are durable (see `setup_checkpointing()`)
+            - the default is `None`
+
+    Returns
+        - `accumulator`
+            - `thump.fink_lsst.accumulator.ChunkAccumulator`
+            - accumulator to add decoded alerts to
+            - `None` if `save_dir` is not a `str`
+    """
+    if not isinstance(save_dir, str):
+        return None
+    return thac.ChunkAccumulator(save_dir,
+        chunklen=args["chunklen"],
+        spill=args["spill"],
+        decimals=args["decimals"],
+        indent=2 if args["layout"] == "pretty" else None,
+        fmt=args["format"],
+        dtype=args["dtype"],
+        preprocess=thpp.ThumbnailPreprocessor(
+            crop=args["crop"],
+            factor=args["downsample"],
+            bits=args["bits"],
+            limits=None if args["limits"] == "none" else args["limits"],
+            percentiles=args["percentiles"],
+        ),
+        compression=None if args["compression"] == "none" else args["compression"],
+        metrics=metrics,
+        on_durable=done,
+    )
+
+def shutdown(consumer, decoder_pool, accumulator, exporter, interrupted:bool=False):
+    """releases all resources of a run in the order required for checkpointing
+
+    - the decoder pool is closed first
+    - upon interruption the partial chunk is written (even if `--spill` is set)
+    - the consumer is closed last (commits offsets of durable alerts if checkpointing)
+    """
+    if decoder_pool is not None: decoder_pool.close()
+    if accumulator is not None:
+        if interrupted: accumulator.flush()
+        accumulator.close()
+    consumer.close()
+    if exporter is not None: exporter.stop()
+    return
+
+def run_joblib(args):
+    """run stream using joblib
+    """
+    from joblib.parallel import Parallel, delayed
+
+    metrics, exporter = setup_metrics(args)
+
+    #persistent worker processes (created once per run, before the consumer spawns its threads)
+    decoder_pool = thdc.AlertDecoderPool(nprocs=args["njobs"] if args["njobs"] > 0 else thpl.available_cores(), metrics=metrics) if args["decoder"] == "process" else None
+    decode_alert = thdc.decode_alert if metrics is None else metrics.timed(thdc.decode_alert, "stage_seconds", stage="decode")
+    def decode_or_skip(alert):
+        #same per-alert semantics as `AlertDecoderPool.map()`
+        try:
+            return decode_alert(alert)
+        except Exception as e:
+            logger.warning(f"run_joblib(): exception while decoding alert: {e}")
+            return None
+
+    consumer = setup_stream(args)
+
+    #saving
+    save_dir = args["save"]
+
+    #batches are processed one after another (the whole wall-time of a batch is observed)
+    batcher = setup_batcher(args, parallelism=1, metrics=metrics)
+
+    #offsets are committed once alerts are durable
+    done = setup_checkpointing(consumer)
+
+    #in-memory chunks
+    accumulator = setup_accumulator(args, save_dir, metrics, done)
+
     #listener
+    interrupted = False
     try:
         start_metrics = datetime.now()
         poll_idx = 0                #init number of polls made
@@ -311,25 +384,31 @@ def run_joblib(args):
             logger.info(f"######### poll {poll_idx+1} #########")
 
             #poll servers
+            maxalerts, maxtimeout = batcher.next() if batcher is not None else (args["maxalerts"], args["maxtimeout"])
             start = datetime.now()
             alerts, state = consume_alerts(consumer,
-                maxtimeout=args["maxtimeout"],
-                maxalerts=args["maxalerts"],
-                files=fnames,
-                simulate_alert_stream_kwargs=dict(),
+                maxtimeout=maxtimeout,
+                maxalerts=maxalerts,
             )
+            if batcher is not None: batcher.update(maxalerts, len(alerts))
             if not state:
-                logger.info(f"no alerts in the last {args['maxtimeout']} seconds")
+                logger.info(f"no alerts in the last {maxtimeout} seconds")
             logger.info(f"runtime(consume_alerts):       {datetime.now() - start}")
+            if metrics is not None:
+                metrics.observe("stage_seconds", (datetime.now() - start).total_seconds(), stage="consume")
+                metrics.inc("alerts_total", len(alerts), stage="consume")
 
             #process extracted alerts
             start = datetime.now()
-            _ = Parallel(n_jobs=args["njobs"], backend="threading", verbose=1)(
-                delayed(process_single_alert)(
-                    alert,
-                    save_dir=save_dir
-            ) for alert in alerts)
-            logger.info(f"runtime(process_single_alert): {datetime.now() - start}")
+            start_processing = start
+            if decoder_pool is None:
+                data_jsons = Parallel(n_jobs=args["njobs"], backend="threading", verbose=1)(
+                    delayed(decode_or_skip)(alert) for alert in alerts
+                )
+                data_jsons = [data_json for data_json in data_jsons if data_json is not None]
+            else:
+                data_jsons = decoder_pool.map(alerts)   #raises `BrokenProcessPool` (ends the run without marking the batch done)
+            logger.info(f"runtime(decode_alert):         {datetime.now() - start}")
 
             #update
             poll_idx += 1
@@ -337,21 +416,109 @@ def run_joblib(args):
 
             reached_npolls = False if (args["npolls"] < 0) else (poll_idx >= args["npolls"])
 
-            #reformat
+            #accumulate (writes a chunk whenever `chunklen` alerts are available)
             start = datetime.now()
-            reformat_processed(save_dir, chunklen=args["chunklen"])
-            logger.info(f"runtime(reformat_processed): {datetime.now() - start}")
+            keys = {thcp.alert_key(alert) for alert in alerts}
+            if accumulator is not None:
+                accumulator.add_batch(data_jsons)   #preprocessed in a single pass over the whole poll
+                done(list(keys - {str(k) for data_json in data_jsons for k in data_json.keys()}))  #alerts that failed to decode
+            else:
+                logger.info("run_joblib(): alerts received but not saved because `--save` is unset or `False`")
+                done(list(keys))
+            logger.info(f"runtime(accumulate):           {datetime.now() - start}")
+            if batcher is not None: batcher.observe(len(alerts), (datetime.now() - start_processing).total_seconds())
 
             logger.info(f"Average number of alerts: {alert_idx/timedelta.total_seconds(datetime.now() - start_metrics)} alerts/s ({alert_idx} total)\n")
         logger.info(f"finished after {poll_idx} polls")
     except KeyboardInterrupt:
-        #cleanup
+        #clean exit (also triggered by SIGTERM)
+        interrupted = True
+    finally:
+        #cleanup (closes the connection to the servers)
+        shutdown(consumer, decoder_pool, accumulator, exporter, interrupted=interrupted)
+
+    return
+
+def run_pipeline(args):
+    """run stream using a pipelined runtime
+
+    - consuming, processing and writing run concurrently (see `thump.fink_lsst.pipeline.StreamPipeline`)
+    """
+    metrics, exporter = setup_metrics(args)
+
+    #concurrency of the individual stages
+    nworkers = args["njobs"] if args["njobs"] > 0 else max(1, thpl.available_cores() - args["nconsumers"] - args["nwriters"])
+    logger.info(f"run_pipeline(): {args['nconsumers']} consumers, {nworkers} workers, {args['nwriters']} writers")
 
-        #close the connection to the servers
-        consumer.close()
+    #polling pauses while the process stage is saturated (`pipeline` is bound below)
+    batcher = setup_batcher(args, parallelism=nworkers, free=lambda: pipeline.free(), stopped=lambda: pipeline.stopped(), metrics=metrics)
 
-        #clean exit
-        sys.exit(0)
+    #persistent worker processes (created once per run, before the consumer and the pipeline spawn their threads)
+    decoder_pool = thdc.AlertDecoderPool(nprocs=nworkers, metrics=metrics) if args["decoder"] == "process" else None
+
+    consumer = setup_stream(args)
+
+    #saving
+    save_dir = args["save"]
+
+    #offsets are committed once alerts are durable
+    done = setup_checkpointing(consumer)
+
+    #stages
+    def consume():
+        maxalerts, maxtimeout = batcher.next() if batcher is not None else (args["maxalerts"], args["maxtimeout"])
+        alerts, state = consume_alerts(consumer,
+            maxtimeout=maxtimeout,
+            maxalerts=maxalerts,
+        )
+        if batcher is not None: batcher.update(maxalerts, len(alerts))
+        if not state:
+            logger.info(f"no alerts in the last {maxtimeout} seconds")
+        return alerts
+
+    accumulator = setup_accumulator(args, save_dir, metrics, done)
+    def write_batch(data_jsons:List[dict]):
+        #all alerts available to the writer get preprocessed in a single pass
+        if accumulator is not None:
+            accumulator.add_batch(data_jsons)
+        else:
+            logger.info("run_pipeline(): alerts received but not saved because `--save` is unset or `False`")
+            done([str(k) for data_json in data_jsons for k in data_json.keys()])
+        return
+
+    if decoder_pool is not None:
+        decode = decoder_pool.decode
+    else:
+        decode = thdc.decode_alert if metrics is None else metrics.timed(thdc.decode_alert, "stage_seconds", stage="decode")
+    def process(alert):
+        start = time.perf_counter()
+        try:
+            data_json = decode(alert)
+        except BrokenProcessPool:
+            raise                           #stops the pipeline, the alert stays pending
+        except Exception:
+            done([thcp.alert_key(alert)])   #dropped by the pipeline
+            raise
+        if batcher is not None: batcher.observe(1, time.perf_counter() - start)
+        return data_json
+
+    pipeline = thpl.StreamPipeline(
+        consume=consume,
+        process=process,
+        write_batch=write_batch,
+        nconsumers=args["nconsumers"], nworkers=nworkers, nwriters=args["nwriters"],
+        queuesize=args["queuesize"],
+        npolls=args["npolls"],
+        metrics=metrics,
+        fatal=(BrokenProcessPool,),
+    )
+
+    try:
+        pipeline.run()  #handles `KeyboardInterrupt` (also triggered by SIGTERM) by draining
+        logger.info(f"finished after {pipeline.npolls_made} polls")
+    finally:
+        #cleanup (closes the connection to the servers)
+        shutdown(consumer, decoder_pool, accumulator, exporter, interrupted=pipeline.interrupted)
 
     return
 
@@ -366,6 +533,58 @@ def main():
         required=False,
         help="glob pattern to filter for files downloaded via `fink_client` datatransfer. serve as template to simulate data-stream. streams real data if omitted"
     )
+    parser.add_argument(
+        "--replay_profile",
+        type=str,
+        choices=["constant", "burst", "night"],
+        default="constant",
+        required=False,
+        help="rate profile of the simulated stream. only used if `--pat` is set. `constant` emits `--replay_rate` alerts/s, `burst` emits bursts of `--replay_burstsize` alerts at an average of `--replay_rate` alerts/s, `night` replays in the order of `midpointMjdTai` sped up by `--replay_speedup`"
+    )
+    parser.add_argument(
+        "--replay_rate",
+        type=float,
+        default=10,
+        required=False,
+        help="average number of simulated alerts per second. non-positive values emit alerts as fast as possible. only used if `--pat` is set"
+    )
+    parser.add_argument(
+        "--replay_burstsize",
+        type=int,
+        default=100,
+        required=False,
+        help="number of alerts per burst for `--replay_profile burst`"
+    )
+    parser.add_argument(
+        "--replay_speedup",
+        type=float,
+        default=1,
+        required=False,
+        help="factor to speed up the replay for `--replay_profile night`"
+    )
+    parser.add_argument(
+        "--replay_loop",
+        type=lambda v: True if v.lower() == "true" else False,
+        nargs="?",
+        default=False,
+        required=False,
+        help="whether to start over once all simulated alerts have been emitted"
+    )
+    parser.add_argument(
+        "--replay_shuffle",
+        type=lambda v: True if v.lower() == "true" else False,
+        nargs="?",
+        default=False,
+        required=False,
+        help="whether to emit simulated alerts in random order instead of file order. ignored for `--replay_profile night`. random order reads a full row-group for almost every alert and therefore limits the achievable rate"
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        required=False,
+        help="seed for the order of simulated alerts. only used with `--replay_shuffle true`"
+    )
     parser.add_argument(
         "--save",
         type=str,
@@ -385,14 +604,51 @@ def main():
         type=float,
         default=90,
         required=False,
-        help="maximum amount of time to wait for an alert until trying again. in seconds"
+        help="maximum amount of time to wait for an alert until trying again. in seconds. upper bound if `--adaptive` is set"
     )
     parser.add_argument(
         "--maxalerts",
         type=int,
         default=1,
         required=False,
-        help="maximum number of alerts to retrieve in one poll."
+        help="maximum number of alerts to retrieve in one poll. upper bound if `--adaptive` is set"
+    )
+    parser.add_argument(
+        "--checkpoint",
+        type=lambda v: True if v.lower() == "true" else False,
+        nargs="?",
+        default=True,
+        required=False,
+        help="whether to commit kafka offsets only once the respective alerts are durable (written to a chunk or to the spill log if `--spill` is set). enabled by default, i.e., unlike earlier versions offsets are no longer auto-committed upon consumption unless `--checkpoint false` is passed. ignored if `--pat` is set"
+    )
+    parser.add_argument(
+        "--adaptive",
+        type=lambda v: True if v.lower() == "true" else False,
+        nargs="?",
+        default=False,
+        required=False,
+        help="whether to adapt the number of alerts and the timeout of every poll to the current load within `--minalerts`/`--maxalerts` and `--mintimeout`/`--maxtimeout`. with `--runtime pipeline` polling also pauses while `--queuesize` alerts are waiting to be processed"
+    )
+    parser.add_argument(
+        "--minalerts",
+        type=int,
+        default=1,
+        required=False,
+        help="minimum number of alerts to retrieve in one poll. only used if `--adaptive` is set"
+    )
+    parser.add_argument(
+        "--mintimeout",
+        type=float,
+        default=1,
+        required=False,
+        help="minimum amount of time to wait for alerts in one poll. in seconds. only used if `--adaptive` is set"
+    )
+    parser.add_argument(
+        "--target_latency",
+        type=float,
+        default=10,
+        required=False,
+        help="time processing a single batch of alerts should take at most. in seconds. only used if `--adaptive` is set"
     )
     parser.add_argument(
         "--npolls",
@@ -408,9 +664,155 @@ def main():
         required=False,
         help="number of jobs to use for parallel processing of individual alerts. -1 denotes all available cores"
     )
+    parser.add_argument(
+        "--decimals",
+        type=int,
+        default=1,
+        required=False,
+        help="number of decimals to write for thumbnails"
+    )
+    parser.add_argument(
+        "--layout",
+        type=str,
+        choices=["pretty", "compact"],
+        default="pretty",
+        required=False,
+        help="layout of the written json files. `pretty` writes every thumbnail row on its own line. `compact` omits all whitespace"
+    )
+    parser.add_argument(
+        "--format",
+        type=str,
+        choices=["json", "binary"],
+        default="json",
+        required=False,
+        help="format of the written files. `binary` writes `.thump` containers (typed arrays and a json header) that are much smaller and faster to load in the browser"
+    )
+    parser.add_argument(
+        "--dtype",
+        type=str,
+        choices=["int16", "float32"],
+        default="int16",
+        required=False,
+        help="storage type of the thumbnails in binary containers. `int16` stores values scaled by `10**--decimals` in the smallest integer type that fits (uint8, int16, uint16) and falls back to `float32` for thumbnails that do not fit"
+    )
+    parser.add_argument(
+        "--crop",
+        type=int,
+        default=None,
+        required=False,
+        help="side length (in pixels) to center crop thumbnails to. not cropped if omitted"
+    )
+    parser.add_argument(
+        "--downsample",
+        type=int,
+        default=1,
+        required=False,
+        help="downsampling factor. thumbnails are averaged over blocks of `--downsample`x`--downsample` pixels (after cropping)"
+    )
+    parser.add_argument(
+        "--bits",
+        type=int,
+        choices=[8, 16],
+        default=None,
+        required=False,
+        help="number of bits to quantize thumbnails to. scale and offset are stored per thumbnail and undone when loading the files. `--decimals` is ignored for quantized thumbnails. not quantized if omitted"
+    )
+    parser.add_argument(
+        "--limits",
+        type=str,
+        choices=["none", "percentile", "zscale"],
+        default="none",
+        required=False,
+        help="method to precompute robust display limits of every thumbnail with. stored in `thumbnailLimits` and used by the mosaic unless `zmin`/`zmax` are set. computed after cropping and downsampling but before quantization"
+    )
+    parser.add_argument(
+        "--percentiles",
+        type=float,
+        nargs=2,
+        default=[1.0, 99.0],
+        required=False,
+        help="lower and upper percentile used as display limits if `--limits percentile`"
+    )
+    parser.add_argument(
+        "--compression",
+        type=str,
+        choices=["none", "gzip", "zstd"],
+        default="none",
+        required=False,
+        help="compression of the written files. files are compressed while being written and get the suffix `.gz` or `.zst`. gzip files are decompressed natively by the browser. zstd requires `zstandard`"
+    )
+    parser.add_argument(
+        "--spill",
+        type=lambda v: True if v.lower() == "true" else False,
+        nargs="?",
+        default=False,
+        required=False,
+        help="whether to append every processed alert to `<save>spill.jsonl`. alerts not yet written to a chunk are recovered from it on restart. otherwise pending alerts are written to a partial chunk on exit"
+    )
+    parser.add_argument(
+        "--decoder",
+        type=str,
+        choices=["thread", "process"],
+        default="thread",
+        required=False,
+        help="how to decode alerts. `thread` decodes in threads of the main process. `process` uses a persistent pool of `--njobs` worker processes"
+    )
+    parser.add_argument(
+        "--runtime",
+        type=str,
+        choices=["joblib", "pipeline"],
+        default="joblib",
+        required=False,
+        help="runtime to use. `joblib` polls, processes and reformats sequentially. `pipeline` runs all stages concurrently connected by bounded queues"
+    )
+    parser.add_argument(
+        "--nconsumers",
+        type=int,
+        default=1,
+        required=False,
+        help="number of threads polling the servers. only used if `--runtime pipeline`"
+    )
+    parser.add_argument(
+        "--nwriters",
+        type=int,
+        default=1,
+        required=False,
+        help="number of threads writing processed alerts. only used if `--runtime pipeline`"
+    )
+    parser.add_argument(
+        "--queuesize",
+        type=int,
+        default=256,
+        required=False,
+        help="maximum number of alerts buffered between stages. only used if `--runtime pipeline`"
+    )
+    parser.add_argument(
+        "--metrics_prom",
+        type=str,
+        default=None,
+        required=False,
+        help="file to periodically export metrics to in prometheus text format. not exported if omitted"
+    )
+    parser.add_argument(
+        "--metrics_jsonl",
+        type=str,
+        default=None,
+        required=False,
+        help="file to periodically append metrics snapshots to (one json object per line). not exported if omitted"
+    )
+    parser.add_argument(
+        "--metrics_interval",
+        type=float,
+        default=30,
+        required=False,
+        help="seconds between two metrics exports"
+    )
     args=vars(parser.parse_args())
 
-    run_joblib(args)
+    if args["runtime"] == "pipeline":
+        run_pipeline(args)
+    else:
+        run_joblib(args)
 
 if __name__ == "__main__":
     main()
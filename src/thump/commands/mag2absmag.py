@@ -1,21 +1,50 @@
-"""combines all `ThumP!` output files in `dir` into a single csv
+"""converts apparent magnitudes to absolute magnitudes
 
-- finds all files matching `thump_*.csv` in `dir`
-- saves them to `--save`
+- single mode
+    - converts a single apparent magnitude `m` at redshift `z`
+    - prints the result (via `lust_codesnippets_py.astronomy.absmag`)
+- batch mode (`--file`)
+    - reads the columns `--m_col` and `--z_col` (optionally `--m_err_col`, `--z_err_col`) from a csv or parquet file
+        - i.e., a table of candidates or the consolidated verdicts written by `thump_concat_output`
+    - converts all rows in one vectorized pass (see `thump.data.absmag`)
+        - distance moduli are interpolated from a grid computed once for the cosmology
+    - appends the absolute magnitudes (`{--prefix}`) and their uncertainties (`{--prefix}_err`) as new columns
+    - saves the result to `--save` (csv, or parquet if it ends with `.parquet`)
+        - written back to `--file` if omitted
+- flat LambdaCDM cosmology with `--H0` and `--Om0`
 
 Usage
 ```bash
-    thump_concat_output dir [--save FILENAME.csv]
+    thump_mag2absmag m z [--H0 H0] [--Om0 OM0]
+    thump_mag2absmag \
+        --file FILENAME [--m_col M_COL] [--z_col Z_COL] [--m_err_col M_ERR_COL] [--z_err_col Z_ERR_COL] \
+        [--prefix PREFIX] [--save FILENAME] [--H0 H0] [--Om0 OM0]
 ```
 
 """
 
 #%%imports
 import argparse
-from astropy.cosmology import FlatLambdaCDM
-from lust_codesnippets_py.astronomy import absmag as lcaa
+import polars as pl
+
+from thump.data import absmag as thab
+from thump.data import filelog as thfl
 
 #%%definitions
+def _read(fname:str) -> pl.DataFrame:
+    """reads a csv or parquet file"""
+    if fname.endswith(".parquet"):
+        return pl.read_parquet(fname)
+    return pl.read_csv(fname, comment_prefix="#")
+
+def _write(df:pl.DataFrame, fname:str):
+    """writes `df` to a csv or parquet file (atomically, `fname` might be the input)"""
+    with thfl.atomic_open(fname, "wb") as f:
+        if fname.endswith(".parquet"):
+            df.write_parquet(f)
+        else:
+            df.write_csv(f)
+    return
 
 #%%main
 def main():
@@ -24,18 +53,99 @@ def main():
     parser.add_argument(
         "m",
         type=float,
-        help="apparent magnitude"
+        nargs="?",
+        default=None,
+        help="apparent magnitude. ignored if `--file` is set"
     )
     parser.add_argument(
         "z",
         type=float,
-        help="redshift"
+        nargs="?",
+        default=None,
+        help="redshift. ignored if `--file` is set"
+    )
+    parser.add_argument(
+        "--file",
+        type=str,
+        default=None,
+        required=False,
+        help="csv or parquet file to convert all rows of (batch mode)"
+    )
+    parser.add_argument(
+        "--m_col",
+        type=str,
+        default="m",
+        required=False,
+        help="column of `--file` containing apparent magnitudes"
+    )
+    parser.add_argument(
+        "--z_col",
+        type=str,
+        default="z",
+        required=False,
+        help="column of `--file` containing redshifts"
+    )
+    parser.add_argument(
+        "--m_err_col",
+        type=str,
+        default=None,
+        required=False,
+        help="column of `--file` containing uncertainties of the apparent magnitudes. no uncertainty if omitted"
+    )
+    parser.add_argument(
+        "--z_err_col",
+        type=str,
+        default=None,
+        required=False,
+        help="column of `--file` containing uncertainties of the redshifts. no uncertainty if omitted"
+    )
+    parser.add_argument(
+        "--prefix",
+        type=str,
+        default="M",
+        required=False,
+        help="name of the appended columns (`PREFIX` and `PREFIX_err`)"
+    )
+    parser.add_argument(
+        "--save",
+        type=str,
+        default=None,
+        required=False,
+        help="file to save the result of the batch mode to. written as parquet if it ends with `.parquet` and as csv otherwise. defaults to `--file`"
+    )
+    parser.add_argument(
+        "--H0",
+        type=float,
+        default=70,
+        required=False,
+        help="Hubble constant in km/s/Mpc"
+    )
+    parser.add_argument(
+        "--Om0",
+        type=float,
+        default=0.3,
+        required=False,
+        help="matter density at z=0"
     )
     args=vars(parser.parse_args())
 
+    H0, Om0 = args["H0"], args["Om0"]
+
+    if args["file"] is not None:
+        df = thab.absmag_frame(_read(args["file"]),
+            m_col=args["m_col"], z_col=args["z_col"],
+            m_err_col=args["m_err_col"], z_err_col=args["z_err_col"],
+            H0=H0, Om0=Om0, prefix=args["prefix"],
+        )
+        _write(df, args["save"] or args["file"])
+        print(f"converted {len(df)} rows (LCDM({H0}, {Om0})) to {args['save'] or args['file']}")
+        return
+
+    if (args["m"] is None) or (args["z"] is None):
+        parser.error("either `m` and `z` or `--file` have to be set")
 
-    H0 = 70
-    Om0 = 0.3
+    from astropy.cosmology import FlatLambdaCDM
+    from lust_codesnippets_py.astronomy import absmag as lcaa
     cosmo = FlatLambdaCDM(H0, Om0)
 
     m, z = args["m"], args["z"]
@@ -45,4 +155,4 @@ def main():
     return
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
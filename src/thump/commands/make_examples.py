@@ -1,12 +1,23 @@
 """generates some amount of example files for `ThumP!`
 
-- will generate
+- `--kind series` (default) will generate
     - `--nfiles` files
     - each file with `--nobj_per_file` objects
+    - as json files or binary containers (`--format binary`, see `thump.data.container`)
+- `--kind lsst` will generate
+    - `--nfiles` synthetic lsst-like alert packages (parquet, as downloaded via fink datatransfer)
+    - each file with `--nobj_per_file` alerts
+    - cutouts of `--npix` x `--npix` pixels
+    - can be processed with `thump_from_fink_datatransfer` (`thump fink_from_datatransfer_lsst`)
+- files are saved to `--save`
+- `--seed` makes the output reproducible (independent of `--njobs`)
+- `--njobs` files are generated in parallel
 
 Usage
 ```bash
-    thump_make_examples [--nfiles NFILES] [--nobj_per_file NOBJ_PER_FILE]
+    thump_make_examples \
+        [--kind {series,lsst}] [--nfiles NFILES] [--nobj_per_file NOBJ_PER_FILE] [--format {json,binary}] \
+        [--npix NPIX] [--save SAVE] [--seed SEED] [--njobs NJOBS]
 ```
 
 """
@@ -19,6 +30,14 @@ from thump.data import examples as thde
 def main():
     parser = argparse.ArgumentParser(
     )
+    parser.add_argument(
+        "--kind",
+        type=str,
+        choices=["series", "lsst"],
+        default="series",
+        required=False,
+        help="kind of data to generate. `ThumP!` files with series-style thumbnails or synthetic lsst alert packages"
+    )
     parser.add_argument(
         "--nfiles",
         type=int,
@@ -31,14 +50,61 @@ def main():
         type=int,
         default=100,
         required=False,
-        help="number of objects per file to generate"
+        help="number of objects (alerts for `--kind lsst`) per file to generate"
+    )
+    parser.add_argument(
+        "--format",
+        type=str,
+        choices=["json", "binary"],
+        default="json",
+        required=False,
+        help="format of the generated files. only used for `--kind series`"
+    )
+    parser.add_argument(
+        "--npix",
+        type=int,
+        default=30,
+        required=False,
+        help="side length of the generated cutouts. only used for `--kind lsst`"
+    )
+    parser.add_argument(
+        "--save",
+        type=str,
+        default=None,
+        required=False,
+        help="directory to save the files to. defaults to `./data/examples/` (`--kind series`) and `./data/synthetic/` (`--kind lsst`)"
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        required=False,
+        help="seed of the random number generator. random output if omitted"
+    )
+    parser.add_argument(
+        "--njobs",
+        type=int,
+        default=1,
+        required=False,
+        help="number of files to generate in parallel"
     )
 
     args=vars(parser.parse_args())
 
-    thde.make_examples(**args)
+    if args["kind"] == "lsst":
+        thde.make_alerts(
+            nfiles=args["nfiles"], nalerts_per_file=args["nobj_per_file"],
+            save_dir=args["save"] or "./data/synthetic/", npix=args["npix"],
+            seed=args["seed"], njobs=args["njobs"],
+        )
+    else:
+        thde.make_examples(
+            nfiles=args["nfiles"], nobj_per_file=args["nobj_per_file"], fmt=args["format"],
+            save_dir=args["save"] or "./data/examples/",
+            seed=args["seed"], njobs=args["njobs"],
+        )
 
     return
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
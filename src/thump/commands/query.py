@@ -0,0 +1,127 @@
+"""joins reviewer verdicts to alert packages downloaded via fink datatransfer
+
+- only designed for lsst alerts
+- finds all parquet files matching `pat`
+- lazily joins the consolidated verdicts (`--verdicts`, see `thump.fink_lsst.query`) to them
+    - `--verdicts` can be a directory of `ThumP!` output files, a verdict dataset or the file saved by `thump_concat_output`
+- predicates on `diaSourceId` (`--ids`), time range (`--mjd_min`, `--mjd_max`) and sky region (`--cone`) are pushed down into the scan
+- only the requested columns (`--columns`) are read and exported
+- saves the result to `--save` (csv, or parquet if it ends with `.parquet`)
+    - printed otherwise
+
+Usage
+```bash
+    thump_query \
+        pat --verdicts VERDICTS \
+        [--columns COLUMN [COLUMN ...]] [--verdict_columns COLUMN [COLUMN ...]] [--classes CLASS [CLASS ...]] \
+        [--ids ID [ID ...]] [--mjd_min MJD_MIN] [--mjd_max MJD_MAX] [--cone RA DEC RADIUS] \
+        [--save FILENAME]
+```
+
+"""
+
+#%%imports
+import argparse
+import glob
+
+from thump.fink_lsst import query as thqu
+
+#%%definitions
+
+#%%main
+def main():
+    parser = argparse.ArgumentParser(
+    )
+    parser.add_argument(
+        "pat",
+        type=str,
+        help="pattern defining all parquet files downloaded via datatransfer"
+    )
+    parser.add_argument(
+        "--verdicts",
+        type=str,
+        required=True,
+        help="consolidated verdicts. directory containing `ThumP!` output files, directory of a verdict dataset or file saved by `thump_concat_output`"
+    )
+    parser.add_argument(
+        "--columns",
+        type=str,
+        nargs="+",
+        default=None,
+        required=False,
+        help="(nested) alert columns to export, i.e., `diaSource.psfFlux`. defaults to diaObjectId, midpointMjdTai, ra and dec"
+    )
+    parser.add_argument(
+        "--verdict_columns",
+        type=str,
+        nargs="+",
+        default=["class"],
+        required=False,
+        help="columns of the verdicts to export in addition to `objectId`"
+    )
+    parser.add_argument(
+        "--classes",
+        type=str,
+        nargs="+",
+        default=None,
+        required=False,
+        help="only export alerts classified as one of these classes. all classes if omitted"
+    )
+    parser.add_argument(
+        "--ids",
+        type=int,
+        nargs="+",
+        default=None,
+        required=False,
+        help="only export alerts with these `diaSourceId`"
+    )
+    parser.add_argument(
+        "--mjd_min",
+        type=float,
+        default=None,
+        required=False,
+        help="only export alerts observed at or after this `midpointMjdTai`"
+    )
+    parser.add_argument(
+        "--mjd_max",
+        type=float,
+        default=None,
+        required=False,
+        help="only export alerts observed at or before this `midpointMjdTai`"
+    )
+    parser.add_argument(
+        "--cone",
+        type=float,
+        nargs=3,
+        default=None,
+        required=False,
+        help="only export alerts within a cone. right ascension, declination and radius in degrees"
+    )
+    parser.add_argument(
+        "--save",
+        type=str,
+        default=None,
+        required=False,
+        help="file to save result to. written as parquet if it ends with `.parquet` and as csv otherwise. printed if omitted"
+    )
+
+    args=vars(parser.parse_args())
+
+    fnames = sorted(glob.glob(args["pat"]))
+    mjd = None if (args["mjd_min"] is None) and (args["mjd_max"] is None) else (args["mjd_min"], args["mjd_max"])
+    lf = thqu.query(fnames, args["verdicts"],
+        columns=args["columns"], classes=args["classes"], source_ids=args["ids"],
+        mjd=mjd, cone=args["cone"], verdict_columns=args["verdict_columns"],
+    )
+
+    if args["save"] is None:
+        print(lf.collect(engine="streaming"))
+    elif args["save"].endswith(".parquet"):
+        lf.sink_parquet(args["save"])
+    else:
+        lf.sink_csv(args["save"])
+
+    return
+
+if __name__ == "__main__":
+    main()
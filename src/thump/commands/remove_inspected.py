@@ -1,13 +1,18 @@
-"""removes `ThumP!` input files (json) where ALL objects have been inspected
+"""removes `ThumP!` input files (json or binary containers) where ALL objects have been inspected
 
-- finds all files matching `<in_pat>.json` (`ThumP!` input)
+- finds all files matching `<in_pat>.json` and `<in_pat>.thump` (`ThumP!` input)
 - finds all files matching `<out_pat>.csv` (`ThumP!` output)
-- checks which input files have IDs, where ALL IDs are contained in the output files
+- gzip or zstd compressed files (additional suffix `.gz`, `.zst`) are included
+- ingests new output files into a persistent store of inspected IDs (`--store`, see `thump.data.inspected`)
+    - output files that were ingested by a previous run are not read again
+- checks which input files have IDs, where ALL IDs are contained in the store
     - removes these files 
+- setting `--watch` prunes input files continuously (every `--watch` seconds) until interrupted
 
 Usage
 ```bash
-    thump_remove_inspected [--in_pat IN_PAT] [--out_pat OUT_PAT]
+    thump_remove_inspected [--in_pat IN_PAT] [--out_pat OUT_PAT] [--dry_run DRY_RUN] \
+        [--store DIRECTORY] [--watch SECONDS] [--compact COMPACT]
 ```
 
 """
@@ -27,13 +32,13 @@ def main():
         "--in_pat",
         type=str,
         required=True,
-        help="pattern defining all `ThumP!` input files. .json will be appended"
+        help="pattern defining all `ThumP!` input files. .json and .thump (optionally followed by .gz or .zst) will be appended"
     )
     parser.add_argument(
         "--out_pat",
         type=str,
         required=True,
-        help="pattern defining all `ThumP!` output files. .csv will be appended"
+        help="pattern defining all `ThumP!` output files. .csv (optionally followed by .gz or .zst) will be appended"
     )
     parser.add_argument(
         "--dry_run",
@@ -43,6 +48,28 @@ def main():
         required=False,
         help="whether to execute as dry-run"
     )
+    parser.add_argument(
+        "--store",
+        type=str,
+        default=None,
+        required=False,
+        help="directory of the persistent store of inspected IDs. defaults to `.thump_inspected/` in the directory of `--out_pat`"
+    )
+    parser.add_argument(
+        "--watch",
+        type=float,
+        default=None,
+        required=False,
+        help="interval (in seconds) to repeat the pruning in. pruned only once if omitted"
+    )
+    parser.add_argument(
+        "--compact",
+        type=lambda v: True if v.lower() == "true" else False,
+        nargs="?",
+        default=False,
+        required=False,
+        help="whether to merge all parts of the store of inspected IDs into one before exiting"
+    )
 
     args=vars(parser.parse_args())
 
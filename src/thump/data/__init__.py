@@ -1,16 +1,39 @@
 """module dealing with data for and from `ThumP!`
 
 - contains functions to
-    - generate examples
+    - generate examples and synthetic alert packages
     - concatenate generated output
 
 Exceptions
 
 Classes
-	  
+    - `filelog.FileLog` -- persistent log of processed files keyed by path, size and modification time
+    - `inspected.InspectedStore` -- persistent append-only store of inspected object ids
+    - `verdicts.VerdictDataset` -- partitioned parquet dataset of reviewer verdicts
+    - `preprocessing.ThumbnailPreprocessor` -- crops, downsamples, computes display limits for and quantizes thumbnails
+
 Functions
     - `examples.make_examples()`  -- generates examples to test `ThumP!`
-    - `output.concat()` -- concatenates files output by `ThumP!`
+    - `examples.make_alerts()` -- generates synthetic lsst-like alert packages (datatransfer parquet)
+    - `output.concat()` -- incrementally consolidates files output by `ThumP!` (latest verdict per object)
+    - `output.remove_inspected()` -- removes fully inspected `ThumP!` files (optionally continuously)
+    - `encoding.dump()` -- writes `ThumP!` files with a numpy-aware json encoder
+    - `container.dump()` -- writes `ThumP!` files as binary containers
+    - `container.load()` -- reads `ThumP!` binary containers
+    - `container.keys()` -- reads the object ids of `ThumP!` binary containers
+    - `index.scan()` -- lazily scans the object-to-file index of a directory of `ThumP!` files
+    - `index.lookup()` -- finds the `ThumP!` files containing some objects
+    - `index.read_object()` -- reads a single object from a `ThumP!` file via the index
+    - `index.stats()` -- per-file statistics of indexed `ThumP!` files
+    - `filelog.atomic_open()` -- writes a file atomically (temporary file, fsync and rename)
+    - `compression.wrap()` -- compresses `ThumP!` files while they are written
+    - `compression.open_file()` -- opens (compressed) `ThumP!` files for reading
+    - `absmag.absmag()` -- vectorized conversion of apparent to absolute magnitudes (cached distance-modulus grid)
+    - `absmag.absmag_frame()` -- appends absolute magnitudes to a table
+    - `preprocessing.crop_center()` -- center crops thumbnails
+    - `preprocessing.downsample()` -- block-average downsamples thumbnails
+    - `preprocessing.quantize()` -- quantizes thumbnails to 8 or 16 bits
+    - `preprocessing.display_limits()` -- robust (percentile or zscale) display limits of a stack of thumbnails
 
 Other Objects
 """
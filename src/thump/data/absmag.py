@@ -0,0 +1,216 @@
+"""vectorized conversion of apparent to absolute magnitudes
+
+- `M = m - mu(z)` with the distance modulus `mu(z)` of a flat LambdaCDM cosmology
+    - no K-correction
+- distance moduli are interpolated from a grid
+    - the grid is computed once per cosmology (`astropy.cosmology`) and cached for the lifetime of the process
+    - interpolated in `log(z)`, i.e., accurate to well below 1 mmag over the whole grid
+    - redshifts outside of the grid are computed exactly
+- uncertainties of `m` and `z` are propagated linearly
+    - `M_err**2 = m_err**2 + (dmu/dz * z_err)**2`
+- allows converting whole candidate lists (i.e., consolidated verdict tables) at once
+
+Exceptions
+
+Classes
+
+Functions
+    - `distance_modulus_grid()` -- cached grid of distance moduli
+    - `distance_modulus()` -- interpolated distance moduli and their derivative
+    - `absmag()` -- absolute magnitudes and their uncertainties
+    - `absmag_frame()` -- appends absolute magnitudes to a table
+
+Other Objects
+"""
+
+#%%imports
+from functools import lru_cache
+import numpy as np
+import polars as pl
+from typing import Tuple
+
+#%%definitions
+@lru_cache(maxsize=8)
+def distance_modulus_grid(H0:float=70, Om0:float=0.3, zmin:float=1e-4, zmax:float=10, n:int=4096) -> Tuple[np.ndarray,np.ndarray]:
+    """grid of distance moduli of a flat LambdaCDM cosmology
+
+    - cached, i.e., only computed once per set of arguments
+
+    Parameters
+        - `H0`
+            - `float`, optional
+            - Hubble constant in km/s/Mpc
+            - the default is `70`
+        - `Om0`
+            - `float`, optional
+            - matter density at `z = 0`
+            - the default is `0.3`
+        - `zmin`
+            - `float`, optional
+            - smallest redshift of the grid
+            - the default is `1e-4`
+        - `zmax`
+            - `float`, optional
+            - largest redshift of the grid
+            - the default is `10`
+        - `n`
+            - `int`, optional
+            - number of (logarithmically spaced) grid points
+            - the default is `4096`
+
+    Returns
+        - `logz`
+            - `np.ndarray`
+            - `log(z)` of every grid point
+        - `mu`
+            - `np.ndarray`
+            - distance modulus of every grid point
+    """
+    from astropy.cosmology import FlatLambdaCDM
+    logz = np.linspace(np.log(zmin), np.log(zmax), n)
+    mu = FlatLambdaCDM(H0, Om0).distmod(np.exp(logz)).value
+    logz.flags.writeable, mu.flags.writeable = False, False  #shared via the cache
+    return logz, mu
+
+def distance_modulus(z:np.ndarray, H0:float=70, Om0:float=0.3) -> Tuple[np.ndarray,np.ndarray]:
+    """distance moduli and their derivative w.r.t. redshift
+
+    Parameters
+        - `z`
+            - `np.ndarray`
+            - redshifts
+            - non-positive and non-finite redshifts result in `NaN`
+        - `H0`
+            - `float`, optional
+            - Hubble constant in km/s/Mpc
+            - the default is `70`
+        - `Om0`
+            - `float`, optional
+            - matter density at `z = 0`
+            - the default is `0.3`
+
+    Returns
+        - `mu`
+            - `np.ndarray`
+            - distance modulus of every redshift
+        - `dmu_dz`
+            - `np.ndarray`
+            - derivative of the distance modulus w.r.t. redshift
+    """
+    logz_grid, mu_grid = distance_modulus_grid(H0, Om0)
+    z = np.asarray(z, dtype=np.float64)
+    valid = np.isfinite(z) & (z > 0)
+    logz = np.log(np.where(valid, z, 1))
+
+    mu = np.interp(logz, logz_grid, mu_grid)
+    dmu_dz = np.interp(logz, logz_grid, np.gradient(mu_grid, logz_grid)) / np.where(valid, z, 1)     #chain rule (dmu/dlogz / z)
+
+    outside = valid & ((logz < logz_grid[0]) | (logz > logz_grid[-1]))
+    if outside.any():
+        from astropy.cosmology import FlatLambdaCDM
+        cosmo = FlatLambdaCDM(H0, Om0)
+        h = 1e-6 * z[outside]
+        mu[outside] = cosmo.distmod(z[outside]).value
+        dmu_dz[outside] = (cosmo.distmod(z[outside] + h).value - cosmo.distmod(z[outside] - h).value) / (2*h)
+
+    mu[~valid], dmu_dz[~valid] = np.nan, np.nan
+    return mu, dmu_dz
+
+def absmag(m:np.ndarray, z:np.ndarray, m_err:np.ndarray=None, z_err:np.ndarray=None, H0:float=70, Om0:float=0.3) -> Tuple[np.ndarray,np.ndarray]:
+    """converts apparent to absolute magnitudes
+
+    Parameters
+        - `m`
+            - `np.ndarray`
+            - apparent magnitudes
+        - `z`
+            - `np.ndarray`
+            - redshifts
+        - `m_err`
+            - `np.ndarray`, optional
+            - uncertainties of `m`
+            - the default is `None`
+                - `0`
+        - `z_err`
+            - `np.ndarray`, optional
+            - uncertainties of `z`
+            - the default is `None`
+                - `0`
+        - `H0`
+            - `float`, optional
+            - Hubble constant in km/s/Mpc
+            - the default is `70`
+        - `Om0`
+            - `float`, optional
+            - matter density at `z = 0`
+            - the default is `0.3`
+
+    Returns
+        - `M`
+            - `np.ndarray`
+            - absolute magnitudes
+        - `M_err`
+            - `np.ndarray`
+            - uncertainties of `M`
+    """
+    m = np.asarray(m, dtype=np.float64)
+    m_err = np.zeros_like(m) if m_err is None else np.asarray(m_err, dtype=np.float64)
+    z_err = np.zeros_like(m) if z_err is None else np.asarray(z_err, dtype=np.float64)
+
+    mu, dmu_dz = distance_modulus(z, H0, Om0)
+    return m - mu, np.sqrt(m_err**2 + (dmu_dz * z_err)**2)
+
+def absmag_frame(df:pl.DataFrame,
+    m_col:str="m", z_col:str="z",
+    m_err_col:str=None, z_err_col:str=None,
+    H0:float=70, Om0:float=0.3,
+    prefix:str="M",
+    ) -> pl.DataFrame:
+    """appends absolute magnitudes and their uncertainties to a table
+
+    Parameters
+        - `df`
+            - `pl.DataFrame`
+            - table containing apparent magnitudes and redshifts
+        - `m_col`
+            - `str`, optional
+            - column containing apparent magnitudes
+            - the default is `"m"`
+        - `z_col`
+            - `str`, optional
+            - column containing redshifts
+            - the default is `"z"`
+        - `m_err_col`
+            - `str`, optional
+            - column containing uncertainties of `m_col`
+            - the default is `None`
+                - no uncertainty
+        - `z_err_col`
+            - `str`, optional
+            - column containing uncertainties of `z_col`
+            - the default is `None`
+                - no uncertainty
+        - `H0`
+            - `float`, optional
+            - Hubble constant in km/s/Mpc
+            - the default is `70`
+        - `Om0`
+            - `float`, optional
+            - matter density at `z = 0`
+            - the default is `0.3`
+        - `prefix`
+            - `str`, optional
+            - name of the appended columns (`{prefix}` and `{prefix}_err`)
+            - the default is `"M"`
+
+    Returns
+        - `df`
+            - `pl.DataFrame`
+            - `df` with `{prefix}` and `{prefix}_err` appended (replaced if they exist)
+            - rows with missing `m_col` or `z_col` (or non-positive redshift) get `null`
+    """
+    def _col(c:str) -> np.ndarray:
+        return None if c is None else df[c].cast(pl.Float64).fill_null(np.nan).to_numpy()
+
+    M, M_err = absmag(_col(m_col), _col(z_col), _col(m_err_col), _col(z_err_col), H0=H0, Om0=Om0)
+    return df.with_columns(pl.Series(prefix, M).fill_nan(None), pl.Series(f"{prefix}_err", M_err).fill_nan(None))
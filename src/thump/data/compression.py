@@ -0,0 +1,156 @@
+"""compressed `ThumP!` files
+
+- `ThumP!` files (json and binary containers) can be written gzip or zstd compressed
+    - the compression is applied while writing (streaming)
+        - i.e., the uncompressed chunk never has to exist in memory as a whole
+    - compressed files carry an additional suffix (`.gz`, `.zst`)
+        - i.e., `reformatted_0001.json.gz`
+- the browser loader (`readThumpFile()` in `scripts/ui/io.js`) decompresses gzip natively (`DecompressionStream`)
+    - zstd is only decompressed if the browser supports it
+    - zstd files are meant for archiving and syncing (decompress via `zstd -d` before loading them otherwise)
+- zstd requires the optional dependency `zstandard` (`pip install thump[zstd]`)
+
+Exceptions
+
+Classes
+
+Functions
+    - `suffix()` -- file suffix of a compression
+    - `compression_of()` -- infer the compression of a file from its name
+    - `strip_suffix()` -- remove the compression suffix from a file name
+    - `wrap()` -- compress everything written to a binary file
+    - `open_file()` -- open a (potentially compressed) file for reading
+
+Other Objects
+    - `COMPRESSIONS` -- supported compressions
+"""
+
+#%%imports
+from contextlib import contextmanager
+import gzip
+import io
+from typing import BinaryIO, IO, Iterator
+
+#%%definitions
+COMPRESSIONS    = {None:"", "gzip":".gz", "zstd":".zst"}  #compression -> suffix
+
+def _zstandard():
+    """imports the optional dependency `zstandard`"""
+    try:
+        import zstandard
+    except ImportError as e:
+        raise ImportError("zstd compression requires `zstandard`. install it via `pip install thump[zstd]` or use gzip") from e
+    return zstandard
+
+def suffix(compression:str=None) -> str:
+    """file suffix of `compression`
+
+    Parameters
+        - `compression`
+            - `str`, optional
+            - one of `None`, `"gzip"`, `"zstd"`
+            - the default is `None`
+
+    Raises
+        - `ValueError`
+            - if `compression` is not supported
+
+    Returns
+        - `suffix`
+            - `str`
+            - suffix appended to compressed files
+            - `""` for uncompressed files
+    """
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"`compression` has to be one of {list(COMPRESSIONS.keys())} but is {compression!r}")
+    return COMPRESSIONS[compression]
+
+def compression_of(fname:str) -> str:
+    """infers the compression of `fname` from its suffix (`None` if uncompressed)"""
+    for compression, sfx in COMPRESSIONS.items():
+        if (compression is not None) and fname.endswith(sfx):
+            return compression
+    return None
+
+def strip_suffix(fname:str) -> str:
+    """removes the compression suffix from `fname`"""
+    sfx = COMPRESSIONS[compression_of(fname)]
+    return fname[:len(fname)-len(sfx)] if len(sfx) > 0 else fname
+
+@contextmanager
+def wrap(raw:BinaryIO, compression:str=None, text:bool=False, level:int=None) -> Iterator[IO]:
+    """context manager compressing everything written to `raw`
+
+    - the compressor is finalized upon exit
+    - `raw` is not closed (i.e., `thump.fink_lsst.checkpoint.atomic_open()` can still sync and rename it)
+
+    Parameters
+        - `raw`
+            - `BinaryIO`
+            - file opened in binary mode to write the compressed stream to
+        - `compression`
+            - `str`, optional
+            - one of `None`, `"gzip"`, `"zstd"`
+            - the default is `None`
+                - written uncompressed
+        - `text`
+            - `bool`, optional
+            - whether to yield a text file (utf-8)
+            - the default is `False`
+        - `level`
+            - `int`, optional
+            - compression level
+            - the default is `None`
+                - default level of the respective compression (gzip: 6, zstd: 3)
+
+    Yields
+        - `f`
+            - file object to write to
+    """
+    suffix(compression)  #validate
+    if compression == "gzip":
+        stream = gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6 if level is None else level, mtime=0)
+    elif compression == "zstd":
+        stream = _zstandard().ZstdCompressor(level=3 if level is None else level).stream_writer(raw, closefd=False)
+    else:
+        stream = None
+
+    f = stream if stream is not None else raw
+    if text:
+        f = io.TextIOWrapper(f, encoding="utf-8", newline="")
+    try:
+        yield f
+    finally:
+        if text:
+            f.flush()
+            f.detach()  #keep `stream`/`raw` open
+        if stream is not None:
+            stream.close()
+    return
+
+def open_file(fname:str, mode:str="r") -> IO:
+    """opens a (potentially compressed) `ThumP!` file for reading
+
+    - the compression is inferred from the suffix of `fname`
+
+    Parameters
+        - `fname`
+            - `str`
+            - file to open
+        - `mode`
+            - `str`, optional
+            - `"r"` (text, utf-8) or `"rb"` (binary)
+            - the default is `"r"`
+
+    Returns
+        - `f`
+            - file object to read from
+    """
+    compression = compression_of(fname)
+    if compression == "gzip":
+        f = gzip.open(fname, "rb")
+    elif compression == "zstd":
+        f = _zstandard().ZstdDecompressor().stream_reader(open(fname, "rb"), closefd=True)
+    else:
+        f = open(fname, "rb")
+    return io.TextIOWrapper(f, encoding="utf-8") if mode == "r" else f
@@ -0,0 +1,313 @@
+"""binary container for `ThumP!` files
+
+- alternative to the json files that is an order of magnitude smaller and faster to parse
+    - thumbnails are stored as raw little-endian typed arrays (integers or `float32`)
+    - everything else (`link`, `thumbnailTypes`, auxiliary columns) is stored in a small json header
+- loaded in the browser by `readThumpFile()` in `scripts/ui/io.js`
+    - produces the same in-memory objects as parsing the json files
+- layout (`.thump`)
+    - 4 bytes magic (`THMP`)
+    - `uint32` format version
+    - `uint32` length of the header in bytes
+    - utf-8 json header (padded with spaces to a multiple of 4 bytes)
+        - `{"objects": {objectId: {..., "thumbnails": [array info, ...]}}}`
+        - array info: `dtype` (`u1`, `i2`, `u2`, `f4`), `offset` (bytes from the start of the data section), `decimals`
+            - and `shape` (`[nrows,ncols]`) for rectangular thumbnails
+            - or `rows` (length of every row) for ragged thumbnails (i.e., series in the examples)
+    - data section (every array aligned to 4 bytes)
+- integer types store `round(value * 10**decimals)`
+    - the smallest of `uint8`, `int16`, `uint16` that fits the thumbnail is used
+        - i.e., quantized thumbnails (see `thump.data.preprocessing`) take 1 or 2 bytes per pixel
+    - the largest `uint8`/`uint16` and the smallest `int16` value encode `null` (NaN and other non-finite values)
+    - thumbnails whose values do not fit fall back to `float32`
+
+Exceptions
+
+Classes
+
+Functions
+    - `encode_object()` -- encode a single object into its header entry and data
+    - `decode_object()` -- decode a single object from its header entry and data
+    - `write()` -- write encoded objects to a container
+    - `dump()` -- write objects in `ThumP!` format to a container
+    - `dumps()` -- encode objects in `ThumP!` format as a container
+    - `load()` -- read a container
+    - `keys()` -- read the object ids of a container (header only)
+    - `read_header()` -- read the header of a container
+
+Other Objects
+    - `EXTENSION` -- file extension of containers
+"""
+
+#%%imports
+import io
+import json
+import numpy as np
+from typing import Any, BinaryIO, Dict, Iterable, List, Tuple
+
+from thump.data import encoding as thden
+
+#%%definitions
+MAGIC       = b"THMP"
+VERSION     = 1
+EXTENSION   = ".thump"
+_NULLS      = {"u1":np.iinfo(np.uint8).max, "i2":np.iinfo(np.int16).min, "u2":np.iinfo(np.uint16).max}  #sentinels for `null` in integer arrays
+_ALIGN      = 4
+
+def _as_rows(thumbnail:Any) -> Tuple[np.ndarray,dict]:
+    """flattens `thumbnail` and returns it together with its geometry (`shape` or `rows`)"""
+    if isinstance(thumbnail, np.ndarray) and (thumbnail.ndim == 2):
+        return thumbnail.astype(np.float64, copy=False).ravel(), dict(shape=list(thumbnail.shape))
+    rows = [np.asarray(r, dtype=np.float64).ravel() for r in thumbnail]
+    lengths = [len(r) for r in rows]
+    flat = np.concatenate(rows) if len(rows) > 0 else np.empty(0)
+    if len(set(lengths)) <= 1:
+        return flat, dict(shape=[len(rows), lengths[0] if len(rows) > 0 else 0])
+    return flat, dict(rows=lengths)
+
+def _encode_array(thumbnail:Any, decimals:int, dtype:str) -> Tuple[dict,bytes]:
+    """encodes a single thumbnail"""
+    flat, info = _as_rows(thumbnail)
+    finite = np.isfinite(flat)
+    if (dtype == "int16") and (decimals is not None):
+        scaled = np.round(flat * 10.0**decimals)
+        lo, hi = (scaled[finite].min(), scaled[finite].max()) if finite.any() else (0, 0)
+        for code, (vmin, vmax) in [("u1", (0, 254)), ("i2", (-32767, 32767)), ("u2", (0, 65534))]:
+            if (vmin <= lo) and (hi <= vmax):
+                data = np.where(finite, scaled, _NULLS[code]).astype("<" + code)
+                return dict(dtype=code, decimals=decimals, **info), data.tobytes()
+    data = np.where(finite, flat if decimals is None else np.round(flat, decimals), np.nan).astype("<f4")
+    return dict(dtype="f4", decimals=decimals, **info), data.tobytes()
+
+def encode_object(obj:dict, decimals:int=1, dtype:str="int16") -> Tuple[dict,bytes]:
+    """encodes a single object into its header entry and data
+
+    Parameters
+        - `obj`
+            - `dict`
+            - single object in `ThumP!` format
+                - i.e., `{"link":..., "thumbnailTypes":..., "thumbnails":..., ...}`
+        - `decimals`
+            - `int`, optional
+            - number of decimals to keep for thumbnails
+            - `None` keeps full `float32` precision
+            - the default is `1`
+        - `dtype`
+            - `str`, optional
+            - storage type of the thumbnails
+            - one of `"int16"`, `"float32"`
+            - `"int16"` uses the smallest integer type that fits (`uint8`, `int16`, `uint16`)
+                - and falls back to `"float32"` for thumbnails whose values do not fit
+            - the default is `"int16"`
+
+    Raises
+        - `ValueError`
+            - if `dtype` is not supported
+
+    Returns
+        - `meta`
+            - `dict`
+            - header entry of `obj`
+            - array offsets are relative to the start of `blob`
+        - `blob`
+            - `bytes`
+            - data of all thumbnails of `obj`
+    """
+    if dtype not in ("int16", "float32"):
+        raise ValueError(f"`dtype` has to be one of 'int16', 'float32' but is {dtype!r}")
+
+    meta = dict(obj)    #keeps the position of `thumbnails`
+    infos, parts = [], []
+    offset = 0
+    for thumbnail in obj.get("thumbnails", []):
+        info, data = _encode_array(thumbnail, decimals, dtype)
+        info["offset"] = offset
+        data += b"\x00" * (-len(data) % _ALIGN)
+        offset += len(data)
+        infos.append(info)
+        parts.append(data)
+    meta["thumbnails"] = infos
+
+    return meta, b"".join(parts)
+
+def write(f:BinaryIO, objs:Iterable[Tuple[str,dict,bytes]]) -> List[Tuple[int,int]]:
+    """writes encoded objects to a container
+
+    Parameters
+        - `f`
+            - `BinaryIO`
+            - file to write to
+        - `objs`
+            - `Iterable[Tuple[str,dict,bytes]]`
+            - `(objectId, meta, blob)` as returned by `encode_object()`
+
+    Returns
+        - `spans`
+            - `List[Tuple[int,int]]`
+            - `(offset, length)` of the data of every object in bytes from the start of the container
+            - same order as `objs`
+    """
+    header, blobs = dict(), []
+    base = 0
+    for key, meta, blob in objs:
+        header[str(key)] = dict(meta, thumbnails=[dict(info, offset=info["offset"] + base) for info in meta["thumbnails"]])
+        blobs.append(blob)
+        base += len(blob)
+
+    text = thden.dumps(dict(objects=header)).encode("utf-8")
+    text += b" " * (-len(text) % _ALIGN)
+
+    f.write(MAGIC)
+    f.write(np.array([VERSION, len(text)], dtype="<u4").tobytes())
+    f.write(text)
+    spans = []
+    pos = 12 + len(text)
+    for blob in blobs:
+        f.write(blob)
+        spans.append((pos, len(blob)))
+        pos += len(blob)
+    return spans
+
+def dump(objs:Dict[str,dict], f:BinaryIO, decimals:int=1, dtype:str="int16"):
+    """writes objects in `ThumP!` format to a container
+
+    Parameters
+        - `objs`
+            - `Dict[str,dict]`
+            - objects in `ThumP!` format (objectId -> object)
+        - `f`
+            - `BinaryIO`
+            - file to write to
+        - `decimals`
+            - `int`, optional
+            - number of decimals to keep for thumbnails
+            - the default is `1`
+        - `dtype`
+            - `str`, optional
+            - storage type of the thumbnails
+            - the default is `"int16"`
+    """
+    write(f, ((k, *encode_object(v, decimals=decimals, dtype=dtype)) for k, v in objs.items()))
+    return
+
+def dumps(objs:Dict[str,dict], decimals:int=1, dtype:str="int16") -> bytes:
+    """same as `dump()` but returns the container as `bytes`"""
+    buf = io.BytesIO()
+    dump(objs, buf, decimals=decimals, dtype=dtype)
+    return buf.getvalue()
+
+def _decode_array(data:memoryview, info:dict) -> Any:
+    """decodes a single thumbnail"""
+    rows:List[int] = info["rows"] if "rows" in info else [info["shape"][1]] * info["shape"][0]
+    arr = np.frombuffer(data, dtype="<" + info["dtype"], count=sum(rows), offset=info["offset"])
+    if info["dtype"] in _NULLS:
+        arr = np.where(arr == _NULLS[info["dtype"]], np.nan, arr / 10.0**info["decimals"])
+    else:
+        arr = arr.astype(np.float64)
+    if "rows" in info:
+        return np.split(arr, np.cumsum(rows)[:-1])
+    return arr.reshape(info["shape"])
+
+def decode_object(meta:dict, blob:bytes) -> dict:
+    """decodes a single object from its header entry and data
+
+    - inverse of `encode_object()`
+
+    Parameters
+        - `meta`
+            - `dict`
+            - header entry of the object
+        - `blob`
+            - `bytes`
+            - data the array offsets in `meta` refer to
+
+    Returns
+        - `obj`
+            - `dict`
+            - object in `ThumP!` format
+            - rectangular thumbnails are `np.ndarray`, ragged ones lists of `np.ndarray`
+            - `null` is returned as NaN
+    """
+    data = memoryview(blob)
+    return dict(meta, thumbnails=[_decode_array(data, info) for info in meta["thumbnails"]])
+
+def _read_header(buf:bytes) -> Tuple[dict,int]:
+    """parses the header at the start of `buf` and returns it together with its length in bytes"""
+    if buf[:4] != MAGIC:
+        raise ValueError("not a `ThumP!` container")
+    version, length = np.frombuffer(buf[:12], dtype="<u4", count=2, offset=4)
+    if version != VERSION:
+        raise ValueError(f"unsupported container version {version} (expected {VERSION})")
+    if len(buf) < 12 + length:
+        raise ValueError("truncated `ThumP!` container")
+    return json.loads(buf[12:12+length].decode("utf-8")), int(length)
+
+def load(f:BinaryIO) -> Dict[str,dict]:
+    """reads a container
+
+    Parameters
+        - `f`
+            - `BinaryIO`
+            - file to read from
+
+    Raises
+        - `ValueError`
+            - if `f` is not a container or has an unsupported version
+
+    Returns
+        - `objs`
+            - `Dict[str,dict]`
+            - objects in `ThumP!` format
+            - rectangular thumbnails are `np.ndarray`, ragged ones lists of `np.ndarray`
+            - `null` is returned as NaN
+    """
+    buf = f.read()
+    header, length = _read_header(buf)
+    data = memoryview(buf)[12+length:]
+
+    return {k:decode_object(meta, data) for k, meta in header["objects"].items()}
+
+def keys(f:BinaryIO) -> List[str]:
+    """reads the object ids of a container
+
+    - only reads the header (the thumbnails are skipped)
+
+    Parameters
+        - `f`
+            - `BinaryIO`
+            - file to read from
+
+    Returns
+        - `keys`
+            - `List[str]`
+            - object ids in the container
+    """
+    header, _ = read_header(f)
+    return list(header["objects"].keys())
+
+def read_header(f:BinaryIO) -> Tuple[dict,int]:
+    """reads the header of a container
+
+    - leaves `f` positioned at the start of the data section
+
+    Parameters
+        - `f`
+            - `BinaryIO`
+            - file to read from
+
+    Raises
+        - `ValueError`
+            - if `f` is not a container or has an unsupported version
+
+    Returns
+        - `header`
+            - `dict`
+            - parsed json header
+        - `start`
+            - `int`
+            - offset of the data section in bytes from the start of the container
+    """
+    start = f.read(12)
+    length = int(np.frombuffer(start, dtype="<u4", count=1, offset=8)[0]) if len(start) == 12 else 0
+    header, _ = _read_header(start + f.read(length))
+    return header, 12 + length
@@ -0,0 +1,190 @@
+"""numpy-aware json encoding of `ThumP!` files
+
+- writes float arrays (thumbnails) straight to json text
+    - no intermediate object arrays or nested python lists
+    - NaN (and other non-finite values) are written as `null`
+    - values are written with a fixed number of decimals
+- supports a compact and a pretty layout
+    - the pretty layout puts every row of a thumbnail on its own line
+
+Exceptions
+
+Classes
+
+Functions
+    - `encode_array()` -- encode a numerical array as json text
+    - `dumps()` -- encode an object containing arrays as json text
+    - `dump()` -- write an object containing arrays as json to a file
+
+Other Objects
+"""
+
+#%%imports
+from functools import lru_cache
+import json
+import numpy as np
+from typing import Any, Iterator, TextIO
+
+#%%definitions
+@lru_cache(maxsize=128)
+def _row_template(ncols:int, decimals:int) -> str:
+    """template formatting a single row of `ncols` values"""
+    return "[" + ",".join([_value_format(decimals)]*ncols) + "]"
+
+def _value_format(decimals:int) -> str:
+    """format of a single value (shortest round-tripping representation if `decimals` is `None`)"""
+    return "%r" if decimals is None else f"%.{decimals:d}f"
+
+def encode_array(arr:np.ndarray, decimals:int=1, indent:int=None, level:int=0) -> str:
+    """encodes a numerical array as json text
+
+    - formats all values with a single c-level string formatting call
+    - non-finite values are encoded as `null`
+
+    Parameters
+        - `arr`
+            - `np.ndarray`
+            - array to encode
+            - can have any number of dimensions
+        - `decimals`
+            - `int`, optional
+            - number of decimals to write
+            - `None` writes the shortest representation that round-trips (same as `json`)
+            - the default is `1`
+        - `indent`
+            - `int`, optional
+            - indentation of the pretty layout
+            - every row (last axis) is written on its own line
+            - the default is `None`
+                - compact layout
+        - `level`
+            - `int`, optional
+            - nesting level of `arr` in the encoded object
+            - only relevant if `indent` is set
+            - the default is `0`
+
+    Returns
+        - `text`
+            - `str`
+            - json encoding of `arr`
+    """
+    arr = np.asarray(arr, dtype=np.float64)
+    if arr.ndim == 0:
+        return (_value_format(decimals) % float(arr)) if np.isfinite(arr) else "null"
+    if arr.size == 0:
+        return "[]"
+    arr = np.where(np.isfinite(arr), arr, np.nan)   #inf is not supported in json either
+
+    #template for all rows
+    row = _row_template(arr.shape[-1], decimals)
+    if arr.ndim == 1:
+        template = row
+    else:
+        template = row
+        for d, n in enumerate(arr.shape[-2::-1]):
+            if indent is None:
+                sep, open_, close = ",", "[", "]"
+            else:
+                inner = " " * (indent * (level + arr.ndim - 1 - d))
+                outer = " " * (indent * (level + arr.ndim - 2 - d))
+                sep, open_, close = f",\n{inner}", f"[\n{inner}", f"\n{outer}]"
+            template = open_ + sep.join([template]*n) + close
+
+    text = template % tuple(arr.ravel().tolist())
+
+    return text.replace("nan", "null")
+
+def _iterencode(obj:Any, decimals:int, indent:int, level:int) -> Iterator[str]:
+    """generates the json encoding of `obj` piece by piece"""
+    if isinstance(obj, np.ndarray) and (obj.dtype.kind in "fiu"):
+        yield encode_array(obj, decimals=decimals, indent=indent, level=level)
+    elif isinstance(obj, dict):
+        if len(obj) == 0:
+            yield "{}"
+            return
+        if indent is None:
+            sep, open_, close, colon = ",", "{", "}", ":"
+        else:
+            sep, open_, close, colon = ",\n" + " "*(indent*(level+1)), "{\n" + " "*(indent*(level+1)), "\n" + " "*(indent*level) + "}", ": "
+        yield open_
+        for i, (k, v) in enumerate(obj.items()):
+            if i > 0: yield sep
+            yield json.dumps(k if isinstance(k, str) else str(k)) + colon
+            yield from _iterencode(v, decimals, indent, level+1)
+        yield close
+    elif isinstance(obj, (list, tuple)) and any(isinstance(o, (np.ndarray, dict, list, tuple)) for o in obj):
+        if indent is None:
+            sep, open_, close = ",", "[", "]"
+        else:
+            sep, open_, close = ",\n" + " "*(indent*(level+1)), "[\n" + " "*(indent*(level+1)), "\n" + " "*(indent*level) + "]"
+        yield open_
+        for i, o in enumerate(obj):
+            if i > 0: yield sep
+            yield from _iterencode(o, decimals, indent, level+1)
+        yield close
+    elif isinstance(obj, np.generic):
+        yield json.dumps(obj.item())
+    elif isinstance(obj, float) and not np.isfinite(obj):
+        yield "null"
+    else:
+        yield json.dumps(obj, separators=(",", ":") if indent is None else (", ", ": "))
+
+def dumps(obj:Any, decimals:int=1, indent:int=None, level:int=0) -> str:
+    """encodes an object containing arrays as json text
+
+    - `np.ndarray` are encoded via `encode_array()`
+    - everything else is encoded via `json`
+
+    Parameters
+        - `obj`
+            - `Any`
+            - object to encode
+            - i.e., `dict` in `ThumP!` format
+        - `decimals`
+            - `int`, optional
+            - number of decimals to write for arrays
+            - the default is `1`
+        - `indent`
+            - `int`, optional
+            - indentation of the pretty layout
+            - the default is `None`
+                - compact layout
+        - `level`
+            - `int`, optional
+            - nesting level of `obj`
+            - used to encode fragments that get embedded into a larger (pretty) json file
+            - the default is `0`
+
+    Returns
+        - `text`
+            - `str`
+            - json encoding of `obj`
+    """
+    return "".join(_iterencode(obj, decimals, indent, level))
+
+def dump(obj:Any, f:TextIO, decimals:int=1, indent:int=None):
+    """writes an object containing arrays as json to `f`
+
+    - same as `dumps()` but writes to `f` piece by piece
+
+    Parameters
+        - `obj`
+            - `Any`
+            - object to encode
+            - i.e., `dict` in `ThumP!` format
+        - `f`
+            - `TextIO`
+            - file to write to
+        - `decimals`
+            - `int`, optional
+            - number of decimals to write for arrays
+            - the default is `1`
+        - `indent`
+            - `int`, optional
+            - indentation of the pretty layout
+            - the default is `None`
+                - compact layout
+    """
+    for chunk in _iterencode(obj, decimals, indent, 0):
+        f.write(chunk)
+    return
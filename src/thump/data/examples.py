@@ -1,40 +1,347 @@
+"""synthetic data to test `ThumP!`
+
+- `make_examples()` generates `ThumP!` files with series-style thumbnails
+    - every thumbnail is a list of `x`, `y` series of random length
+- `make_alerts()` generates lsst-like alert packages as downloaded via fink datatransfer
+    - parquet files with the columns used by `thump.fink_lsst.process_data` (see `COLUMNS` there)
+        - `cutoutScience`, `cutoutTemplate`, `cutoutDifference` as FITS files (float32 primary HDU)
+        - `diaSource` (`diaSourceId`, `midpointMjdTai`, `ra`, `dec`, `psfFlux`, `psfFluxErr`, `band`)
+        - `diaObject` (`diaObjectId`, `ra`, `dec`)
+    - several sources per object (repeat detections of the same position)
+    - written in row groups of bounded size (millions of alerts per file do not have to fit into memory)
+    - allows stress-testing the datatransfer and stream paths without network access
+- both are
+    - vectorized (no per-pixel or per-series python loops)
+    - seedable
+        - every file gets its own `np.random.SeedSequence` spawned from `seed`
+        - i.e., the output does not depend on `njobs`
+    - parallel over files (`joblib`)
+
+Exceptions
+
+Classes
+
+Functions
+    - `make_series()` -- generate random series
+    - `make_cutouts()` -- generate synthetic science, template and difference images
+    - `encode_fits()` -- encode a stack of images as FITS files
+    - `make_examples()` -- write `ThumP!` files with series-style thumbnails
+    - `make_alerts()` -- write synthetic lsst-like alert packages
+
+Other Objects
+"""
 
 #%%imports
-import json
+from astropy.io import fits
+from joblib import Parallel, delayed
 import numpy as np
+import os
+import pyarrow as pa
+import pyarrow.parquet as pq
+from typing import List, Tuple
+
+from thump.data import container as thct
+from thump.data import encoding as thden
+from thump.data import filelog as thfl
 
 #%%definitions
-def make_examples(
-    nfiles=5,
-    nobj_per_file=100,
-    ):
+_BANDS  = np.array(["u", "g", "r", "i", "z", "y"])
+
+def make_series(rng:np.random.Generator, n:int, minlen:int=10, maxlen:int=50) -> Tuple[List[np.ndarray],List[np.ndarray]]:
+    """generates `n` random (noisy, sinusoidal) series of random length
+
+    Parameters
+        - `rng`
+            - `np.random.Generator`
+            - random number generator to use
+        - `n`
+            - `int`
+            - number of series
+        - `minlen`
+            - `int`, optional
+            - minimum length of a series
+            - the default is `10`
+        - `maxlen`
+            - `int`, optional
+            - maximum length of a series (exclusive)
+            - the default is `50`
+
+    Returns
+        - `x`
+            - `List[np.ndarray]`
+            - x-values of every series
+        - `y`
+            - `List[np.ndarray]`
+            - y-values of every series (normalized to a maximum of 1)
+    """
+    lengths = rng.integers(minlen, maxlen, size=n)
+    periods = rng.integers(5, 20, size=n)
+    starts = np.cumsum(lengths) - lengths
+    x = np.arange(lengths.sum()) - np.repeat(starts, lengths)
+    y = rng.random(len(x)) * np.sin(x * 2*np.pi / np.repeat(periods, lengths)) + 0.01*rng.standard_normal(len(x))
+    y /= np.repeat(np.maximum.reduceat(y, starts), lengths)
+    return np.split(x, starts[1:]), np.split(y, starts[1:])
+
+def make_cutouts(rng:np.random.Generator, n:int, npix:int=30) -> Tuple[np.ndarray,np.ndarray,np.ndarray]:
+    """generates synthetic science, template and difference images
+
+    - gaussian point source in the center on top of a noisy background
+    - the source brightens by a random amount between template and science image
+
+    Parameters
+        - `rng`
+            - `np.random.Generator`
+            - random number generator to use
+        - `n`
+            - `int`
+            - number of alerts
+        - `npix`
+            - `int`, optional
+            - side length of every image
+            - the default is `30`
+
+    Returns
+        - `science`, `template`, `difference`
+            - `np.ndarray`
+            - images of shape `(n, npix, npix)` (`float32`)
+    """
+    yy, xx = np.mgrid[:npix,:npix] - (npix - 1) / 2
+    sigma = rng.uniform(1.0, 2.5, size=(n,1,1))
+    psf = np.exp(-(xx**2 + yy**2) / (2*sigma**2)) / (2*np.pi*sigma**2)
+    background = rng.uniform(50, 150, size=(n,1,1))
+    flux_template = rng.lognormal(6, 1, size=(n,1,1))
+    flux_science = flux_template + rng.lognormal(6, 1.5, size=(n,1,1))
+
+    template = background + flux_template*psf + rng.standard_normal((n,npix,npix)) * 5
+    science = background + flux_science*psf + rng.standard_normal((n,npix,npix)) * 10
+    difference = science - template
+    return science.astype(np.float32), template.astype(np.float32), difference.astype(np.float32)
+
+def encode_fits(imgs:np.ndarray) -> pa.Array:
+    """encodes a stack of images as FITS files (single primary HDU each)
 
+    - the header is generated once (via `astropy.io.fits`) and shared by all images
+    - the images are converted to big-endian `float32` in a single pass
+
+    Parameters
+        - `imgs`
+            - `np.ndarray`
+            - images of shape `(n, H, W)`
+
+    Returns
+        - `encoded`
+            - `pa.Array`
+            - FITS file of every image (`pa.binary()`)
+    """
+    n, h, w = imgs.shape
+    header = np.frombuffer(fits.PrimaryHDU(np.zeros((h, w), dtype=np.float32)).header.tostring().encode("ascii"), dtype=np.uint8)
+    data = np.ascontiguousarray(imgs, dtype=">f4").reshape(n, -1).view(np.uint8)
+    size = len(header) + data.shape[1]
+    size += -size % 2880    #FITS block size
+    buf = np.zeros((n, size), dtype=np.uint8)
+    buf[:,:len(header)] = header
+    buf[:,len(header):len(header)+data.shape[1]] = data
+    return pa.FixedSizeBinaryArray.from_buffers(pa.binary(size), n, [None, pa.py_buffer(buf)]).cast(pa.binary())
+
+def _make_examples_file(fname:str, nobj:int, fmt:str, seed:np.random.SeedSequence):
+    """writes a single file of `make_examples()`"""
+    rng = np.random.default_rng(seed)
     maxthumbnails = 4   #maximum number of thumbnails per object
     maxseries = 7       #maximum number of series per thumbnail
 
-    for f in range(nfiles):
-        file = dict()
-        for o in range(nobj_per_file):
-            thumbnails = []
-            for _ in range(maxthumbnails):
-                thumbnail = []
-                for _ in range(maxseries):
-                    xi = np.arange(np.random.randint(10, 50))
-                    yi = np.random.rand(*xi.shape) * np.sin(xi * 2*np.pi / np.random.randint(5, 20)) + 0.01*np.random.randn(*xi.shape)
-                    yi /= yi.max()
-                    thumbnail.append(xi.tolist())
-                    thumbnail.append(yi.tolist())
-                thumbnails.append(thumbnail)
-
-            nthumbnails = slice(0, np.random.randint(1,maxthumbnails))  #actual number of thumbnails
-            file[f"file{f}_obj{o}"] = dict(
-                #required fields
-                link="https://lukassteinwender.com",
-                thumbnailTypes=[f"thumbnail{i}" for i in range(maxthumbnails)][nthumbnails],
-                thumbnails=thumbnails[nthumbnails],
-                #auxiliary fields
-                comment="a test-file. shall not contain commas!",
-                aux_col="auxiliary column. shall not contain commas!"
-            )
-        with open(f"./data/examples/example{f:02d}.json", "w") as f:
-            json.dump(file, f, indent=2)
+    x, y = make_series(rng, nobj*maxthumbnails*maxseries)
+    nthumbnails = rng.integers(1, maxthumbnails, size=nobj)    #actual number of thumbnails
+    file = dict()
+    for o in range(nobj):
+        thumbnails = []
+        for t in range(nthumbnails[o]):
+            start = (o*maxthumbnails + t) * maxseries
+            thumbnails.append([s for i in range(start, start + maxseries) for s in (x[i], y[i])])
+        file[f"{os.path.basename(fname).split('.')[0]}_obj{o}"] = dict(
+            #required fields
+            link="https://lukassteinwender.com",
+            thumbnailTypes=[f"thumbnail{i}" for i in range(nthumbnails[o])],
+            thumbnails=thumbnails,
+            #auxiliary fields
+            comment="a test-file. shall not contain commas!",
+            aux_col="auxiliary column. shall not contain commas!"
+        )
+    if fmt == "binary":
+        with open(fname, "wb") as f:
+            thct.dump(file, f, decimals=None, dtype="float32")
+    else:
+        with open(fname, "w") as f:
+            thden.dump(file, f, decimals=None, indent=2)
+    return
+
+def make_examples(
+    nfiles:int=5,
+    nobj_per_file:int=100,
+    fmt:str="json",
+    save_dir:str="./data/examples/",
+    seed:int=None,
+    njobs:int=1,
+    ) -> List[str]:
+    """writes `ThumP!` files with series-style thumbnails
+
+    Parameters
+        - `nfiles`
+            - `int`, optional
+            - number of files to generate
+            - the default is `5`
+        - `nobj_per_file`
+            - `int`, optional
+            - number of objects per file
+            - the default is `100`
+        - `fmt`
+            - `str`, optional
+            - `"json"` writes `example{NN}.json`
+            - `"binary"` writes `example{NN}.thump` (see `thump.data.container`)
+            - the default is `"json"`
+        - `save_dir`
+            - `str`, optional
+            - directory to save the files to
+            - created if it does not exist
+            - the default is `"./data/examples/"`
+        - `seed`
+            - `int`, optional
+            - seed of the random number generator
+            - the default is `None`
+                - random output
+        - `njobs`
+            - `int`, optional
+            - number of files to generate in parallel
+            - the default is `1`
+
+    Returns
+        - `fnames`
+            - `List[str]`
+            - generated files
+    """
+    os.makedirs(save_dir, exist_ok=True)
+    seeds = np.random.SeedSequence(seed).spawn(nfiles)
+    fnames = [os.path.join(save_dir, f"example{f:02d}{thct.EXTENSION if fmt == 'binary' else '.json'}") for f in range(nfiles)]
+    Parallel(n_jobs=njobs)(delayed(_make_examples_file)(fn, nobj_per_file, fmt, s) for fn, s in zip(fnames, seeds))
+    return fnames
+
+def _alert_batch(rng:np.random.Generator, first_source:int, first_object:int, n:int, npix:int, repeats:float, null_fraction:float, mjd_start:float) -> Tuple[pa.Table,int]:
+    """generates `n` alerts (diaSourceIds from `first_source`, diaObjectIds from `first_object`)"""
+    #objects with a random number of sources each
+    nsources = 1 + rng.poisson(max(repeats - 1, 0), size=n)
+    nsources = nsources[:np.searchsorted(np.cumsum(nsources), n) + 1]
+    nsources[-1] -= nsources.sum() - n
+    nobjects = len(nsources)
+    obj_ra = rng.uniform(0, 360, size=nobjects)
+    obj_dec = np.degrees(np.arcsin(rng.uniform(-1, 0.5, size=nobjects)))    #southern sky (and a bit of the northern)
+    obj = np.repeat(np.arange(nobjects), nsources)
+
+    #sources scattered around their object
+    jitter = 0.1 / 3600
+    ra = (obj_ra[obj] + rng.normal(0, jitter, size=n) / np.cos(np.radians(obj_dec[obj]))) % 360
+    dec = np.clip(obj_dec[obj] + rng.normal(0, jitter, size=n), -90, 90)
+    science, template, difference = make_cutouts(rng, n, npix)
+    flux = difference.sum(axis=(1,2)).astype(np.float64)
+
+    object_ids = pa.array(first_object + obj, type=pa.int64(), mask=rng.random(n) < null_fraction)
+    table = pa.table({
+        "cutoutScience":    encode_fits(science),
+        "cutoutTemplate":   encode_fits(template),
+        "cutoutDifference": encode_fits(difference),
+        "diaSource":        pa.StructArray.from_arrays([
+            pa.array(first_source + np.arange(n), type=pa.int64()),
+            pa.array(mjd_start + np.sort(rng.random(n)) * 0.4),
+            pa.array(ra), pa.array(dec),
+            pa.array(flux), pa.array(np.sqrt(np.abs(flux)) + 10),
+            pa.array(_BANDS[rng.integers(0, len(_BANDS), size=n)]),
+        ], names=["diaSourceId", "midpointMjdTai", "ra", "dec", "psfFlux", "psfFluxErr", "band"]),
+        "diaObject":        pa.StructArray.from_arrays([
+            object_ids, pa.array(obj_ra[obj]), pa.array(obj_dec[obj]),
+        ], names=["diaObjectId", "ra", "dec"]),
+    })
+    return table, nobjects
+
+def _make_alerts_file(fname:str, fidx:int, nalerts:int, npix:int, repeats:float, null_fraction:float, row_group_size:int, seed:np.random.SeedSequence):
+    """writes a single file of `make_alerts()`"""
+    rng = np.random.default_rng(seed)
+    writer = None
+    first_object = fidx * nalerts
+    with thfl.atomic_open(fname, "wb") as f:
+        for start in range(0, nalerts, row_group_size):
+            n = min(row_group_size, nalerts - start)
+            table, nobjects = _alert_batch(rng, fidx*nalerts + start, first_object, n, npix, repeats, null_fraction, mjd_start=61000 + fidx)
+            first_object += nobjects
+            if writer is None: writer = pq.ParquetWriter(f, table.schema)
+            writer.write_table(table, row_group_size=row_group_size)
+        if writer is not None: writer.close()
+    return
+
+def make_alerts(
+    nfiles:int=1,
+    nalerts_per_file:int=1000,
+    save_dir:str="./data/synthetic/",
+    npix:int=30,
+    repeats:float=1.5,
+    null_fraction:float=0.0,
+    row_group_size:int=1000,
+    seed:int=None,
+    njobs:int=1,
+    ) -> List[str]:
+    """writes synthetic lsst-like alert packages (parquet) as downloaded via fink datatransfer
+
+    - files are called `alerts_{NNNN}.parquet`
+    - every file covers a different night (`midpointMjdTai`)
+
+    Parameters
+        - `nfiles`
+            - `int`, optional
+            - number of files to generate
+            - the default is `1`
+        - `nalerts_per_file`
+            - `int`, optional
+            - number of alerts per file
+            - the default is `1000`
+        - `save_dir`
+            - `str`, optional
+            - directory to save the files to
+            - created if it does not exist
+            - the default is `"./data/synthetic/"`
+        - `npix`
+            - `int`, optional
+            - side length of the cutouts
+            - the default is `30`
+        - `repeats`
+            - `float`, optional
+            - mean number of sources per object
+            - the default is `1.5`
+        - `null_fraction`
+            - `float`, optional
+            - fraction of alerts without `diaObjectId` (filtered by `thump.fink_lsst.process_data.read_files()`)
+            - the default is `0.0`
+        - `row_group_size`
+            - `int`, optional
+            - number of alerts per row group
+            - also the number of alerts held in memory at once
+            - the default is `1000`
+        - `seed`
+            - `int`, optional
+            - seed of the random number generator
+            - the default is `None`
+                - random output
+        - `njobs`
+            - `int`, optional
+            - number of files to generate in parallel
+            - the default is `1`
+
+    Returns
+        - `fnames`
+            - `List[str]`
+            - generated files
+    """
+    os.makedirs(save_dir, exist_ok=True)
+    seeds = np.random.SeedSequence(seed).spawn(nfiles)
+    fnames = [os.path.join(save_dir, f"alerts_{f:04d}.parquet") for f in range(nfiles)]
+    Parallel(n_jobs=njobs)(
+        delayed(_make_alerts_file)(fn, f, nalerts_per_file, npix, repeats, null_fraction, row_group_size, s)
+        for f, (fn, s) in enumerate(zip(fnames, seeds))
+    )
+    return fnames
@@ -0,0 +1,177 @@
+"""durable bookkeeping of processed files
+
+- `atomic_open()` writes files atomically
+    - written to a hidden temporary file, synced to disk and renamed
+    - readers never see partially written files
+    - a crash leaves either the old or the new version behind
+- `FileLog` records which input files have been processed already
+    - files are identified by their absolute path
+    - a file counts as changed if its size, modification time or (optionally) content hash differ
+    - shared by `thump.fink_lsst.manifest.Manifest`, `thump.data.inspected.InspectedStore` and `thump.data.verdicts.VerdictDataset`
+- only depends on the standard library, i.e., cheap to import for command line tools
+
+Exceptions
+
+Classes
+    - `FileLog` -- persistent log of processed files keyed by path, size and modification time
+
+Functions
+    - `atomic_open()` -- context manager to write a file atomically
+
+Other Objects
+"""
+
+#%%imports
+from contextlib import contextmanager
+import hashlib
+import json
+import os
+from typing import Dict
+
+#%%definitions
+@contextmanager
+def atomic_open(fname:str, mode:str="w"):
+    """context manager to write a file atomically
+
+    - writes to a hidden temporary file in the same directory
+        - `{dir}/.{basename}.tmp`, i.e. not matched by glob patterns like `reformatted*.json`
+    - the temporary file is synced to disk and renamed to `fname` upon exit
+    - the temporary file is removed if an exception is raised
+
+    Parameters
+        - `fname`
+            - `str`
+            - file to write
+        - `mode`
+            - `str`, optional
+            - mode to open the file in
+            - the default is `"w"`
+
+    Yields
+        - `f`
+            - file object to write to
+    """
+    dirname, basename = os.path.split(fname)
+    tmp = os.path.join(dirname, f".{basename}.tmp")
+    try:
+        with open(tmp, mode) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, fname)
+    except BaseException:
+        if os.path.isfile(tmp): os.remove(tmp)
+        raise
+    return
+
+class FileLog:
+    """persistent log of processed files keyed by path, size and modification time
+
+    - stored as json in `path`
+        - `files`: absolute path -> `size`, `mtime`, (`sha256`) and additional information passed to `record()`
+        - any other top-level entries are kept in `meta`
+    - written atomically (see `atomic_open()`)
+
+    Attributes
+        - `path`
+            - `str`
+            - file to load the log from and save it to
+        - `checksum`
+            - `bool`, optional
+            - whether to also compare content hashes (sha256)
+            - more robust than size and modification time but requires reading every file
+            - the default is `False`
+        - `files`
+            - `Dict[str,dict]`
+            - recorded files
+        - `meta`
+            - `dict`
+            - additional top-level entries stored alongside `files`
+
+    Methods
+        - `stat()`
+        - `get()`
+        - `changed()`
+        - `record()`
+        - `save()`
+    """
+
+    def __init__(self,
+        path:str,
+        checksum:bool=False,
+        ):
+
+        self.path       = path
+        self.checksum   = checksum
+
+        self.files:Dict[str,dict] = dict()
+        self.meta:dict = dict()
+        if os.path.isfile(self.path):
+            with open(self.path, "r") as f:
+                log = json.load(f)
+            self.files = log.pop("files")
+            self.meta = log
+
+        return
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(\n"
+            f"    path={self.path!r},\n"
+            f"    checksum={self.checksum!r},\n"
+            f")"
+        )
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    @staticmethod
+    def _sha256(fname:str) -> str:
+        h = hashlib.sha256()
+        with open(fname, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        return h.hexdigest()
+
+    def stat(self, fname:str) -> dict:
+        """identifying properties (`size`, `mtime`, optionally `sha256`) of `fname`"""
+        st = os.stat(fname)
+        stat = dict(size=st.st_size, mtime=st.st_mtime)
+        if self.checksum: stat["sha256"] = self._sha256(fname)
+        return stat
+
+    def get(self, fname:str) -> dict:
+        """entry of `fname` (`None` if it has not been recorded)"""
+        return self.files.get(os.path.abspath(fname))
+
+    def changed(self, fname:str) -> bool:
+        """whether `fname` is new or changed since it was recorded"""
+        entry = self.get(fname)
+        if entry is None:
+            return True
+        return any((k in entry) and (entry[k] != v) for k, v in self.stat(fname).items())
+
+    def record(self, fname:str, stat:dict=None, **info):
+        """records `fname` as processed
+
+        Parameters
+            - `fname`
+                - `str`
+                - processed file
+            - `stat`
+                - `dict`, optional
+                - identifying properties of `fname` as returned by `stat()`
+                - pass the properties from before `fname` was read if it might change while being processed
+                - the default is `None`
+                    - determined now
+            - `**info`
+                - additional information to store with the entry (i.e., the chunks or part `fname` ended up in)
+        """
+        self.files[os.path.abspath(fname)] = dict(**(self.stat(fname) if stat is None else stat), **info)
+        return
+
+    def save(self):
+        """writes the log to `path` (atomically)"""
+        with atomic_open(self.path, "w") as f:
+            json.dump(dict(files=self.files, **self.meta), f, indent=2)
+        return
@@ -0,0 +1,304 @@
+"""object-to-file index of `ThumP!` files
+
+- sidecar parquet file for every written chunk
+    - stored in `{chunk directory}/_index/{chunk file name}.parquet`
+        - i.e., `reformatted_0001.json.gz` -> `_index/reformatted_0001.json.gz.parquet`
+    - one sidecar per chunk allows chunks to be written in parallel (no shared file to update)
+    - written whenever a chunk is written (`thump.fink_lsst.process_data.compile_file()`, `thump.fink_lsst.accumulator.ChunkAccumulator`)
+- one row per object with the columns in `SCHEMA`
+    - `offset` and `length` locate the object in the (uncompressed) payload
+        - json: the encoded object (value of `objectId`)
+        - binary containers (`.thump`): the thumbnail data of the object
+    - json files written by `ThumP!` are ascii (`json.dumps()` escapes everything else), hence character and byte offsets coincide
+- the size of the chunk is stored in the key-value metadata of its sidecar (`thump.size`)
+    - a sidecar is outdated (and ignored) if the size of its chunk differs, i.e., the chunk got rewritten without index
+    - does not depend on modification times, i.e., copies (`cp -r`, `rsync` without `-t`) keep their index
+    - sidecars without recorded size fall back to comparing modification times
+- allows looking up, listing and summarizing objects without parsing the (multi-megabyte) payloads
+- sidecars of files written before the index existed can be created via `build()`
+
+Exceptions
+
+Classes
+
+Functions
+    - `fields()` -- index fields of a single object
+    - `sidecar()` -- path of the sidecar of a chunk
+    - `write()` -- write the sidecar of a chunk
+    - `build()` -- create the sidecar of an existing chunk from its payload
+    - `read()` -- read the sidecar of a chunk
+    - `scan()` -- lazily scan the sidecars of all chunks in a directory
+    - `keys()` -- object ids of a chunk (via its sidecar if present)
+    - `lookup()` -- find the files containing some objects
+    - `read_object()` -- read a single object from a chunk via its index entry
+    - `remove()` -- remove a chunk together with its sidecar
+    - `stats()` -- per-file statistics of all indexed chunks in a directory
+
+Other Objects
+    - `INDEX_DIR` -- name of the directory the sidecars are stored in
+    - `SCHEMA` -- columns of the index
+"""
+
+#%%imports
+import glob
+import json
+import logging
+import numpy as np
+import os
+import polars as pl
+from typing import Any, Dict, Iterable, List
+
+from thump.data import compression as thcm
+from thump.data import container as thct
+from thump.data import filelog as thfl
+
+logger = logging.getLogger(__name__)
+
+#%%definitions
+INDEX_DIR   = "_index"
+_SIZE_KEY   = "thump.size"    #parquet metadata key of the size of the chunk
+SCHEMA      = {
+    "objectId":     pl.Utf8,
+    "file":         pl.Utf8,
+    "offset":       pl.Int64,
+    "length":       pl.Int64,
+    "diaObjectId":  pl.Utf8,
+    "mjd":          pl.Float64,
+    "ra":           pl.Float64,
+    "dec":          pl.Float64,
+}
+
+def _float(value:Any) -> float:
+    """`value` as `float` (`None` if missing or not numeric)"""
+    try:
+        return None if value is None else float(value)
+    except (TypeError, ValueError):
+        return None
+
+def fields(obj:dict) -> Dict[str,Any]:
+    """index fields of a single object in `ThumP!` format (`diaObjectId`, `mjd`, `ra`, `dec`)
+
+    - missing fields are `None`
+    """
+    return dict(
+        diaObjectId=None if obj.get("diaObjectId") is None else str(obj["diaObjectId"]),
+        mjd=_float(obj.get("midpointMjdTai")),
+        ra=_float(obj.get("ra")),
+        dec=_float(obj.get("dec")),
+    )
+
+def sidecar(fname:str) -> str:
+    """path of the sidecar of the chunk `fname`"""
+    return os.path.join(os.path.dirname(fname), INDEX_DIR, os.path.basename(fname) + ".parquet")
+
+def write(fname:str, rows:Iterable[Dict[str,Any]]):
+    """writes the sidecar of the chunk `fname`
+
+    - written atomically (see `thump.data.filelog.atomic_open()`)
+    - has to be called once `fname` is complete (its size is recorded)
+
+    Parameters
+        - `fname`
+            - `str`
+            - chunk the rows refer to
+        - `rows`
+            - `Iterable[Dict[str,Any]]`
+            - one entry per object
+            - `objectId`, `offset`, `length` and the output of `fields()`
+    """
+    path = sidecar(fname)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    df = pl.DataFrame([dict(row, file=os.path.basename(fname)) for row in rows], schema=SCHEMA)
+    with thfl.atomic_open(path, "wb") as f:
+        df.write_parquet(f, metadata={_SIZE_KEY:str(os.path.getsize(fname))})
+    return
+
+def _json_spans(text:str) -> Iterable[tuple]:
+    """`(key, offset, length, obj)` of every top-level entry of a json object"""
+    decoder = json.JSONDecoder()
+    ws = " \t\n\r"
+    pos = text.index("{") + 1
+    while True:
+        while text[pos] in ws + ",": pos += 1
+        if text[pos] == "}": return
+        key, pos = decoder.raw_decode(text, pos)
+        while text[pos] in ws + ":": pos += 1
+        obj, end = decoder.raw_decode(text, pos)
+        yield key, pos, end - pos, obj
+        pos = end
+
+def build(fname:str) -> pl.DataFrame:
+    """creates the sidecar of an existing chunk from its payload
+
+    - parses `fname` once
+    - used to index files written before the index existed
+
+    Parameters
+        - `fname`
+            - `str`
+            - (potentially compressed) `ThumP!` file
+
+    Returns
+        - `index`
+            - `pl.DataFrame`
+            - the written index
+    """
+    rows = []
+    with thcm.open_file(fname, "rb") as f:
+        if thcm.strip_suffix(fname).endswith(thct.EXTENSION):
+            header, start = thct.read_header(f)
+            for k, meta in header["objects"].items():
+                spans = [(info["offset"], np.dtype("<" + info["dtype"]).itemsize * sum(info["rows"] if "rows" in info else [info["shape"][0] * info["shape"][1]])) for info in meta["thumbnails"]]
+                offset = min((o for o, _ in spans), default=0)
+                end = max((o + n for o, n in spans), default=0)
+                rows.append(dict(objectId=k, offset=start + offset, length=end - offset, **fields(meta)))
+        else:
+            for k, offset, length, obj in _json_spans(f.read().decode("utf-8")):
+                rows.append(dict(objectId=k, offset=offset, length=length, **fields(obj)))
+    write(fname, rows)
+    return read(fname)
+
+def _fresh(fname:str) -> bool:
+    """whether the sidecar of `fname` exists and matches `fname` (i.e., the chunk did not get rewritten without index)"""
+    path = sidecar(fname)
+    if not (os.path.isfile(fname) and os.path.isfile(path)):
+        return False
+    size = pl.read_parquet_metadata(path).get(_SIZE_KEY)
+    if size is None:
+        #sidecar written before sizes were recorded
+        return os.path.getmtime(path) >= os.path.getmtime(fname)
+    return int(size) == os.path.getsize(fname)
+
+def read(fname:str) -> pl.DataFrame:
+    """reads the sidecar of the chunk `fname` (`None` if there is none or it is outdated)"""
+    if not _fresh(fname):
+        return None
+    return pl.read_parquet(sidecar(fname))
+
+def scan(dir:str) -> pl.LazyFrame:
+    """lazily scans the sidecars of all chunks in `dir`
+
+    - sidecars of chunks that no longer exist (or got rewritten without index) are ignored
+        - a warning is logged if any sidecar gets ignored
+
+    Parameters
+        - `dir`
+            - `str`
+            - directory containing the chunks
+
+    Returns
+        - `index`
+            - `pl.LazyFrame`
+            - index of all objects in `dir` (columns in `SCHEMA`)
+    """
+    dir = os.path.expanduser(dir)
+    paths = sorted(glob.glob(os.path.join(dir, INDEX_DIR, "*.parquet")))
+    fresh = [p for p in paths if _fresh(os.path.join(dir, os.path.basename(p)[:-len(".parquet")]))]
+    if len(fresh) < len(paths):
+        logger.warning(f"scan(): ignoring {len(paths) - len(fresh)} of {len(paths)} sidecars in {dir} (chunk missing or rewritten without index). recreate them via `build()`")
+    paths = fresh
+    if len(paths) == 0:
+        return pl.LazyFrame(schema=SCHEMA)
+    return pl.scan_parquet(paths)
+
+def keys(fname:str) -> List[str]:
+    """object ids contained in the chunk `fname`
+
+    - read from the sidecar if present
+    - read from the payload otherwise (header only for binary containers)
+    """
+    index = read(fname)
+    if index is not None:
+        return index["objectId"].to_list()
+    with thcm.open_file(fname, "rb") as f:
+        if thcm.strip_suffix(fname).endswith(thct.EXTENSION):
+            return thct.keys(f)
+        return list(json.load(f).keys())
+
+def lookup(dir:str, ids:Iterable[str]) -> pl.DataFrame:
+    """finds the files containing some objects
+
+    Parameters
+        - `dir`
+            - `str`
+            - directory containing the chunks
+        - `ids`
+            - `Iterable[str]`
+            - object ids to look up
+
+    Returns
+        - `found`
+            - `pl.DataFrame`
+            - index entries of all found objects (columns in `SCHEMA`)
+    """
+    ids = [str(i) for i in ids]
+    return scan(dir).filter(pl.col("objectId").is_in(ids)).collect()
+
+def read_object(dir:str, entry:Dict[str,Any]) -> dict:
+    """reads a single object from a chunk via its index entry
+
+    - uncompressed files are read via a single seek
+    - compressed files are decompressed up to the end of the object
+
+    Parameters
+        - `dir`
+            - `str`
+            - directory containing the chunks
+        - `entry`
+            - `Dict[str,Any]`
+            - index entry of the object (i.e., row of `lookup()`)
+
+    Returns
+        - `obj`
+            - `dict`
+            - object in `ThumP!` format
+    """
+    fname = os.path.join(os.path.expanduser(dir), entry["file"])
+    binary = thcm.strip_suffix(fname).endswith(thct.EXTENSION)
+    with thcm.open_file(fname, "rb") as f:
+        header, pos = thct.read_header(f) if binary else (None, 0)
+        if thcm.compression_of(fname) is None:
+            f.seek(entry["offset"])
+        else:
+            skip = entry["offset"] - pos
+            while skip > 0:
+                skip -= len(f.read(min(skip, 1 << 20)))
+        blob = f.read(entry["length"])
+    if binary:
+        meta = header["objects"][entry["objectId"]]
+        base = entry["offset"] - pos
+        return thct.decode_object(dict(meta, thumbnails=[dict(info, offset=info["offset"] - base) for info in meta["thumbnails"]]), blob)
+    return json.loads(blob.decode("utf-8"))
+
+def remove(fname:str):
+    """removes the chunk `fname` together with its sidecar"""
+    os.remove(fname)
+    path = sidecar(fname)
+    if os.path.isfile(path): os.remove(path)
+    return
+
+def stats(dir:str) -> pl.DataFrame:
+    """per-file statistics of all indexed chunks in `dir`
+
+    Parameters
+        - `dir`
+            - `str`
+            - directory containing the chunks
+
+    Returns
+        - `stats`
+            - `pl.DataFrame`
+            - number of objects and distinct `diaObjectId` as well as the covered `mjd` range of every file
+    """
+    return (
+        scan(dir)
+        .group_by("file")
+        .agg(
+            pl.len().alias("nobjects"),
+            pl.col("diaObjectId").n_unique().alias("ndiaobjects"),
+            pl.col("mjd").min().alias("mjd_min"),
+            pl.col("mjd").max().alias("mjd_max"),
+        )
+        .sort("file")
+        .collect()
+    )
@@ -0,0 +1,163 @@
+"""persistent store of inspected object ids
+
+- keeps track of all objects contained in `ThumP!` output files (`thump_*.csv`) that have been ingested so far
+    - append-only parquet dataset (`part_NNNNNN.parquet`, single column `objectId`)
+        - every ingestion of new output files appends a single part
+    - `ingested.json` records every ingested output file with its size and modification time (see `thump.data.filelog.FileLog`)
+        - only new or changed output files get read
+        - only the `objectId` column of an output file is read
+- used by `thump.data.output.remove_inspected()` to prune `ThumP!` input files
+    - once all ids of an input file are in the store, the input file can be removed
+
+Exceptions
+
+Classes
+    - `InspectedStore` -- append-only store of inspected object ids
+
+Functions
+
+Other Objects
+"""
+
+#%%imports
+import glob
+import logging
+import os
+import polars as pl
+import re
+from typing import Iterable, List, Set
+
+from thump.data import compression as thcm
+from thump.data import filelog as thfl
+
+logger = logging.getLogger(__name__)
+
+#%%definitions
+class InspectedStore:
+    """append-only store of inspected object ids
+
+    - all files are written atomically (see `thump.data.filelog.atomic_open()`)
+    - the ids are loaded once and kept in memory afterwards
+        - later ingestions update them in place
+        - i.e., a long running process (`watch` mode of `thump_remove_inspected`) only reads new output files
+
+    Attributes
+        - `path`
+            - `str`
+            - directory of the store
+            - created if it does not exist
+        - `log`
+            - `FileLog`
+            - ingested output files (absolute path -> `size`, `mtime`, `nids`)
+
+    Methods
+        - `ingest()`
+        - `ids()`
+        - `missing()`
+        - `compact()`
+    """
+
+    def __init__(self,
+        path:str,
+        ):
+
+        self.path       = os.path.expanduser(path)
+
+        os.makedirs(self.path, exist_ok=True)
+        self.log = thfl.FileLog(os.path.join(self.path, "ingested.json"))
+        if len(self.log) > 0:
+            logger.info(f"{self.__class__.__name__}: loaded {len(self.log)} ingested files from {self.log.path}")
+        self._ids:Set[str] = None
+
+        return
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(\n"
+            f"    path={self.path!r},\n"
+            f")"
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids())
+
+    def _parts(self) -> List[str]:
+        return sorted(glob.glob(os.path.join(self.path, "part_*.parquet")))
+
+    @staticmethod
+    def _write_part(fname:str, ids:pl.DataFrame):
+        with thfl.atomic_open(fname, "wb") as f:
+            ids.write_parquet(f)
+        return
+
+    @staticmethod
+    def _read_ids(fname:str) -> pl.Series:
+        """reads the `objectId` column of a (potentially compressed) `ThumP!` output file"""
+        if thcm.compression_of(fname) is None:
+            return pl.scan_csv(fname, comment_prefix="#").select(pl.col("objectId").cast(pl.Utf8)).collect()["objectId"]
+        with thcm.open_file(fname, "rb") as f:
+            return pl.read_csv(f.read(), comment_prefix="#", columns=["objectId"], schema_overrides={"objectId":pl.Utf8})["objectId"]
+
+    def ingest(self, fnames:Iterable[str]) -> int:
+        """ingests output files that are new or changed since they were ingested
+
+        Parameters
+            - `fnames`
+                - `Iterable[str]`
+                - `ThumP!` output files (`.csv`, optionally `.gz` or `.zst` compressed)
+
+        Returns
+            - `ningested`
+                - `int`
+                - number of output files that got ingested
+        """
+        new, stats = [], dict()
+        for fn in fnames:
+            if not self.log.changed(fn):
+                continue
+            stat = self.log.stat(fn)
+            try:
+                ids = self._read_ids(fn)
+            except (pl.exceptions.PolarsError, OSError) as e:
+                #i.e., download still in progress
+                logger.warning(f"{self.__class__.__name__}.ingest(): skipping {fn} ({e})")
+                continue
+            new.append(ids)
+            stats[fn] = dict(stat=stat, nids=len(ids))
+        if len(new) == 0:
+            return 0
+
+        ids = pl.concat(new).unique().to_frame()
+        idxs = [int(m.group(1)) for fn in self._parts() if (m := re.search(r"part_(\d+)\.parquet$", fn)) is not None]
+        self._write_part(os.path.join(self.path, f"part_{max(idxs, default=-1)+1:06d}.parquet"), ids)
+        for fn, info in stats.items():
+            self.log.record(fn, **info)
+        self.log.save()
+        if self._ids is not None:
+            self._ids.update(ids["objectId"].to_list())
+        logger.info(f"{self.__class__.__name__}.ingest(): ingested {len(stats)} files ({len(ids)} ids)")
+
+        return len(stats)
+
+    def ids(self) -> Set[str]:
+        """all inspected object ids"""
+        if self._ids is None:
+            parts = self._parts()
+            self._ids = set(pl.scan_parquet(parts).select("objectId").unique().collect()["objectId"].to_list()) if len(parts) > 0 else set()
+        return self._ids
+
+    def missing(self, ids:Iterable[str]) -> Set[str]:
+        """returns the ids in `ids` that have not been inspected yet"""
+        return {str(i) for i in ids} - self.ids()
+
+    def compact(self):
+        """merges all parts into a single part (without duplicates)"""
+        parts = self._parts()
+        if len(parts) <= 1:
+            return
+        ids = pl.DataFrame({"objectId":sorted(self.ids())}, schema={"objectId":pl.Utf8})
+        self._write_part(parts[-1], ids)   #replaces newest part (does not lose anything if interrupted)
+        for fn in parts[:-1]:
+            os.remove(fn)
+        logger.info(f"{self.__class__.__name__}.compact(): merged {len(parts)} parts ({len(ids)} ids)")
+        return
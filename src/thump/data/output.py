@@ -1,29 +1,60 @@
 #%%imports
 import glob
-import json
 import logging
 import os
 import polars as pl
+import time
+from typing import List
+
+from thump.data import compression as thcm
+from thump.data import container as thct
+from thump.data import index as thix
+from thump.data import inspected as thin
+from thump.data import verdicts as thvd
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
-def concat(dir:str, save:str=False) -> pl.DataFrame:
+def _glob(pat:str, suffixes:list) -> list:
+    """files matching `pat` followed by any of `suffixes` (uncompressed or compressed)"""
+    return sorted({fn for sfx in suffixes for c in thcm.COMPRESSIONS.values() for fn in glob.glob(pat + sfx + c)})
+
+def concat(dir:str, save:str=False, dataset:str=None, partition:str="date") -> pl.DataFrame:
     """concatenates all files output by `ThumP!` that are present in `dir`
 
     - combines all `ThumP!` output files into one dataframe
+    - gzip or zstd compressed output files (`thump_*.csv.gz`, `thump_*.csv.zst`) are included
+    - output files are appended incrementally to a partitioned parquet dataset (see `thump.data.verdicts`)
+        - only output files that are new or changed since the last run get read
+        - different auxiliary columns across sessions are unified (missing columns are `null`)
+    - keeps only the latest verdict of every object (last verdict wins)
 
     Parameters
         -`dir`
             - `str`
             - directory that contains the desired `ThumP!` files
+        - `save`
+            - `str`, optional
+            - file to save the latest verdicts to
+            - written as parquet if `save` ends with `.parquet` and as csv otherwise
+            - the default is `False`
+                - not saved
+        - `dataset`
+            - `str`, optional
+            - directory of the parquet dataset
+            - the default is `None`
+                - `{dir}thump_verdicts/`
+        - `partition`
+            - `str`, optional
+            - how to partition the dataset (`"date"` or `"session"`)
+            - the default is `"date"`
 
     Raises
 
     Returns
         - `df`
             - `pl.DataFrame`
-            - dataframe of all the downloaded information
+            - latest verdict of every inspected object
 
     Dependencies
         - `glob`
@@ -33,71 +64,106 @@ def concat(dir:str, save:str=False) -> pl.DataFrame:
     """
     
     dir = os.path.expanduser(dir)   #allow `~`
-    fnames = glob.glob(f"{dir}thump_*.csv",)
-    if len(fnames) == 0:
-        return pl.DataFrame()
-    
+    if dataset is None: dataset = os.path.join(dir, "thump_verdicts")
+    ds = thvd.VerdictDataset(dataset, partition=partition)
+    ds.ingest(_glob(f"{dir}thump_*", [".csv"]))
 
-    df = pl.concat([pl.scan_csv(fn, comment_prefix="#") for fn in fnames]).collect()
-    print(df)
+    #executed once, the result is both saved and returned
+    df = ds.latest().collect(engine="streaming")
     #saving
-    if isinstance(save, str): df.write_csv(save)
+    if isinstance(save, str):
+        if save.endswith(".parquet"):
+            df.write_parquet(save)
+        else:
+            df.write_csv(save)
+    logger.info(f"concat(): {df.height} objects from {len(ds)} output files")
 
     return df
 
-def remove_inspected(in_pat:str, out_pat:str, dry_run:bool=False) -> pl.DataFrame:
+def remove_inspected(in_pat:str, out_pat:str, dry_run:bool=False, store:str=None, watch:float=None, compact:bool=False) -> List[str]:
     """remove all input files that have been fully inspected
 
-    - finds all files matching `<in_pat>.json` (`ThumP!` input)
+    - finds all files matching `<in_pat>.json` and `<in_pat>.thump` (`ThumP!` input)
     - finds all files matching `<out_pat>.csv` (`ThumP!` output)
-    - checks which input files have IDs, where ALL IDs are contained in the output files
-        - removes these files 
+    - gzip or zstd compressed files (additional suffix `.gz`, `.zst`) are included
+    - ingests output files into a persistent store of inspected IDs (see `thump.data.inspected`)
+        - only output files that are new or changed since the last run get read
+    - checks which input files have IDs, where ALL IDs are contained in the store
+        - the IDs of every input file are read from its index (see `thump.data.index`) if present
+            - i.e., the (multi-megabyte) payloads only get parsed for files written without index
+        - removes these files (together with their index)
+    - setting `watch` repeats this every `watch` seconds until interrupted
+        - prunes input files continuously while reviewers download their verdicts
 
     Parameters
         -`in_pat`
             - `str`
             - glob pattern defining all `ThumP!` input files
-            - .json will be appended to `in_pat`
+            - .json and .thump (optionally followed by .gz or .zst) will be appended to `in_pat`
         -`out_pat`
             - `str`
             - glob pattern defining all `ThumP!` output files
-            - .csv will be appended to `in_pat`
+            - .csv (optionally followed by .gz or .zst) will be appended to `out_pat`
         - `dry_run`
             - `bool`, optional
             - don't apply the deletion
             - just print the changes
+            - the store of inspected IDs gets updated nonetheless
+            - the default is `False`
+        - `store`
+            - `str`, optional
+            - directory of the store of inspected IDs
+            - the default is `None`
+                - `.thump_inspected/` in the directory of `out_pat`
+        - `watch`
+            - `float`, optional
+            - interval (in seconds) to repeat the pruning in
+            - the default is `None`
+                - pruned only once
+        - `compact`
+            - `bool`, optional
+            - whether to merge all parts of the store into one before returning
             - the default is `False`
 
     Raises
 
     Returns
+        - `removed`
+            - `List[str]`
+            - input files that got removed (would have been removed if `dry_run` is set)
 
     Dependencies
         - `glob`
-        - `json`
         - `os`
         - `polars`
+        - `time`
 
     """
-    infiles = glob.glob(os.path.expanduser(in_pat) + ".json")
-    outfiles = glob.glob(os.path.expanduser(out_pat) + ".csv")
-
-    out_ids = set(
-        pl.concat([
-            pl.scan_csv(f, comment_prefix="#").select(pl.col("objectId").cast(pl.Utf8)) for f in outfiles
-        ]).collect().to_numpy().flatten()
-    )
-
-    for f in infiles:
-        with open(f, "r") as file:
-            in_ids = set(json.load(file).keys())
-            all_inspected = (len(in_ids - out_ids) == 0)
-        
-        if all_inspected:
-            if not dry_run:
-                os.remove(f)
-                logger.info(f"removed {f}")
-            else:
-                logger.info(f"dry-run (would remove {f})")
-
-    return 
+    in_pat, out_pat = os.path.expanduser(in_pat), os.path.expanduser(out_pat)
+    if store is None: store = os.path.join(os.path.dirname(out_pat), ".thump_inspected")
+    inspected = thin.InspectedStore(store)
+
+    removed = []
+    try:
+        while True:
+            inspected.ingest(_glob(out_pat, [".csv"]))
+            for f in _glob(in_pat, [".json", thct.EXTENSION]):
+                if f in removed:
+                    continue    #dry run
+                all_inspected = (len(inspected.missing(thix.keys(f))) == 0)
+                
+                if all_inspected:
+                    removed.append(f)
+                    if not dry_run:
+                        thix.remove(f)
+                        logger.info(f"removed {f}")
+                    else:
+                        logger.info(f"dry-run (would remove {f})")
+            if watch is None:
+                break
+            time.sleep(watch)
+    except KeyboardInterrupt:
+        logger.info(f"stopped watching (removed {len(removed)} files)")
+    if compact: inspected.compact()
+
+    return removed
@@ -0,0 +1,340 @@
+"""preprocessing of thumbnails before they get written
+
+- trades fidelity for file size and rendering speed of the mosaic
+- applied to every thumbnail in the following order
+    - center cropping to `crop`x`crop` pixels
+    - block-average downsampling by `factor` (NaN are ignored)
+    - computing robust display limits (`percentile` or `zscale`)
+        - stored per thumbnail in `thumbnailLimits` (`[zmin, zmax]`)
+        - computed in a single vectorized pass over all thumbnails of the same type and shape in a batch
+        - used by `scripts/ui/mosaicGrid.js` instead of the full pixel range
+            - i.e., a few hot pixels do not wreck the contrast
+    - quantization to `bits` bits
+        - `q = round((value - offset) / scale)` with `0 <= q <= 2**bits - 2`
+        - `scale` and `offset` are stored per thumbnail in `thumbnailScales` and `thumbnailOffsets`
+        - the loaders in `scripts/ui/io.js` undo the quantization
+            - i.e., the mosaic always receives the original units
+- cropping and downsampling are only applied to 2d thumbnails (images)
+    - other thumbnails (i.e., ragged series in the examples) are only quantized
+
+Exceptions
+
+Classes
+    - `ThumbnailPreprocessor` -- crops, downsamples, computes display limits for and quantizes thumbnails
+
+Functions
+    - `crop_center()` -- center crop a thumbnail
+    - `downsample()` -- block-average downsample a thumbnail
+    - `quantize()` -- quantize a thumbnail to a fixed number of bits
+    - `display_limits()` -- robust display limits of a stack of thumbnails
+    - `decimals()` -- number of decimals to write the thumbnails of an object with
+
+Other Objects
+"""
+
+#%%imports
+import numpy as np
+import warnings
+from typing import Dict, List, Tuple
+
+#%%definitions
+def crop_center(img:np.ndarray, size:int) -> np.ndarray:
+    """center crops `img` to `size`x`size` pixels
+
+    - axes shorter than `size` are kept as they are
+
+    Parameters
+        - `img`
+            - `np.ndarray`
+            - 2d thumbnail
+        - `size`
+            - `int`
+            - side length of the cropped thumbnail
+
+    Returns
+        - `cropped`
+            - `np.ndarray`
+            - view into `img`
+    """
+    slices = []
+    for n in img.shape:
+        start = max((n - size) // 2, 0)
+        slices.append(slice(start, start + min(size, n)))
+    return img[tuple(slices)]
+
+def downsample(img:np.ndarray, factor:int) -> np.ndarray:
+    """downsamples `img` by averaging blocks of `factor`x`factor` pixels
+
+    - trailing rows and columns that do not fill a complete block are dropped
+    - NaN are ignored
+        - blocks that only contain NaN result in NaN
+
+    Parameters
+        - `img`
+            - `np.ndarray`
+            - 2d thumbnail
+        - `factor`
+            - `int`
+            - side length of the averaged blocks
+
+    Returns
+        - `downsampled`
+            - `np.ndarray`
+            - array of shape `(img.shape[0]//factor, img.shape[1]//factor)`
+    """
+    if factor <= 1:
+        return img
+    h, w = img.shape[0] // factor, img.shape[1] // factor
+    blocks = np.asarray(img[:h*factor,:w*factor], dtype=np.float64).reshape(h, factor, w, factor)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  #all-NaN blocks
+        return np.nanmean(blocks, axis=(1,3))
+
+def quantize(img:np.ndarray, bits:int) -> Tuple[np.ndarray,float,float]:
+    """quantizes `img` to `bits` bits
+
+    - maps the finite range of `img` linearly onto `[0, 2**bits - 2]`
+        - `2**bits - 1` stays free to encode NaN in binary containers (see `thump.data.container`)
+
+    Parameters
+        - `img`
+            - `np.ndarray`
+            - thumbnail
+        - `bits`
+            - `int`
+            - number of bits
+            - typically `8` or `16`
+
+    Returns
+        - `q`
+            - `np.ndarray`
+            - quantized values (integer valued floats, NaN preserved)
+        - `scale`
+            - `float`
+            - step size
+        - `offset`
+            - `float`
+            - value of `q == 0`
+            - `img ~ q * scale + offset`
+    """
+    img = np.asarray(img, dtype=np.float64)
+    finite = np.isfinite(img)
+    if not finite.any():
+        return np.full(img.shape, np.nan), 1.0, 0.0
+    lo, hi = img[finite].min(), img[finite].max()
+    scale = (hi - lo) / (2**bits - 2) if hi > lo else 1.0
+    q = np.where(finite, np.round((img - lo) / scale), np.nan)
+    return q, float(scale), float(lo)
+
+def display_limits(stack:np.ndarray, method:str="percentile", percentiles:Tuple[float,float]=(1.0, 99.0)) -> np.ndarray:
+    """robust display limits of a stack of thumbnails
+
+    - NaN are ignored
+
+    Parameters
+        - `stack`
+            - `np.ndarray`
+            - thumbnails of shape `(N, H, W)`
+        - `method`
+            - `str`, optional
+            - one of
+                - `"percentile"`: `percentiles` of every thumbnail (vectorized over the whole stack)
+                - `"zscale"`: IRAF zscale algorithm (see `astropy.visualization.ZScaleInterval`)
+            - the default is `"percentile"`
+        - `percentiles`
+            - `Tuple[float,float]`, optional
+            - lower and upper percentile
+            - only used if `method == "percentile"`
+            - the default is `(1.0, 99.0)`
+
+    Raises
+        - `ValueError`
+            - if `method` is not supported
+
+    Returns
+        - `limits`
+            - `np.ndarray`
+            - array of shape `(N, 2)` containing `zmin` and `zmax` of every thumbnail
+            - NaN for thumbnails without any finite value
+    """
+    flat = np.asarray(stack, dtype=np.float64).reshape(len(stack), -1)
+    flat = np.where(np.isfinite(flat), flat, np.nan)
+    if method == "percentile":
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  #all-NaN thumbnails
+            return np.nanpercentile(flat, percentiles, axis=1).T
+    if method == "zscale":
+        from astropy.visualization import ZScaleInterval   #slow to import (matplotlib), only needed here
+        interval = ZScaleInterval()
+        limits = np.full((len(flat), 2), np.nan)
+        for i, x in enumerate(flat):
+            x = x[np.isfinite(x)]
+            if len(x) > 0: limits[i] = interval.get_limits(x)
+        return limits
+    raise ValueError(f"`method` has to be one of 'percentile', 'zscale' but is {method!r}")
+
+def decimals(obj:dict, decimals:int) -> int:
+    """number of decimals to write the thumbnails of `obj` with
+
+    - quantized thumbnails (`obj` contains `thumbnailScales`) are integers and written without decimals
+    - `decimals` otherwise
+    """
+    return 0 if "thumbnailScales" in obj else decimals
+
+class ThumbnailPreprocessor:
+    """crops, downsamples, computes display limits for and quantizes thumbnails
+
+    - applied to objects in `ThumP!` format before they get encoded
+    - picklable (can be sent to worker processes)
+
+    Attributes
+        - `crop`
+            - `int`, optional
+            - side length to center crop thumbnails to
+            - the default is `None`
+                - no cropping
+        - `factor`
+            - `int`, optional
+            - downsampling factor (block average)
+            - the default is `1`
+                - no downsampling
+        - `bits`
+            - `int`, optional
+            - number of bits to quantize thumbnails to
+            - one of `8`, `16`
+            - adds `thumbnailScales` and `thumbnailOffsets` to every object
+            - the default is `None`
+                - no quantization
+        - `limits`
+            - `str`, optional
+            - method to compute display limits with (see `display_limits()`)
+            - one of `"percentile"`, `"zscale"`
+            - adds `thumbnailLimits` to every object
+                - `null` for thumbnails that are not images
+            - the default is `None`
+                - no display limits
+        - `percentiles`
+            - `Tuple[float,float]`, optional
+            - lower and upper percentile for `limits == "percentile"`
+            - the default is `(1.0, 99.0)`
+
+    Methods
+        - `apply()`
+        - `__call__()`
+    """
+
+    def __init__(self,
+        crop:int=None,
+        factor:int=1,
+        bits:int=None,
+        limits:str=None,
+        percentiles:Tuple[float,float]=(1.0, 99.0),
+        ):
+
+        if (bits is not None) and (bits not in (8, 16)):
+            raise ValueError(f"`bits` has to be one of 8, 16 but is {bits!r}")
+        if (limits is not None) and (limits not in ("percentile", "zscale")):
+            raise ValueError(f"`limits` has to be one of 'percentile', 'zscale' but is {limits!r}")
+
+        self.crop           = crop
+        self.factor         = factor
+        self.bits           = bits
+        self.limits         = limits
+        self.percentiles    = tuple(percentiles)
+
+        return
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(\n"
+            f"    crop={self.crop!r},\n"
+            f"    factor={self.factor!r},\n"
+            f"    bits={self.bits!r},\n"
+            f"    limits={self.limits!r},\n"
+            f"    percentiles={self.percentiles!r},\n"
+            f")"
+        )
+
+    @property
+    def active(self) -> bool:
+        """whether the preprocessor changes anything at all"""
+        return (self.crop is not None) or (self.factor > 1) or (self.bits is not None) or (self.limits is not None)
+
+    def _resample(self, img:np.ndarray) -> np.ndarray:
+        """crops and downsamples a single image"""
+        if self.crop is not None:
+            img = crop_center(img, self.crop)
+        return downsample(img, self.factor)
+
+    def _quantize(self, img) -> Tuple[np.ndarray,float,float]:
+        """quantizes a single thumbnail (image or ragged rows)"""
+        if isinstance(img, np.ndarray) and (img.ndim == 2):
+            return quantize(img, self.bits)
+        #ragged rows share a single scale and offset
+        rows = [np.asarray(r, dtype=np.float64).ravel() for r in img]
+        q, scale, offset = quantize(np.concatenate(rows) if len(rows) > 0 else np.empty(0), self.bits)
+        return (np.split(q, np.cumsum([len(r) for r in rows])[:-1]) if len(rows) > 0 else []), scale, offset
+
+    def _add_limits(self, objs:Dict[str,dict]):
+        """adds `thumbnailLimits` to all objects (in place)
+
+        - images of the same type (index) and shape are stacked and processed at once
+        """
+        groups:Dict[Tuple[int,tuple],List[str]] = dict()
+        for k, obj in objs.items():
+            obj["thumbnailLimits"] = [None] * len(obj["thumbnails"])
+            for thi, img in enumerate(obj["thumbnails"]):
+                if isinstance(img, np.ndarray) and (img.ndim == 2) and (img.size > 0):
+                    groups.setdefault((thi, img.shape), []).append(k)
+        for (thi, _), keys in groups.items():
+            limits = display_limits(np.stack([objs[k]["thumbnails"][thi] for k in keys]), method=self.limits, percentiles=self.percentiles)
+            for k, (zmin, zmax) in zip(keys, limits.tolist()):
+                objs[k]["thumbnailLimits"][thi] = [zmin, zmax] if np.isfinite(zmin) and np.isfinite(zmax) else None
+        return
+
+    def apply(self, data_json:Dict[str,dict]) -> Dict[str,dict]:
+        """preprocesses all thumbnails of a batch of objects
+
+        Parameters
+            - `data_json`
+                - `Dict[str,dict]`
+                - objects in `ThumP!` format
+
+        Returns
+            - `data_json`
+                - `Dict[str,dict]`
+                - copies of the objects with preprocessed thumbnails
+        """
+        if not self.active:
+            return data_json
+
+        objs = {
+            k:dict(obj, thumbnails=[self._resample(img) if isinstance(img, np.ndarray) and (img.ndim == 2) else img for img in obj["thumbnails"]])
+            for k, obj in data_json.items()
+        }
+        if self.limits is not None:
+            self._add_limits(objs)
+        if self.bits is not None:
+            for obj in objs.values():
+                quantized = [self._quantize(img) for img in obj["thumbnails"]]
+                obj["thumbnails"] = [q for q, _, _ in quantized]
+                obj["thumbnailScales"] = [scale for _, scale, _ in quantized]
+                obj["thumbnailOffsets"] = [offset for _, _, offset in quantized]
+        return objs
+
+    def __call__(self, obj:dict) -> dict:
+        """preprocesses all thumbnails of a single object
+
+        - same as `apply()` for a single object
+
+        Parameters
+            - `obj`
+                - `dict`
+                - single object in `ThumP!` format
+
+        Returns
+            - `obj`
+                - `dict`
+                - copy of `obj` with preprocessed thumbnails
+        """
+        return self.apply({None:obj})[None]
@@ -0,0 +1,210 @@
+"""consolidated reviewer verdicts
+
+- incrementally appends `ThumP!` output files (`thump_*.csv`) to a partitioned parquet dataset
+    - `{path}/{partition}={value}/{output file name}.parquet`
+        - partitioned by the date (`YYYYMMDD`) or the id of the session the output file was downloaded in
+    - every output file is converted only once
+        - `ingested.json` records every ingested output file with its size and modification time (see `thump.data.filelog.FileLog`)
+        - output files that change (i.e., get downloaded again) replace their previous part
+- every part keeps its own columns
+    - sessions with different auxiliary columns are unified diagonally when reading (missing columns are `null`)
+    - columns of different types are cast to their common supertype
+- deduplicates on `objectId` with a last-verdict-wins policy
+    - verdicts are ordered by session id and page (both parsed from the name of the output file)
+        - `thump_{sessionId}_{page}[_{suffix}].csv` as downloaded by `ThumP!`
+        - the modification time of the output file is used as session id if the name does not follow this pattern
+    - executed lazily with polars' streaming engine (the whole history never has to be in memory at once)
+
+Exceptions
+
+Classes
+    - `VerdictDataset` -- partitioned parquet dataset of reviewer verdicts
+
+Functions
+    - `scan_output()` -- scan a (potentially compressed) `ThumP!` output file
+    - `session_of()` -- session id and page of a `ThumP!` output file
+
+Other Objects
+    - `ORDER` -- name of the column defining the order of verdicts
+"""
+
+#%%imports
+import glob
+import logging
+import os
+import polars as pl
+import re
+import time
+from typing import Iterable, List, Tuple
+
+from thump.data import compression as thcm
+from thump.data import filelog as thfl
+
+logger = logging.getLogger(__name__)
+
+#%%definitions
+ORDER   = "_order"
+
+def scan_output(fname:str) -> pl.LazyFrame:
+    """scans a (potentially compressed) `ThumP!` output file"""
+    if thcm.compression_of(fname) is None:
+        return pl.scan_csv(fname, comment_prefix="#")
+    with thcm.open_file(fname, "rb") as f:
+        return pl.read_csv(f.read(), comment_prefix="#").lazy()
+
+def session_of(fname:str) -> Tuple[str,int]:
+    """session id (`YYYYMMDDhhmmss`) and page of the `ThumP!` output file `fname`
+
+    - parsed from the file name (`thump_{sessionId}_{page}[_{suffix}].csv`)
+    - falls back to the modification time of `fname` and page `0`
+    """
+    m = re.match(r"thump_(\d{14})_(\d+)", os.path.basename(fname))
+    if m is not None:
+        return m.group(1), int(m.group(2))
+    return time.strftime("%Y%m%d%H%M%S", time.localtime(os.path.getmtime(fname))), 0
+
+class VerdictDataset:
+    """partitioned parquet dataset of reviewer verdicts
+
+    - all files are written atomically (see `thump.data.filelog.atomic_open()`)
+
+    Attributes
+        - `path`
+            - `str`
+            - directory of the dataset
+            - created if it does not exist
+        - `partition`
+            - `str`, optional
+            - how to partition the dataset
+            - one of `"date"`, `"session"`
+            - only affects parts written from now on
+            - the default is `"date"`
+        - `log`
+            - `FileLog`
+            - ingested output files (absolute path -> `size`, `mtime`, `part`)
+
+    Methods
+        - `ingest()`
+        - `scan()`
+        - `latest()`
+    """
+
+    def __init__(self,
+        path:str,
+        partition:str="date",
+        ):
+
+        if partition not in ("date", "session"):
+            raise ValueError(f"`partition` has to be one of 'date', 'session' but is {partition!r}")
+
+        self.path       = os.path.expanduser(path)
+        self.partition  = partition
+
+        os.makedirs(self.path, exist_ok=True)
+        self.log = thfl.FileLog(os.path.join(self.path, "ingested.json"))
+
+        return
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(\n"
+            f"    path={self.path!r},\n"
+            f"    partition={self.partition!r},\n"
+            f")"
+        )
+
+    def __len__(self) -> int:
+        return len(self.log)
+
+    def _parts(self) -> List[str]:
+        return sorted(glob.glob(os.path.join(self.path, "*=*", "*.parquet")))
+
+    def _part_path(self, fname:str, session:str) -> str:
+        value = session[:8] if self.partition == "date" else session
+        return os.path.join(self.path, f"{self.partition}={value}", os.path.basename(thcm.strip_suffix(fname)) + ".parquet")
+
+    def _write_part(self, fname:str) -> str:
+        """converts a single output file into a part of the dataset"""
+        session, page = session_of(fname)
+        part = self._part_path(fname, session)
+        os.makedirs(os.path.dirname(part), exist_ok=True)
+        with thfl.atomic_open(part, "wb") as f:
+            (scan_output(fname)
+                .with_columns(
+                    pl.col("objectId").cast(pl.Utf8),
+                    pl.lit(session).alias("sessionId"),
+                    pl.lit(page, dtype=pl.Int64).alias("page"),
+                    pl.lit(int(session) * 10000 + page, dtype=pl.Int64).alias(ORDER),
+                )
+                .sink_parquet(f)
+            )
+        return part
+
+    def ingest(self, fnames:Iterable[str]) -> int:
+        """appends output files that are new or changed since they were ingested
+
+        Parameters
+            - `fnames`
+                - `Iterable[str]`
+                - `ThumP!` output files (`.csv`, optionally `.gz` or `.zst` compressed)
+
+        Returns
+            - `ningested`
+                - `int`
+                - number of output files that got ingested
+        """
+        ningested = 0
+        for fn in fnames:
+            if not self.log.changed(fn):
+                continue
+            entry = self.log.get(fn)
+            stat = self.log.stat(fn)
+            try:
+                part = self._write_part(fn)
+            except (pl.exceptions.PolarsError, OSError) as e:
+                #i.e., download still in progress
+                logger.warning(f"{self.__class__.__name__}.ingest(): skipping {fn} ({e})")
+                continue
+            if (entry is not None) and (entry["part"] != os.path.relpath(part, self.path)):
+                #partitioning changed in between
+                old = os.path.join(self.path, entry["part"])
+                if os.path.isfile(old): os.remove(old)
+            self.log.record(fn, stat=stat, part=os.path.relpath(part, self.path))
+            ningested += 1
+
+        if ningested > 0:
+            self.log.save()
+            logger.info(f"{self.__class__.__name__}.ingest(): ingested {ningested} files")
+        return ningested
+
+    def scan(self) -> pl.LazyFrame:
+        """lazily scans all verdicts (including superseded ones)
+
+        Returns
+            - `verdicts`
+                - `pl.LazyFrame`
+                - union of all columns of all parts
+                - contains `sessionId`, `page` and `ORDER` in addition to the columns of the output files
+        """
+        parts = self._parts()
+        if len(parts) == 0:
+            return pl.LazyFrame(schema={"class":pl.Utf8, "objectId":pl.Utf8, "sessionId":pl.Utf8, "page":pl.Int64, ORDER:pl.Int64})
+        return pl.concat([pl.scan_parquet(p) for p in parts], how="diagonal_relaxed")
+
+    def latest(self) -> pl.LazyFrame:
+        """lazily scans the latest verdict of every object
+
+        - the verdict with the highest `ORDER` wins (latest session and page)
+
+        Returns
+            - `verdicts`
+                - `pl.LazyFrame`
+                - one row per `objectId`
+        """
+        lf = self.scan()
+        last = lf.group_by("objectId").agg(pl.col(ORDER).max())
+        return (lf
+            .join(last, on=["objectId", ORDER], how="semi")
+            .unique(subset="objectId", keep="any")
+            .drop(ORDER)
+        )
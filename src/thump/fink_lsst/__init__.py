@@ -8,14 +8,44 @@
 Exceptions
 
 Classes
-
+    - `pipeline.StreamPipeline` -- pipelined consume/process/write runtime for streamed alerts
+    - `decoding.AlertDecoderPool` -- persistent process pool decoding streamed alerts
+    - `accumulator.ChunkAccumulator` -- accumulates processed alerts in memory and writes them in chunks
+    - `replay.ReplaySource` -- rate-controlled replay of alerts downloaded via datatransfer
+    - `metrics.Metrics` -- counters, gauges and latency histograms of the streaming pipeline
+    - `metrics.MetricsExporter` -- periodic export of metrics to prometheus text and/or jsonl files
+    - `batching.AdaptiveBatcher` -- adapts number of alerts and timeout of every poll to the current load
+    - `checkpoint.CheckpointedConsumer` -- `AlertConsumer` committing offsets only once alerts are durable
+    - `checkpoint.OffsetTracker` -- tracks which consumed offsets are safe to commit
+    - `manifest.Manifest` -- manifest of processed datatransfer files and the chunks they produced
+    - `spatial.SkyIndex` -- k-d tree over sky positions of alerts (cone search, crossmatch, grouping of repeat detections)
 	  
 Functions
     - `read_files()`  -- read extracted alert packages
+    - `plan_chunks()` -- plan chunks (row ranges of row-groups) from parquet metadata
+    - `plan_groups()` -- plan chunks keeping repeat detections of the same position together
+    - `read_chunk()` -- stream the alert packages of a single planned chunk
     - `compile_file()` -- compile a single file from a set of alert packages
+    - `compile_chunk()` -- compile a single planned chunk
     - `compile_files()` -- compile enough files to cover all extracted alert packages
+    - `checkpoint.atomic_open()` -- write a file atomically (re-exported from `thump.data.filelog`)
+    - `cutouts.decode_cutout()` -- decode a single FITS cutout (fast path with astropy fallback)
+    - `cutouts.decode_cutouts()` -- decode a batch of FITS cutouts into a stacked (N, 3, H, W) array
+    - `query.query()` -- lazily join reviewer verdicts to alert packages (predicates pushed down)
 
 Other Objects
 """
 #%%make available from top level of module
-from .process_data import *
\ No newline at end of file
+#`process_data` is only imported on first access (i.e., `thump.fink_lsst.compile_files`)
+#importing any other submodule does not pull in `process_data` and its dependencies
+_PROCESS_DATA = (
+    "COLUMNS",
+    "read_files", "plan_chunks", "plan_groups", "read_chunk",
+    "compile_file", "compile_chunk", "compile_files",
+)
+
+def __getattr__(name:str):
+    if name in _PROCESS_DATA:
+        from thump.fink_lsst import process_data
+        return getattr(process_data, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,385 @@
+"""in-memory accumulation of processed alerts into `ThumP!` chunks
+
+- replaces writing every alert to its own `processed_*.json` and merging them afterwards
+- decoded alerts are encoded as json fragments and held in memory until `chunklen` of them are available
+    - then written as a single `reformatted_NNNN.json`
+    - or as a binary container `reformatted_NNNN.thump` (see `thump.data.container`)
+    - optionally gzip or zstd compressed while being written (see `thump.data.compression`)
+- optionally, every alert is also appended to a spill log
+    - the spill log is replayed upon restart
+    - alerts that were decoded but not yet written to a chunk are therefore not lost on a crash
+- chunks and the rewritten spill log are written atomically (see `thump.fink_lsst.checkpoint.atomic_open()`)
+    - a crash never leaves a partially written chunk behind
+- the object-to-file index of every chunk is written alongside (see `thump.data.index`)
+
+Exceptions
+
+Classes
+    - `ChunkAccumulator` -- accumulates processed alerts and writes them in chunks
+
+Functions
+
+Other Objects
+"""
+
+#%%imports
+from contextlib import nullcontext
+import glob
+import json
+import logging
+import os
+import re
+import threading
+from typing import Any, Callable, Dict, List, Tuple
+
+from thump.data import compression as thcm
+from thump.data import container as thct
+from thump.data import encoding as thden
+from thump.data import index as thix
+from thump.data import preprocessing as thpp
+from thump.fink_lsst import checkpoint as thcp
+from thump.fink_lsst import metrics as thmt
+
+logger = logging.getLogger(__name__)
+
+#%%definitions
+class ChunkAccumulator:
+    """accumulates processed alerts and writes them in chunks
+
+    - every added alert is encoded right away (see `thump.data.encoding`, `thump.data.container`)
+        - only the json fragments (encoded thumbnails) are held in memory
+    - writes `{save_dir}reformatted_NNNN.json` (`.thump`) once `chunklen` alerts have been added
+    - chunk numbering continues from the existing `reformatted_*.json` (`.thump`) files in `save_dir`
+        - `save_dir` is only scanned once upon instantiation
+    - thread-safe
+
+    Attributes
+        - `save_dir`
+            - `str`
+            - directory to save chunks to
+        - `chunklen`
+            - `int`
+            - number of objects each chunk shall contain
+        - `spill`
+            - `bool`, optional
+            - whether to append every added alert to `{save_dir}spill.jsonl`
+            - the spill log is replayed upon instantiation and truncated whenever a chunk has been written
+            - always written as json
+            - alerts already contained in the most recent chunk are skipped upon replay
+            - the default is `False`
+        - `decimals`
+            - `int`, optional
+            - number of decimals to write for thumbnails
+            - passed to `thump.data.encoding.dumps()`
+            - the default is `1`
+        - `indent`
+            - `int`, optional
+            - indentation of the written chunks
+            - passed to `thump.data.encoding.dumps()`
+            - `None` writes compact chunks
+            - the default is `2`
+        - `fmt`
+            - `str`, optional
+            - format of the written chunks
+            - `"json"` or `"binary"` (see `thump.data.container`)
+            - the default is `"json"`
+        - `dtype`
+            - `str`, optional
+            - storage type of the thumbnails in binary chunks
+            - passed to `thump.data.container.encode_object()`
+            - the default is `"int16"`
+        - `preprocess`
+            - `thump.data.preprocessing.ThumbnailPreprocessor`, optional
+            - crops, downsamples and/or quantizes thumbnails before they get encoded
+            - the spill log holds preprocessed alerts
+            - the default is `None`
+                - thumbnails are written at full resolution
+        - `compression`
+            - `str`, optional
+            - compression of the written chunks
+            - one of `None`, `"gzip"`, `"zstd"` (see `thump.data.compression`)
+            - the spill log is never compressed
+            - the default is `None`
+                - uncompressed
+        - `metrics`
+            - `thump.fink_lsst.metrics.Metrics`, optional
+            - registry to record latencies (`encode`, `write`, `reformat`) and alert lags in
+            - the default is `None`
+                - no metrics recorded
+        - `on_durable`
+            - `Callable[[List[str]], None]`, optional
+            - called with the keys of alerts once they are durable
+                - i.e., after the chunk containing them has been written
+                - i.e., after they have been appended to the spill log if `spill` is set
+            - used to commit kafka offsets (see `thump.fink_lsst.checkpoint.CheckpointedConsumer.done()`)
+            - the default is `None`
+        - `chunkidx`
+            - `int`
+            - index of the next chunk that will be written
+        - `nwritten`
+            - `int`
+            - number of chunks written so far
+
+    Methods
+        - `add()`
+        - `add_batch()`
+        - `flush()`
+        - `close()`
+    """
+
+    def __init__(self,
+        save_dir:str,
+        chunklen:int,
+        spill:bool=False,
+        decimals:int=1,
+        indent:int=2,
+        fmt:str="json",
+        dtype:str="int16",
+        preprocess:thpp.ThumbnailPreprocessor=None,
+        compression:str=None,
+        metrics:thmt.Metrics=None,
+        on_durable:Callable[[List[str]], None]=None,
+        ):
+
+        self.save_dir   = save_dir
+        self.chunklen   = chunklen
+        self.spill      = spill
+        self.decimals   = decimals
+        self.indent     = indent
+        self.fmt        = fmt
+        self.dtype      = dtype
+        self.preprocess = preprocess if preprocess is not None else thpp.ThumbnailPreprocessor()
+        self.compression= compression
+        self.metrics    = metrics
+        self.on_durable = on_durable
+
+        self.chunkidx   = self._next_chunkidx()
+        self.nwritten   = 0
+
+        self._objs:Dict[str,Tuple[Any,dict]] = dict()    #key -> (json fragment or (meta, blob), index fields)
+        self._lock = threading.Lock()
+        self._spill_file = None
+        if self.spill:
+            self._replay_spill()
+            self._rewrite_spill()   #opens the spill log
+
+        return
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(\n"
+            f"    save_dir={self.save_dir!r},\n"
+            f"    chunklen={self.chunklen!r},\n"
+            f"    spill={self.spill!r},\n"
+            f"    decimals={self.decimals!r},\n"
+            f"    indent={self.indent!r},\n"
+            f"    fmt={self.fmt!r},\n"
+            f"    dtype={self.dtype!r},\n"
+            f"    preprocess={self.preprocess!r},\n"
+            f"    compression={self.compression!r},\n"
+            f"    metrics={self.metrics!r},\n"
+            f"    on_durable={self.on_durable!r},\n"
+            f")"
+        )
+
+    def __len__(self) -> int:
+        return len(self._objs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+        return
+
+    @property
+    def spill_path(self) -> str:
+        return f"{self.save_dir}spill.jsonl"
+
+    @property
+    def extension(self) -> str:
+        return (thct.EXTENSION if self.fmt == "binary" else ".json") + thcm.suffix(self.compression)
+
+    def _timer(self, stage:str):
+        """times `stage` if `metrics` is set"""
+        return self.metrics.timer("stage_seconds", stage=stage) if self.metrics is not None else nullcontext()
+
+    def _next_chunkidx(self) -> int:
+        """infers the index of the next chunk from the chunks already present in `save_dir`"""
+        idxs = [int(m.group(1)) for fn in glob.glob(f"{self.save_dir}reformatted_*") if (m := re.search(r"reformatted_(\d+)\.(?:json|thump)(?:\.gz|\.zst)?$", fn)) is not None]
+        return max(idxs, default=0) + 1
+
+    def _encode(self, data_json:dict, preprocess:bool=True) -> Dict[str,Tuple[Any,dict]]:
+        """encodes every alert in `data_json` as a fragment to be embedded in a chunk
+
+        - `preprocess` is disabled for alerts replayed from the spill log (preprocessed already)
+        """
+        with self._timer("encode"):
+            if preprocess:
+                data_json = self.preprocess.apply(data_json)
+            if self.fmt == "binary":
+                return {
+                    str(k):(thct.encode_object(v, decimals=thpp.decimals(v, self.decimals), dtype=self.dtype), thix.fields(v))
+                    for k, v in data_json.items()
+                }
+            return {
+                str(k):(thden.dumps(v, decimals=thpp.decimals(v, self.decimals), indent=self.indent, level=1), thix.fields(v))
+                for k, v in data_json.items()
+            }
+
+    def _spill_line(self, objs:Dict[str,Tuple[Any,dict]]) -> str:
+        """single line for the spill log"""
+        if self.fmt == "binary":
+            return "{" + ",".join(f"{json.dumps(k)}:{thden.dumps(obj, decimals=thpp.decimals(obj, self.decimals))}" for k, obj in ((k, thct.decode_object(*frag)) for k, (frag, _) in objs.items())) + "}"
+        if self.indent is None:
+            #fragments are compact already
+            return "{" + ",".join(f"{json.dumps(k)}:{frag}" for k, (frag, _) in objs.items()) + "}"
+        return json.dumps({k:json.loads(frag) for k, (frag, _) in objs.items()}, separators=(",", ":"))
+
+    def _replay_spill(self):
+        """loads alerts from a spill log left behind by a previous run"""
+        if not os.path.isfile(self.spill_path):
+            return
+        nreplayed = 0
+        with open(self.spill_path, "r") as f:
+            for line in f:
+                try:
+                    self._objs.update(self._encode(json.loads(line), preprocess=False))
+                    nreplayed += 1
+                except json.JSONDecodeError:
+                    #last line might be incomplete if the previous run got killed while writing
+                    logger.warning(f"{self.__class__.__name__}._replay_spill(): ignoring corrupt line in {self.spill_path}")
+        logger.info(f"{self.__class__.__name__}._replay_spill(): replayed {nreplayed} alerts from {self.spill_path}")
+
+        #previous run might have been killed after writing a chunk but before truncating the spill log
+        if (self.chunkidx > 1) and (len(self._objs) > 0):
+            last = f"{self.save_dir}reformatted_{self.chunkidx-1:04d}{self.extension}"
+            try:
+                written = thix.keys(last)
+                nskipped = sum(self._objs.pop(k, None) is not None for k in written)
+                if nskipped > 0: logger.info(f"{self.__class__.__name__}._replay_spill(): skipped {nskipped} alerts already contained in {last}")
+            except (OSError, ValueError) as e:
+                logger.warning(f"{self.__class__.__name__}._replay_spill(): could not check {last} for already written alerts: {e}")
+
+        #write all complete chunks that were recovered
+        while len(self._objs) >= self.chunklen:
+            self._write_chunk()
+        return
+
+    def _rewrite_spill(self):
+        """replaces the spill log with the alerts currently held in memory"""
+        if self._spill_file is not None: self._spill_file.close()
+        with thcp.atomic_open(self.spill_path, "w") as f:
+            for k, v in self._objs.items():
+                f.write(self._spill_line({k:v}) + "\n")
+        self._spill_file = open(self.spill_path, "a") if self.spill else None
+        return
+
+    def _write_chunk(self):
+        """writes the first `chunklen` alerts held in memory to a chunk"""
+        with self._timer("reformat"):
+            keys = list(self._objs.keys())[:self.chunklen]
+            objs = {k:self._objs.pop(k) for k in keys}
+            fname = f"{self.save_dir}reformatted_{self.chunkidx:04d}{self.extension}"
+            if self.fmt == "binary":
+                with thcp.atomic_open(fname, "wb") as raw, thcm.wrap(raw, self.compression) as f:
+                    spans = thct.write(f, [(k, *frag) for k, (frag, _) in objs.items()])
+                rows = [dict(objectId=k, offset=offset, length=length, **fields) for (k, (_, fields)), (offset, length) in zip(objs.items(), spans)]
+            else:
+                if self.indent is None:
+                    sep, open_, close, colon = ",", "{", "}", ":"
+                else:
+                    sep, open_, close, colon = ",\n" + " "*self.indent, "{\n" + " "*self.indent, "\n}", ": "
+                rows = []
+                with thcp.atomic_open(fname, "wb") as raw, thcm.wrap(raw, self.compression, text=True) as f:
+                    f.write(open_)
+                    pos = len(open_)    #chunks are ascii (characters == bytes)
+                    for i, (k, (frag, fields)) in enumerate(objs.items()):
+                        head = (sep if i > 0 else "") + json.dumps(k) + colon
+                        f.write(head)
+                        f.write(frag)
+                        rows.append(dict(objectId=k, offset=pos + len(head), length=len(frag), **fields))
+                        pos += len(head) + len(frag)
+                    f.write(close)
+            thix.write(fname, rows)
+        logger.info(f"{self.__class__.__name__}._write_chunk(): wrote {len(objs)} objects to {fname}")
+        self.chunkidx += 1
+        self.nwritten += 1
+        if (self.on_durable is not None) and (not self.spill): self.on_durable(list(objs.keys()))
+
+        #lag between observation and being on disk
+        if self.metrics is not None:
+            self.metrics.inc("chunks_total")
+            now = thmt.mjd_now()
+            for _, fields in objs.values():
+                mjd = fields["mjd"]
+                if mjd is not None: self.metrics.observe("lag_seconds", (now - mjd)*86400, buckets=thmt.LAG_BUCKETS)
+        return
+
+    def add(self, data_json:dict):
+        """adds processed alerts
+
+        - writes a chunk once `chunklen` alerts have been accumulated
+
+        Parameters
+            - `data_json`
+                - `dict`
+                - alert(s) in `ThumP!` format
+                - as returned by `thump.fink_lsst.decoding.decode_alert()`
+        """
+        objs = self._encode(data_json)  #outside of lock (can run concurrently)
+        with self._lock:
+            self._objs.update(objs)
+            if self._spill_file is not None:
+                with self._timer("write"):
+                    self._spill_file.write(self._spill_line(objs) + "\n")
+                    self._spill_file.flush()
+                    os.fsync(self._spill_file.fileno())
+                if self.on_durable is not None: self.on_durable(list(objs.keys()))
+            if len(self._objs) >= self.chunklen:
+                while len(self._objs) >= self.chunklen:
+                    self._write_chunk()
+                if self.spill: self._rewrite_spill()
+        return
+
+    def add_batch(self, data_jsons:List[dict]):
+        """adds the processed alerts of a whole poll at once
+
+        - the alerts are merged and preprocessed in a single (vectorized) pass (see `thump.data.preprocessing.ThumbnailPreprocessor.apply()`)
+
+        Parameters
+            - `data_jsons`
+                - `List[dict]`
+                - alerts in `ThumP!` format
+                - as returned by `thump.fink_lsst.decoding.decode_alert()`
+        """
+        merged = dict()
+        for data_json in data_jsons:
+            merged.update(data_json)
+        if len(merged) > 0: self.add(merged)
+        return
+
+    def flush(self):
+        """writes all alerts held in memory to a (potentially partial) chunk"""
+        with self._lock:
+            if len(self._objs) > 0:
+                self._write_chunk()
+                if self.spill: self._rewrite_spill()
+        return
+
+    def close(self):
+        """closes the accumulator
+
+        - if `spill` is set, pending alerts remain in the spill log and are picked up by the next run
+        - otherwise pending alerts are written to a partial chunk
+        """
+        if self.spill:
+            with self._lock:
+                if self._spill_file is not None:
+                    self._spill_file.close()
+                    self._spill_file = None
+            if len(self._objs) > 0:
+                logger.info(f"{self.__class__.__name__}.close(): {len(self._objs)} pending alerts kept in {self.spill_path}")
+        else:
+            self.flush()
+        return
@@ -0,0 +1,261 @@
+"""adaptive batch sizing for polling the stream
+
+- tunes the number of alerts requested per poll (`num_alerts`) and the poll timeout (`timeout`) at runtime
+    - bursts are pulled in large batches, quiet periods with long timeouts (fewer round-trips)
+    - batches are capped such that processing a batch stays within a target latency
+- applies backpressure
+    - batches never exceed the free capacity downstream
+    - polling pauses while downstream is (nearly) full
+
+Exceptions
+
+Classes
+    - `AdaptiveBatcher` -- controller for `num_alerts` and `timeout` of consecutive polls
+
+Functions
+
+Other Objects
+"""
+
+#%%imports
+import logging
+import numpy as np
+import threading
+import time
+from typing import Callable, Tuple
+
+from thump.fink_lsst import metrics as thmt
+
+logger = logging.getLogger(__name__)
+
+#%%definitions
+class AdaptiveBatcher:
+    """controller for `num_alerts` and `timeout` of consecutive polls
+
+    - call `next()` before every poll and `update()` after it
+    - call `observe()` whenever alerts have been processed
+    - rules applied in `update()`
+        - full batch (the stream has a backlog)
+            - `num_alerts` is doubled
+            - `timeout` is halved
+        - empty batch (the stream is quiet)
+            - `num_alerts` is halved
+            - `timeout` is doubled
+        - partial batch
+            - `num_alerts` follows the number of alerts received (with some headroom)
+    - `num_alerts` is always capped by
+        - `max_alerts`
+        - the number of alerts that can be processed within `target_latency` (estimated from `observe()`)
+        - the free capacity reported by `free()` (if set)
+    - thread-safe
+
+    Attributes
+        - `min_alerts`
+            - `int`, optional
+            - lower bound for `num_alerts`
+            - the default is `1`
+        - `max_alerts`
+            - `int`, optional
+            - upper bound for `num_alerts`
+            - the default is `1000`
+        - `min_timeout`
+            - `float`, optional
+            - lower bound for `timeout` in seconds
+            - the default is `1`
+        - `max_timeout`
+            - `float`, optional
+            - upper bound for `timeout` in seconds
+            - the default is `90`
+        - `target_latency`
+            - `float`, optional
+            - time in seconds processing a single batch should take at most
+            - the default is `10`
+        - `parallelism`
+            - `int`, optional
+            - number of alerts processed concurrently
+            - durations passed to `observe()` are divided by `parallelism` to obtain the throughput
+            - the default is `1`
+        - `free`
+            - `Callable[[], int]`, optional
+            - returns the number of alerts downstream can currently take without blocking
+            - the default is `None`
+                - no backpressure applied
+        - `capacity`
+            - `int`, optional
+            - largest value `free()` can return (i.e., the size of the downstream queue)
+            - `next()` waits for at most `capacity` free slots, even if `min_alerts` is larger
+            - the default is `None`
+                - unbounded
+        - `stopped`
+            - `Callable[[], bool]`, optional
+            - returns whether a shutdown was requested
+            - `next()` stops waiting for `free()` once it returns `True`
+            - the default is `None`
+        - `smoothing`
+            - `float`, optional
+            - weight of the newest observation in the moving average of processing times
+            - the default is `0.2`
+        - `metrics`
+            - `thump.fink_lsst.metrics.Metrics`, optional
+            - registry to record the current `num_alerts`, `timeout` and time spent pausing in
+            - the default is `None`
+                - no metrics recorded
+        - `num_alerts`
+            - `int`
+            - number of alerts to request in the next poll
+        - `timeout`
+            - `float`
+            - timeout of the next poll
+        - `seconds_per_alert`
+            - `float`
+            - moving average of the time processing a single alert takes
+            - `None` until the first call to `observe()`
+
+    Methods
+        - `next()`
+        - `update()`
+        - `observe()`
+    """
+
+    def __init__(self,
+        min_alerts:int=1, max_alerts:int=1000,
+        min_timeout:float=1, max_timeout:float=90,
+        target_latency:float=10,
+        parallelism:int=1,
+        free:Callable[[], int]=None,
+        capacity:int=None,
+        stopped:Callable[[], bool]=None,
+        smoothing:float=0.2,
+        metrics:thmt.Metrics=None,
+        ):
+
+        if min_alerts > max_alerts:
+            raise ValueError(f"`min_alerts` has to be smaller or equal to `max_alerts` but they are {min_alerts} and {max_alerts}")
+        if min_timeout > max_timeout:
+            raise ValueError(f"`min_timeout` has to be smaller or equal to `max_timeout` but they are {min_timeout} and {max_timeout}")
+
+        self.min_alerts     = max(1, min_alerts)
+        self.max_alerts     = max_alerts
+        self.min_timeout    = min_timeout
+        self.max_timeout    = max_timeout
+        self.target_latency = target_latency
+        self.parallelism    = max(1, parallelism)
+        self.free           = free
+        self.capacity       = capacity
+        self.stopped        = stopped
+        self.smoothing      = smoothing
+        self.metrics        = metrics
+
+        self.num_alerts         = self.min_alerts
+        self.timeout            = self.max_timeout
+        self.seconds_per_alert  = None
+
+        self._lock = threading.Lock()
+
+        if self.metrics is not None:
+            self.metrics.gauge("batch_num_alerts", lambda: self.num_alerts)
+            self.metrics.gauge("batch_timeout_seconds", lambda: self.timeout)
+
+        return
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(\n"
+            f"    min_alerts={self.min_alerts!r}, max_alerts={self.max_alerts!r},\n"
+            f"    min_timeout={self.min_timeout!r}, max_timeout={self.max_timeout!r},\n"
+            f"    target_latency={self.target_latency!r},\n"
+            f"    parallelism={self.parallelism!r},\n"
+            f"    free={self.free!r},\n"
+            f"    capacity={self.capacity!r},\n"
+            f"    stopped={self.stopped!r},\n"
+            f"    smoothing={self.smoothing!r},\n"
+            f"    metrics={self.metrics!r},\n"
+            f")"
+        )
+
+    def _cap(self) -> int:
+        """upper bound for `num_alerts` given the current processing throughput"""
+        if (self.seconds_per_alert is None) or (self.seconds_per_alert <= 0):
+            return self.max_alerts
+        return int(np.clip(self.target_latency / self.seconds_per_alert, self.min_alerts, self.max_alerts))
+
+    def next(self, wait:float=0.1) -> Tuple[int,float]:
+        """returns `num_alerts` and `timeout` to use in the next poll
+
+        - blocks while downstream can take fewer than `min_alerts` alerts
+            - at most `capacity` alerts are waited for
+            - returns right away once `stopped()` returns `True`
+
+        Parameters
+            - `wait`
+                - `float`, optional
+                - interval in seconds to check `free()` in while pausing
+                - the default is `0.1`
+
+        Returns
+            - `num_alerts`
+                - `int`
+                - maximum number of alerts to request
+            - `timeout`
+                - `float`
+                - timeout of the poll in seconds
+        """
+        free = self.max_alerts
+        needed = self.min_alerts if self.capacity is None else min(self.min_alerts, self.capacity)
+        if self.free is not None:
+            start = time.perf_counter()
+            while (free := self.free()) < needed:
+                if (self.stopped is not None) and self.stopped():
+                    break
+                time.sleep(wait)
+            paused = time.perf_counter() - start
+            if (paused > wait) and (self.metrics is not None):
+                self.metrics.inc("batch_paused_seconds_total", paused)
+
+        with self._lock:
+            return max(needed, min(self.num_alerts, free)), self.timeout
+
+    def update(self, num_alerts:int, nreceived:int):
+        """adapts `num_alerts` and `timeout` to the outcome of a poll
+
+        Parameters
+            - `num_alerts`
+                - `int`
+                - number of alerts requested in the poll (as returned by `next()`)
+            - `nreceived`
+                - `int`
+                - number of alerts the poll returned
+        """
+        with self._lock:
+            if nreceived >= num_alerts:
+                self.num_alerts = 2*self.num_alerts
+                self.timeout    = self.timeout / 2
+            elif nreceived == 0:
+                self.num_alerts = self.num_alerts // 2
+                self.timeout    = 2*self.timeout
+            else:
+                self.num_alerts = int(np.ceil(1.5*nreceived))
+            self.num_alerts = int(np.clip(self.num_alerts, self.min_alerts, self._cap()))
+            self.timeout    = float(np.clip(self.timeout, self.min_timeout, self.max_timeout))
+        return
+
+    def observe(self, nalerts:int, seconds:float):
+        """adds an observation of the processing time
+
+        Parameters
+            - `nalerts`
+                - `int`
+                - number of alerts processed
+            - `seconds`
+                - `float`
+                - time it took to process `nalerts` alerts
+        """
+        if nalerts <= 0:
+            return
+        spa = seconds / nalerts / self.parallelism
+        with self._lock:
+            if self.seconds_per_alert is None:
+                self.seconds_per_alert = spa
+            else:
+                self.seconds_per_alert = self.smoothing*spa + (1-self.smoothing)*self.seconds_per_alert
+        return
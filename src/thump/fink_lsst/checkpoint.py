@@ -0,0 +1,245 @@
+"""crash-safe checkpointing of the stream
+
+- files are written atomically
+    - written to a hidden temporary file, synced to disk and renamed
+    - readers never see partially written files
+- kafka offsets are committed manually
+    - only once every alert up to that offset is durable (written to a chunk or the spill log) or got discarded
+    - a restart neither loses alerts nor redoes work that is already on disk
+
+Exceptions
+
+Classes
+    - `OffsetTracker` -- tracks which consumed offsets are safe to commit
+    - `CheckpointedConsumer` -- `AlertConsumer` committing offsets only once alerts are durable
+
+Functions
+    - `atomic_open()` -- context manager to write a file atomically (see `thump.data.filelog`)
+    - `alert_key()` -- key identifying an alert across all stages
+
+Other Objects
+"""
+
+#%%imports
+from confluent_kafka import Consumer, TopicPartition
+from fink_client.consumer import AlertConsumer, _get_kafka_config
+import logging
+import threading
+from typing import Any, Dict, List, Tuple
+
+from thump.data.filelog import atomic_open     #re-exported, i.e., `thump.fink_lsst.checkpoint.atomic_open()` keeps working
+
+logger = logging.getLogger(__name__)
+
+#%%definitions
+def alert_key(alert:List[Any]) -> str:
+    """returns the key identifying an alert across all stages
+
+    - same as the keys of `data_json` (see `thump.fink_lsst.decoding.decode_alert()`)
+
+    Parameters
+        - `alert`
+            - `List[Any]`
+            - single alert
+            - `[topic, alert, key]` as returned by `consume_alerts()`
+
+    Returns
+        - `key`
+            - `str`
+            - `diaSourceId` of the alert
+    """
+    return str(alert[1]["diaSource"]["diaSourceId"])
+
+class OffsetTracker:
+    """tracks which consumed offsets are safe to commit
+
+    - every consumed alert is registered with its topic, partition and offset
+    - alerts are marked as done once they are durable or got discarded
+    - per partition, the committable offset is the smallest offset that is not done yet
+        - or one past the largest consumed offset if all are done
+    - thread-safe
+
+    Attributes
+        - `npending`
+            - `int`
+            - number of alerts consumed but not done yet
+
+    Methods
+        - `consumed()`
+        - `done()`
+        - `committable()`
+        - `committed()`
+    """
+
+    def __init__(self):
+
+        self._keys:Dict[str,List[Tuple[str,int,int]]] = dict()    #key -> [(topic, partition, offset)]
+        self._pending:Dict[Tuple[str,int],set] = dict()             #(topic, partition) -> offsets not done
+        self._next:Dict[Tuple[str,int],int] = dict()                #(topic, partition) -> one past the largest consumed offset
+        self._committed:Dict[Tuple[str,int],int] = dict()           #(topic, partition) -> last committed offset
+        self._lock = threading.Lock()
+
+        return
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(\n"
+            f")"
+        )
+
+    @property
+    def npending(self) -> int:
+        with self._lock:
+            return sum(len(v) for v in self._pending.values())
+
+    def consumed(self, key:str, topic:str, partition:int, offset:int):
+        """registers a consumed alert"""
+        tp = (topic, partition)
+        with self._lock:
+            self._keys.setdefault(key, []).append((topic, partition, offset))
+            self._pending.setdefault(tp, set()).add(offset)
+            self._next[tp] = max(self._next.get(tp, 0), offset + 1)
+        return
+
+    def done(self, keys:List[str]):
+        """marks alerts as durable or discarded
+
+        - unknown keys are ignored (i.e., alerts replayed from a spill log)
+        """
+        with self._lock:
+            for key in keys:
+                for topic, partition, offset in self._keys.pop(key, []):
+                    self._pending[(topic, partition)].discard(offset)
+        return
+
+    def committable(self) -> List[Tuple[str,int,int]]:
+        """returns the offsets that can be committed
+
+        Returns
+            - `offsets`
+                - `List[Tuple[str,int,int]]`
+                - topic, partition and offset to commit
+                - only partitions that advanced since the last call to `committed()`
+        """
+        offsets = []
+        with self._lock:
+            for tp, nxt in self._next.items():
+                pending = self._pending[tp]
+                offset = min(pending) if len(pending) > 0 else nxt
+                if offset > self._committed.get(tp, -1):
+                    offsets.append((*tp, offset))
+        return offsets
+
+    def committed(self, offsets:List[Tuple[str,int,int]]):
+        """records that `offsets` have been committed"""
+        with self._lock:
+            for topic, partition, offset in offsets:
+                self._committed[(topic, partition)] = max(self._committed.get((topic, partition), -1), offset)
+        return
+
+class CheckpointedConsumer(AlertConsumer):
+    """`AlertConsumer` committing offsets only once alerts are durable
+
+    - creates and subscribes the kafka consumer itself with auto-commit disabled
+        - configured via `fink_client.consumer._get_kafka_config()`, i.e., the same way as `AlertConsumer`
+    - records the offset of every consumed alert in `tracker`
+    - `commit()` commits the offsets of all alerts that are done (see `OffsetTracker`)
+    - `close()` commits a final time before closing the connection
+    - takes the same arguments as `fink_client.consumer.AlertConsumer`
+
+    Attributes
+        - `tracker`
+            - `OffsetTracker`
+            - offsets of consumed alerts
+
+    Methods
+        - `consume()`
+        - `done()`
+        - `commit()`
+        - `close()`
+    """
+
+    def __init__(self,
+        topics:list,
+        config:dict,
+        survey:str,
+        schema_path:str=None,
+        dump_schema:bool=False,
+        on_assign=None,
+        ):
+
+        #`AlertConsumer.__init__()` neither forwards arbitrary kafka settings nor allows delaying the subscription
+        ##hence it is not called, the kafka consumer is created and subscribed here instead
+        ##the inherited `process_message()`, `_decode_msg()` and `close()` rely on the attributes below
+        ##they mirror `AlertConsumer.__init__()`, only the kafka configuration differs (auto-commit disabled)
+        self.survey         = survey
+        self.schema_path    = schema_path
+        self.dump_schema    = dump_schema
+        self._topics        = topics
+        self._kafka_config  = {**_get_kafka_config(config), "enable.auto.commit":False}
+        self._consumer      = Consumer(self._kafka_config)
+        if on_assign is not None:
+            self._consumer.subscribe(self._topics, on_assign=on_assign)
+        else:
+            self._consumer.subscribe(self._topics)
+
+        self.tracker = OffsetTracker()
+
+        return
+
+    def consume(self, num_alerts:int=1, timeout:float=-1) -> list:
+        """consumes alerts and records their offsets
+
+        - same as `fink_client.consumer.AlertConsumer.consume()`
+        - alerts that fail to decode are logged and skipped (their offsets count as done)
+        """
+        alerts = []
+        for msg in self._consumer.consume(num_alerts, timeout):
+            if msg is None:
+                continue
+            try:
+                alert = self.process_message(msg)
+                key = alert_key(alert)
+            except Exception as e:
+                logger.warning(f"{self.__class__.__name__}.consume(): skipping message at {msg.topic()}[{msg.partition()}] offset {msg.offset()}: {e}")
+                key = f"__undecodable_{msg.topic()}_{msg.partition()}_{msg.offset()}"
+                self.tracker.consumed(key, msg.topic(), msg.partition(), msg.offset())
+                self.tracker.done([key])
+                continue
+            self.tracker.consumed(key, msg.topic(), msg.partition(), msg.offset())
+            alerts.append(alert)
+        return alerts
+
+    def done(self, keys:List[str]):
+        """marks alerts as durable or discarded and commits the resulting offsets asynchronously"""
+        self.tracker.done(keys)
+        self.commit(asynchronous=True)
+        return
+
+    def commit(self, asynchronous:bool=False):
+        """commits the offsets of all alerts that are done
+
+        Parameters
+            - `asynchronous`
+                - `bool`, optional
+                - whether to return before the broker acknowledged the commit
+                - the default is `False`
+        """
+        offsets = self.tracker.committable()
+        if len(offsets) == 0:
+            return
+        try:
+            self._consumer.commit(offsets=[TopicPartition(t, p, o) for t, p, o in offsets], asynchronous=asynchronous)
+            self.tracker.committed(offsets)
+            logger.debug(f"{self.__class__.__name__}.commit(): committed {offsets}")
+        except Exception as e:
+            logger.warning(f"{self.__class__.__name__}.commit(): exception while committing offsets: {e}")
+        return
+
+    def close(self):
+        """commits all offsets that are done and closes the connection"""
+        self.commit(asynchronous=False)
+        if self.tracker.npending > 0:
+            logger.info(f"{self.__class__.__name__}.close(): {self.tracker.npending} alerts not durable yet. they will be consumed again on restart")
+        super().close()
+        return
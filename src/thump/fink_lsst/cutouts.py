@@ -0,0 +1,143 @@
+"""lightweight decoding of FITS cutouts
+
+- lsst alert cutouts are small single-HDU images
+    - parsing them with `astropy.io.fits.open()` (header parsing, `HDUList` construction) dominates the per-alert cost
+- the fast path reads only the few header keywords needed to locate and interpret the data
+    - the data is then interpreted directly via `np.frombuffer()`
+- anything unusual falls back to `astropy.io.fits`
+    - i.e., scaled data (`BSCALE`, `BZERO`), data in extensions, compressed images, random groups, more than two axes
+- the output is identical to `astropy.io.fits.open(...)[0].data` (including dtype and byte order)
+
+Exceptions
+
+Classes
+
+Functions
+    - `decode_cutout()` -- decode a single cutout
+    - `decode_cutouts()` -- decode a batch of cutouts into a single stacked array
+
+Other Objects
+"""
+
+#%%imports
+from astropy.io import fits
+from io import BytesIO
+import logging
+import numpy as np
+from typing import Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+#%%definitions
+_BLOCK  = 2880  #FITS block size in bytes
+_CARD   = 80    #FITS card size in bytes
+_DTYPES = {8:">u1", 16:">i2", 32:">i4", 64:">i8", -32:">f4", -64:">f8"}    #BITPIX -> dtype
+
+def _parse_header(buf:bytes) -> Tuple[dict,int]:
+    """parses the primary header of `buf`
+
+    - only keeps keywords with a value
+    - values are kept as stripped strings (comments removed)
+
+    Returns
+        - `header`
+            - `dict`
+            - keyword -> value
+            - `None` if no `END` card was found
+        - `offset`
+            - `int`
+            - byte offset of the data
+    """
+    header = dict()
+    for pos in range(0, len(buf) - _CARD + 1, _CARD):
+        card = buf[pos:pos+_CARD]
+        key = card[:8].rstrip()
+        if key == b"END":
+            return header, (pos // _BLOCK + 1) * _BLOCK
+        if card[8:10] == b"= ":
+            value = card[10:]
+            if not value.lstrip().startswith(b"'"):
+                value = value.split(b"/", 1)[0]    #numeric/logical values cannot contain `/`
+            header[key.decode("ascii")] = value.strip().decode("ascii", errors="replace")
+    return None, 0
+
+def _decode_fast(buf:bytes) -> np.ndarray:
+    """decodes `buf` without astropy. returns `None` if the cutout is not a plain 2d image"""
+    header, offset = _parse_header(buf)
+    if header is None:
+        return None
+    if (header.get("SIMPLE") != "T") or (header.get("NAXIS") != "2") or (header.get("GROUPS") == "T"):
+        return None
+    if ("ZIMAGE" in header) or (header.get("BSCALE", "1") not in ("1", "1.", "1.0")) or (header.get("BZERO", "0") not in ("0", "0.", "0.0")):
+        return None
+    try:
+        dtype = _DTYPES[int(header["BITPIX"])]
+        shape = (int(header["NAXIS2"]), int(header["NAXIS1"]))
+    except (KeyError, ValueError):
+        return None
+    count = shape[0] * shape[1]
+    if len(buf) < offset + count * np.dtype(dtype).itemsize:
+        return None
+    return np.frombuffer(buf, dtype=dtype, count=count, offset=offset).reshape(shape).copy()
+
+def decode_cutout(buf:bytes) -> np.ndarray:
+    """decodes a single FITS cutout
+
+    - uses the fast path for plain 2d images and `astropy.io.fits` otherwise
+
+    Parameters
+        - `buf`
+            - `bytes`
+            - raw FITS file (i.e., `alert["cutoutScience"]`)
+
+    Returns
+        - `data`
+            - `np.ndarray`
+            - image data of the primary HDU
+            - same as `astropy.io.fits.open(BytesIO(buf))[0].data`
+    """
+    data = _decode_fast(buf)
+    if data is None:
+        with fits.open(BytesIO(buf)) as hdul:
+            data = hdul[0].data
+            data = data.copy() if data is not None else None
+    return data
+
+def decode_cutouts(cutouts:Sequence[Sequence[bytes]], dtype:np.dtype=None) -> np.ndarray:
+    """decodes a batch of FITS cutouts into a single stacked array
+
+    Parameters
+        - `cutouts`
+            - `Sequence[Sequence[bytes]]`
+            - `N` alerts with `K` cutouts each
+                - i.e., rows of (`cutoutScience`, `cutoutTemplate`, `cutoutDifference`)
+        - `dtype`
+            - `np.dtype`, optional
+            - dtype of the output
+            - the default is `None`
+                - common dtype of all cutouts in native byte order
+
+    Raises
+        - `ValueError`
+            - if the cutouts do not all have the same shape
+
+    Returns
+        - `stack`
+            - `np.ndarray`
+            - array of shape `(N, K, H, W)`
+    """
+    data = [[decode_cutout(c) for c in row] for row in cutouts]
+    if len(data) == 0:
+        return np.empty((0, 0, 0, 0), dtype=dtype if dtype is not None else np.float32)
+
+    shapes = {d.shape for row in data for d in row}
+    if len(shapes) > 1:
+        raise ValueError(f"all cutouts have to have the same shape but found {sorted(shapes)}")
+    if dtype is None:
+        dtype = np.result_type(*{d.dtype for row in data for d in row}).newbyteorder("=")
+
+    stack = np.empty((len(data), len(data[0]), *shapes.pop()), dtype=dtype)
+    for i, row in enumerate(data):
+        for j, d in enumerate(row):
+            stack[i,j] = d
+    return stack
@@ -0,0 +1,279 @@
+"""decoding of streamed lsst alerts into `ThumP!` format
+
+- splits decoding into
+    - a cheap extraction of the fields `ThumP!` needs (runs in the consuming process)
+    - the expensive FITS decoding (can run in a separate process, see `thump.fink_lsst.cutouts`)
+- thumbnails are carried as `np.ndarray` until they get serialized (see `thump.data.encoding`)
+    - avoids building (and pickling) large nested lists
+
+Exceptions
+
+Classes
+    - `AlertDecoderPool` -- persistent process pool decoding alerts
+
+Functions
+    - `extract_payload()` -- extract the fields relevant for `ThumP!` from an alert
+    - `decode_payload()` -- decode an extracted payload into `ThumP!` format
+    - `decode_alert()` -- decode a single alert into `ThumP!` format
+
+Other Objects
+"""
+
+#%%imports
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import logging
+import multiprocessing
+import numpy as np
+import os
+import time
+from typing import Any, List
+
+from thump.fink_lsst import cutouts as thco
+from thump.fink_lsst import metrics as thmt
+
+logger = logging.getLogger(__name__)
+
+#%%definitions
+def extract_payload(alert:List[Any]) -> dict:
+    """extracts the fields relevant for `ThumP!` from a single alert
+
+    - the returned payload only contains raw cutout bytes and scalars
+        - cheap to send to worker processes
+
+    Parameters
+        - `alert`
+            - `List[Any]`
+            - single alert
+            - `[topic, alert, key]` as returned by `consume_alerts()`
+
+    Returns
+        - `payload`
+            - `dict`
+            - fields relevant for `ThumP!`
+    """
+    topic, alert, key = alert
+    payload = dict(
+        cutoutScience=alert["cutoutScience"],
+        cutoutTemplate=alert["cutoutTemplate"],
+        cutoutDifference=alert["cutoutDifference"],
+        diaObjectId=alert["diaObject"]["diaObjectId"],
+        diaSourceId=alert["diaSource"]["diaSourceId"],
+        midpointMjdTai=alert["diaSource"]["midpointMjdTai"],
+        ra=alert["diaObject"]["ra"],
+        dec=alert["diaObject"]["dec"],
+    )
+    return payload
+
+def decode_payload(payload:dict) -> dict:
+    """decodes an extracted payload into `ThumP!` format
+
+    - thumbnails are returned as raw `np.ndarray`
+        - rounding and replacing NaN happens upon serialization (see `thump.data.encoding`)
+
+    Parameters
+        - `payload`
+            - `dict`
+            - payload as returned by `extract_payload()`
+
+    Returns
+        - `data_json`
+            - `dict`
+            - alert in `ThumP!` format
+            - keys are `diaSourceId`
+    """
+
+    #select/preprocess cutouts
+    thumbnails = [thco.decode_cutout(payload[c]) for c in ["cutoutScience", "cutoutTemplate", "cutoutDifference"]]
+
+    #compile file
+    data_json = {
+        payload["diaSourceId"]: dict(
+            link=f"https://lsst.fink-portal.org/{payload['diaObjectId']}",
+            thumbnailTypes=[
+                "science",
+                "template",
+                "differece",
+            ],
+            thumbnails=thumbnails,
+            diaObjectId=str(payload["diaObjectId"]),
+            diaSourceId=str(payload["diaSourceId"]),
+            midpointMjdTai=np.round(payload["midpointMjdTai"], decimals=4),
+            ra=np.round(payload["ra"], decimals=7) if payload["ra"] is not None else None,
+            dec=np.round(payload["dec"], decimals=7) if payload["dec"] is not None else None,
+            comment="",
+        )
+    }
+
+    return data_json
+
+def decode_alert(alert:List[Any]) -> dict:
+    """decodes a single alert into `ThumP!` format
+
+    - runs in the calling process
+
+    Parameters
+        - `alert`
+            - `List[Any]`
+            - single alert
+            - `[topic, alert, key]` as returned by `consume_alerts()`
+
+    Returns
+        - `data_json`
+            - `dict`
+            - alert in `ThumP!` format
+            - keys are `diaSourceId`
+    """
+    return decode_payload(extract_payload(alert))
+
+def _warmup() -> int:
+    """no-op run by every worker process of `AlertDecoderPool` upon creation"""
+    return os.getpid()
+
+class AlertDecoderPool:
+    """persistent process pool decoding alerts
+
+    - the pool is created once and reused for every poll
+        - worker processes stay warm (imports, FITS machinery)
+    - worker processes are started from a clean interpreter (`forkserver`, `spawn` where unavailable)
+        - never forked from the (multi-threaded) consuming process, which can deadlock on locks held by other threads
+        - all workers are started upon creation, i.e., create the pool before the consumer
+    - a worker dying (i.e., OOM-killed) breaks the pool
+        - `decode()` and `map()` raise `concurrent.futures.process.BrokenProcessPool`
+        - the affected alerts must not be considered processed
+    - decoding runs in separate processes and is therefore not bound by the GIL
+    - only the payload (cutout bytes and scalars, see `extract_payload()`) is sent to the workers
+    - thumbnails are returned as `np.ndarray`
+        - pickled as raw buffers instead of large nested lists
+    - exposes the same per-alert semantics as `decode_alert()`
+    - can be used as a context manager
+
+    Attributes
+        - `nprocs`
+            - `int`, optional
+            - number of worker processes
+            - the default is `1`
+        - `metrics`
+            - `thump.fink_lsst.metrics.Metrics`, optional
+            - registry to record decode latencies in
+            - latencies include the time an alert waited for a free worker
+            - the default is `None`
+                - no metrics recorded
+
+    Methods
+        - `submit()`
+        - `decode()`
+        - `map()`
+        - `close()`
+    """
+
+    def __init__(self,
+        nprocs:int=1,
+        metrics:thmt.Metrics=None,
+        ):
+
+        self.nprocs = max(1, nprocs)
+        self.metrics = metrics
+
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        self._executor = ProcessPoolExecutor(max_workers=self.nprocs, mp_context=multiprocessing.get_context(method))
+
+        #start all workers now (processes are otherwise only created on demand)
+        for fut in [self._executor.submit(_warmup) for _ in range(self.nprocs)]:
+            fut.result()
+
+        return
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(\n"
+            f"    nprocs={self.nprocs!r},\n"
+            f"    metrics={self.metrics!r},\n"
+            f")"
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+        return
+
+    def submit(self, alert:List[Any]):
+        """submits a single alert for decoding
+
+        Parameters
+            - `alert`
+                - `List[Any]`
+                - single alert
+                - `[topic, alert, key]` as returned by `consume_alerts()`
+
+        Returns
+            - `future`
+                - `concurrent.futures.Future`
+                - future resolving to the output of `decode_alert()`
+        """
+        fut = self._executor.submit(decode_payload, extract_payload(alert))
+        if self.metrics is not None:
+            start = time.perf_counter()
+            fut.add_done_callback(lambda f: self.metrics.observe("stage_seconds", time.perf_counter() - start, stage="decode"))
+        return fut
+
+    def decode(self, alert:List[Any]) -> dict:
+        """decodes a single alert in one of the worker processes
+
+        - blocks until the alert is decoded
+
+        Parameters
+            - `alert`
+                - `List[Any]`
+                - single alert
+                - `[topic, alert, key]` as returned by `consume_alerts()`
+
+        Returns
+            - `data_json`
+                - `dict`
+                - alert in `ThumP!` format
+                - same as `decode_alert()`
+        """
+        return self.submit(alert).result()
+
+    def map(self, alerts:List[List[Any]]) -> List[dict]:
+        """decodes a batch of alerts
+
+        - alerts that fail to decode are logged and skipped
+        - raises `concurrent.futures.process.BrokenProcessPool` if a worker process died
+            - no alert of the batch is considered decoded
+
+        Parameters
+            - `alerts`
+                - `List[List[Any]]`
+                - batch of alerts as returned by `consume_alerts()`
+
+        Returns
+            - `data_jsons`
+                - `List[dict]`
+                - decoded alerts (see `decode_alert()`)
+        """
+        futures = []
+        for alert in alerts:
+            try:
+                futures.append(self.submit(alert))
+            except BrokenProcessPool:
+                raise
+            except Exception as e:
+                logger.warning(f"{self.__class__.__name__}.map(): exception while extracting alert: {e}")
+        data_jsons = []
+        for fut in futures:
+            try:
+                data_jsons.append(fut.result())
+            except BrokenProcessPool:
+                raise
+            except Exception as e:
+                logger.warning(f"{self.__class__.__name__}.map(): exception while decoding alert: {e}")
+        return data_jsons
+
+    def close(self):
+        """shuts down the worker processes"""
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        return
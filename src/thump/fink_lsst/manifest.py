@@ -0,0 +1,145 @@
+"""manifest of files already processed by `thump_from_fink_datatransfer`
+
+- records every processed input file with
+    - its size and modification time (optionally a content hash)
+    - the output chunks it ended up in
+- allows re-runs to
+    - only process new or changed files
+    - continue the chunk numbering instead of overwriting existing chunks
+
+Exceptions
+
+Classes
+    - `Manifest` -- manifest of processed input files and the chunks they produced
+
+Functions
+
+Other Objects
+"""
+
+#%%imports
+import glob
+import logging
+import os
+import re
+from typing import Dict, List
+
+from thump.data import filelog as thfl
+
+logger = logging.getLogger(__name__)
+
+#%%definitions
+class Manifest:
+    """manifest of processed input files and the chunks they produced
+
+    - stored as json in `path` (see `thump.data.filelog.FileLog`)
+        - `files`: path -> `size`, `mtime`, (`sha256`), `chunks`
+        - `next_chunk`: index of the next chunk to write
+            - inferred from existing `processed_*.json` (or `.thump`, compressed or not) next to `path` if there is no manifest yet
+    - files are identified by their absolute path
+    - a file counts as changed if its size, modification time or (if `checksum` is set) content hash differ
+        - chunks produced by a previous version of a changed file are kept
+    - written atomically (see `thump.data.filelog.atomic_open()`)
+
+    Attributes
+        - `path`
+            - `str`
+            - file to load the manifest from and save it to
+        - `checksum`
+            - `bool`, optional
+            - whether to also compare content hashes (sha256)
+            - more robust than size and modification time but requires reading every file
+            - the default is `False`
+        - `log`
+            - `FileLog`
+            - underlying log of processed files
+        - `files`
+            - `Dict[str,dict]`
+            - recorded input files
+        - `next_chunk`
+            - `int`
+            - index of the next chunk to write
+
+    Methods
+        - `changed()`
+        - `record()`
+        - `save()`
+    """
+
+    def __init__(self,
+        path:str,
+        checksum:bool=False,
+        ):
+
+        self.path       = path
+        self.checksum   = checksum
+
+        self.log = thfl.FileLog(self.path, checksum=self.checksum)
+        if "next_chunk" in self.log.meta:
+            logger.info(f"{self.__class__.__name__}: loaded {len(self.files)} processed files from {self.path} (next chunk: {self.next_chunk})")
+        else:
+            #do not overwrite chunks written without a manifest
+            idxs = [int(m.group(1)) for fn in glob.glob(os.path.join(os.path.dirname(self.path), "processed_*")) if (m := re.search(r"processed_(\d+)\.(?:json|thump)(?:\.gz|\.zst)?$", fn)) is not None]
+            self.next_chunk = max(idxs, default=-1) + 1
+
+        return
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(\n"
+            f"    path={self.path!r},\n"
+            f"    checksum={self.checksum!r},\n"
+            f")"
+        )
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    @property
+    def files(self) -> Dict[str,dict]:
+        return self.log.files
+
+    @property
+    def next_chunk(self) -> int:
+        return self.log.meta["next_chunk"]
+
+    @next_chunk.setter
+    def next_chunk(self, next_chunk:int):
+        self.log.meta["next_chunk"] = next_chunk
+
+    def changed(self, fnames:List[str]) -> List[str]:
+        """returns the files in `fnames` that are new or changed since they were recorded
+
+        Parameters
+            - `fnames`
+                - `List[str]`
+                - files to check
+
+        Returns
+            - `changed`
+                - `List[str]`
+                - files that have to be processed (same order as in `fnames`)
+        """
+        changed = []
+        for fn in fnames:
+            entry = self.log.get(fn)
+            if entry is None:
+                changed.append(fn)
+            elif self.log.changed(fn):
+                logger.warning(f"{self.__class__.__name__}.changed(): {fn} changed since it was processed. chunks {entry['chunks']} are kept and it gets processed again")
+                changed.append(fn)
+        return changed
+
+    def record(self, fname:str, chunks:List[int]):
+        """records `fname` as processed into `chunks`
+
+        - advances `next_chunk` past `chunks`
+        """
+        self.log.record(fname, chunks=sorted(chunks))
+        self.next_chunk = max([self.next_chunk, *[c + 1 for c in chunks]])
+        return
+
+    def save(self):
+        """writes the manifest to `path` (atomically)"""
+        self.log.save()
+        return
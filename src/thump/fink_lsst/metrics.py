@@ -0,0 +1,337 @@
+"""structured metrics for the streaming pipeline
+
+- counters, gauges and histograms, identified by name and labels
+    - i.e., latencies per stage (consume, decode, encode, write, reformat)
+    - i.e., queue depths between stages
+    - i.e., lag between `midpointMjdTai` of an alert and the time it ends up on disk
+- periodically exported to
+    - a prometheus text file (i.e., for the node-exporter textfile collector)
+    - a jsonl file (one snapshot per line)
+
+Exceptions
+
+Classes
+    - `Metrics` -- thread-safe registry of counters, gauges and histograms
+    - `MetricsExporter` -- periodically exports a `Metrics` registry
+
+Functions
+    - `mjd_now()` -- current time as MJD (TAI)
+
+Other Objects
+    - `LATENCY_BUCKETS` -- default histogram buckets for latencies in seconds
+    - `LAG_BUCKETS` -- default histogram buckets for alert lags in seconds
+"""
+
+#%%imports
+from contextlib import contextmanager
+import json
+import logging
+import numpy as np
+import threading
+import time
+from typing import Callable, Dict, List, Tuple
+
+from thump.data import filelog as thfl
+
+logger = logging.getLogger(__name__)
+
+#%%definitions
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+LAG_BUCKETS     = (1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600, 7200, 21600, 86400)
+_TAI_UTC        = 37        #TAI-UTC in seconds (valid since 2017-01-01)
+_MJD_UNIX_EPOCH = 40587     #MJD of 1970-01-01
+
+def mjd_now() -> float:
+    """returns the current time as MJD (TAI)
+
+    - comparable to `midpointMjdTai` of lsst alerts
+
+    Returns
+        - `mjd`
+            - `float`
+            - current time as modified julian date in TAI
+    """
+    return (time.time() + _TAI_UTC) / 86400 + _MJD_UNIX_EPOCH
+
+class _Histogram:
+    """cumulative histogram with fixed buckets (prometheus semantics)"""
+    def __init__(self, buckets:Tuple[float]):
+        self.buckets = np.asarray(buckets, dtype=np.float64)
+        self.counts = np.zeros(len(buckets)+1, dtype=np.int64)   #last bin is +Inf
+        self.sum = 0.
+        self.count = 0
+        return
+
+    def observe(self, value:float):
+        self.counts[np.searchsorted(self.buckets, value, side="left")] += 1
+        self.sum += value
+        self.count += 1
+        return
+
+    def quantile(self, q:float) -> float:
+        """estimates quantile `q` by linear interpolation within the buckets"""
+        if self.count == 0: return float("nan")
+        cum = np.cumsum(self.counts)
+        idx = int(np.searchsorted(cum, q*self.count, side="left"))
+        if idx >= len(self.buckets): return float(self.buckets[-1])
+        lo = self.buckets[idx-1] if idx > 0 else 0.
+        prev = cum[idx-1] if idx > 0 else 0
+        frac = (q*self.count - prev) / max(self.counts[idx], 1)
+        return float(lo + frac*(self.buckets[idx] - lo))
+
+class Metrics:
+    """thread-safe registry of counters, gauges and histograms
+
+    - every metric is identified by its `name` and a set of labels (kwargs)
+    - all names get prefixed by `namespace` upon export
+
+    Attributes
+        - `namespace`
+            - `str`, optional
+            - prefix of all exported metric names
+            - the default is `"thump"`
+
+    Methods
+        - `inc()`
+        - `gauge()`
+        - `observe()`
+        - `timer()`
+        - `timed()`
+        - `snapshot()`
+        - `to_prometheus()`
+    """
+
+    def __init__(self,
+        namespace:str="thump",
+        ):
+
+        self.namespace = namespace
+
+        self._counters:Dict[Tuple,float] = dict()
+        self._gauges:Dict[Tuple,Callable[[],float]] = dict()
+        self._histograms:Dict[Tuple,_Histogram] = dict()
+        self._lock = threading.Lock()
+
+        return
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(\n"
+            f"    namespace={self.namespace!r},\n"
+            f")"
+        )
+
+    @staticmethod
+    def _key(name:str, labels:dict) -> Tuple:
+        return (name, tuple(sorted(labels.items())))
+
+    def inc(self, name:str, value:float=1, **labels):
+        """increments counter `name` by `value`"""
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+        return
+
+    def gauge(self, name:str, fn:Callable[[],float], **labels):
+        """registers gauge `name` that is evaluated via `fn()` upon export"""
+        with self._lock:
+            self._gauges[self._key(name, labels)] = fn
+        return
+
+    def observe(self, name:str, value:float, buckets:Tuple[float]=LATENCY_BUCKETS, **labels):
+        """adds `value` to histogram `name`
+
+        - `buckets` is only used when the histogram is created
+        """
+        key = self._key(name, labels)
+        with self._lock:
+            if key not in self._histograms:
+                self._histograms[key] = _Histogram(buckets)
+            self._histograms[key].observe(value)
+        return
+
+    @contextmanager
+    def timer(self, name:str, **labels):
+        """context manager adding the runtime of its body (in seconds) to histogram `name`"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def timed(self, fn:Callable, name:str, **labels) -> Callable:
+        """wraps `fn` such that the runtime of every call gets added to histogram `name`"""
+        def wrapper(*args, **kwargs):
+            with self.timer(name, **labels):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    def snapshot(self) -> dict:
+        """returns the current state of all metrics
+
+        Returns
+            - `snapshot`
+                - `dict`
+                - json serializable state of all metrics
+                - histograms are summarized by `count`, `sum`, `mean`, `p50`, `p90`, `p99`
+        """
+        def fmt(key):
+            name, labels = key
+            return name + ("{" + ",".join(f"{k}={v}" for k, v in labels) + "}" if len(labels) > 0 else "")
+
+        with self._lock:
+            counters = {fmt(k):v for k, v in self._counters.items()}
+            gauges = dict()
+            for k, fn in self._gauges.items():
+                try:
+                    gauges[fmt(k)] = fn()
+                except Exception as e:
+                    logger.warning(f"{self.__class__.__name__}.snapshot(): exception evaluating gauge {fmt(k)}: {e}")
+            histograms = {
+                fmt(k):dict(count=h.count, sum=h.sum, mean=(h.sum/h.count if h.count > 0 else None), p50=h.quantile(0.5), p90=h.quantile(0.9), p99=h.quantile(0.99))
+                for k, h in self._histograms.items()
+            }
+        return dict(time=time.time(), counters=counters, gauges=gauges, histograms=histograms)
+
+    def to_prometheus(self) -> str:
+        """renders all metrics in the prometheus text exposition format
+
+        Returns
+            - `text`
+                - `str`
+                - metrics in prometheus text format
+        """
+        def labelstr(labels, extra=()):
+            labels = list(labels) + list(extra)
+            return ("{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}") if len(labels) > 0 else ""
+
+        lines:List[str] = []
+        typed = set()
+        with self._lock:
+            for (name, labels), v in sorted(self._counters.items()):
+                n = f"{self.namespace}_{name}"
+                if n not in typed: lines.append(f"# TYPE {n} counter"); typed.add(n)
+                lines.append(f"{n}{labelstr(labels)} {v}")
+            for (name, labels), fn in sorted(self._gauges.items(), key=lambda kv: kv[0]):
+                n = f"{self.namespace}_{name}"
+                try:
+                    v = fn()
+                except Exception:
+                    continue
+                if n not in typed: lines.append(f"# TYPE {n} gauge"); typed.add(n)
+                lines.append(f"{n}{labelstr(labels)} {v}")
+            for (name, labels), h in sorted(self._histograms.items(), key=lambda kv: kv[0]):
+                n = f"{self.namespace}_{name}"
+                if n not in typed: lines.append(f"# TYPE {n} histogram"); typed.add(n)
+                cum = np.cumsum(h.counts)
+                for b, c in zip(h.buckets, cum[:-1]):
+                    lines.append(f"{n}_bucket{labelstr(labels, [('le', f'{b:g}')])} {c}")
+                lines.append(f"{n}_bucket{labelstr(labels, [('le', '+Inf')])} {cum[-1]}")
+                lines.append(f"{n}_sum{labelstr(labels)} {h.sum}")
+                lines.append(f"{n}_count{labelstr(labels)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+class MetricsExporter:
+    """periodically exports a `Metrics` registry
+
+    - runs in a background thread
+    - the prometheus file is replaced atomically (see `thump.data.filelog.atomic_open()`)
+    - the jsonl file gets one snapshot appended per export
+    - a final export happens upon `stop()`
+    - can be used as a context manager
+
+    Attributes
+        - `metrics`
+            - `Metrics`
+            - registry to export
+        - `prom_path`
+            - `str`, optional
+            - file to write the prometheus text format to
+            - the default is `None`
+                - not exported
+        - `jsonl_path`
+            - `str`, optional
+            - file to append snapshots to
+            - the default is `None`
+                - not exported
+        - `interval`
+            - `float`, optional
+            - seconds between two exports
+            - the default is `30`
+
+    Methods
+        - `export()`
+        - `start()`
+        - `stop()`
+    """
+
+    def __init__(self,
+        metrics:Metrics,
+        prom_path:str=None,
+        jsonl_path:str=None,
+        interval:float=30,
+        ):
+
+        self.metrics    = metrics
+        self.prom_path  = prom_path
+        self.jsonl_path = jsonl_path
+        self.interval   = interval
+
+        self._stop_event = threading.Event()
+        self._thread = None
+
+        return
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(\n"
+            f"    metrics={self.metrics!r},\n"
+            f"    prom_path={self.prom_path!r},\n"
+            f"    jsonl_path={self.jsonl_path!r},\n"
+            f"    interval={self.interval!r},\n"
+            f")"
+        )
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.stop()
+        return
+
+    def export(self):
+        """exports the current state of `metrics` once"""
+        if self.prom_path is not None:
+            with thfl.atomic_open(self.prom_path, "w") as f:
+                f.write(self.metrics.to_prometheus())
+        if self.jsonl_path is not None:
+            with open(self.jsonl_path, "a") as f:
+                f.write(json.dumps(self.metrics.snapshot()) + "\n")
+        return
+
+    def _loop(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.export()
+            except Exception as e:
+                logger.warning(f"{self.__class__.__name__}._loop(): exception while exporting metrics: {e}")
+        return
+
+    def start(self):
+        """starts exporting in a background thread"""
+        if (self.prom_path is None) and (self.jsonl_path is None):
+            return
+        self._thread = threading.Thread(target=self._loop, name="metrics-exporter", daemon=True)
+        self._thread.start()
+        return
+
+    def stop(self):
+        """stops the background thread and exports a final time"""
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+        self.export()
+        return
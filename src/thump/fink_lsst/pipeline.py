@@ -0,0 +1,393 @@
+"""pipelined runtime for processing streamed alerts
+
+- connects a consumer stage, a pool of long-lived processing workers and a writer stage via bounded queues
+- every stage runs concurrently with its own concurrency setting
+    - waiting on the broker does not block processing and vice versa
+- bounded queues apply backpressure
+    - consumers stop polling if processing can not keep up
+    - memory stays bounded during bursts
+
+Exceptions
+
+Classes
+    - `StreamPipeline` -- pipelined consume/process/write runtime
+
+Functions
+    - `available_cores()` -- number of cores available to the current process
+
+Other Objects
+"""
+
+#%%imports
+from contextlib import nullcontext
+from datetime import datetime
+import logging
+import os
+import queue
+import sys
+import threading
+from typing import Any, Callable, List, Tuple
+
+from thump.fink_lsst import metrics as thmt
+
+logger = logging.getLogger(__name__)
+
+#%%definitions
+_SENTINEL = object()    #signals a stage to shut down
+
+def available_cores() -> int:
+    """returns the number of cores available to the current process
+
+    - respects cpu-affinity (i.e., cores assigned by SLURM) where supported
+
+    Returns
+        - `ncores`
+            - `int`
+            - number of available cores
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+class StreamPipeline:
+    """pipelined consume/process/write runtime
+
+    - runs three stages concurrently, connected by bounded queues
+        - consumer stage: `nconsumers` threads calling `consume()` and forwarding individual alerts
+        - process stage: `nworkers` long-lived threads calling `process()` on every alert
+        - writer stage: `nwriters` threads calling `write()` on every processed alert
+            - or `write_batch()` on all processed alerts available at once
+    - queues are bounded by `queuesize`
+        - a full queue blocks the upstream stage (backpressure)
+    - exceptions raised by `process()` are logged and the respective alert is dropped
+        - exceptions in `fatal` instead stop the pipeline and get re-raised by `run()`
+    - exceptions raised by `write()` or `write_batch()` always stop the pipeline and get re-raised by `run()`
+        - the batch is not persisted and later results are discarded, i.e., nothing after it is considered written
+
+    Attributes
+        - `consume`
+            - `Callable[[], List[Any]]`
+            - function polling a batch of alerts
+            - returns a list of alerts (can be empty)
+        - `process`
+            - `Callable[[Any], Any]`
+            - function processing a single alert
+            - the return value is forwarded to `write()`
+            - `None` results are not forwarded
+        - `write`
+            - `Callable[[Any], None]`, optional
+            - function persisting a single processed alert
+            - only used if `write_batch` is not set
+            - the default is `None`
+        - `write_batch`
+            - `Callable[[List[Any]], None]`, optional
+            - function persisting a batch of processed alerts
+            - if set, every writer drains all results available in the queue and passes them to `write_batch()` at once (instead of calling `write()`)
+                - i.e., to preprocess them in a single vectorized pass
+            - the default is `None`
+        - either `write` or `write_batch` has to be set
+        - `nconsumers`
+            - `int`, optional
+            - number of threads in the consumer stage
+            - the default is `1`
+        - `nworkers`
+            - `int`, optional
+            - number of threads in the process stage
+            - the default is `1`
+        - `nwriters`
+            - `int`, optional
+            - number of threads in the writer stage
+            - the default is `1`
+        - `queuesize`
+            - `int`, optional
+            - maximum number of items held in each queue between stages
+            - the default is `256`
+        - `npolls`
+            - `int`, optional
+            - total number of polls made by the consumer stage
+            - negative values denote polling until `stop()` is called
+            - the default is `-1`
+        - `metrics`
+            - `thump.fink_lsst.metrics.Metrics`, optional
+            - registry to record consume latencies, alert counts per stage and queue depths in
+            - the default is `None`
+                - no metrics recorded
+        - `fatal`
+            - `Tuple[Type[BaseException]]`, optional
+            - exception types raised by `process()` that can not be recovered from (i.e., a broken process pool)
+            - the first such exception stops the pipeline and is re-raised by `run()` after all stages shut down
+            - the default is `()`
+        - `nconsumed`
+            - `int`
+            - number of alerts consumed so far
+        - `nprocessed`
+            - `int`
+            - number of alerts processed so far
+        - `nwritten`
+            - `int`
+            - number of alerts written so far
+        - `interrupted`
+            - `bool`
+            - whether the last call to `run()` got interrupted by a `KeyboardInterrupt`
+        - `error`
+            - `BaseException`
+            - first fatal exception raised by one of the stages (including any exception raised while writing)
+            - `None` if no fatal exception occurred
+
+    Methods
+        - `run()`
+        - `stop()`
+        - `stopped()`
+        - `stats()`
+        - `free()`
+    """
+
+    def __init__(self,
+        consume:Callable[[], List[Any]],
+        process:Callable[[Any], Any],
+        write:Callable[[Any], None]=None,
+        write_batch:Callable[[List[Any]], None]=None,
+        nconsumers:int=1, nworkers:int=1, nwriters:int=1,
+        queuesize:int=256,
+        npolls:int=-1,
+        metrics:thmt.Metrics=None,
+        fatal:Tuple[type]=(),
+        ):
+
+        if (write is None) and (write_batch is None):
+            raise ValueError("either `write` or `write_batch` has to be set")
+
+        self.consume    = consume
+        self.process    = process
+        self.write      = write
+        self.write_batch= write_batch
+        self.nconsumers = max(1, nconsumers)
+        self.nworkers   = max(1, nworkers)
+        self.nwriters   = max(1, nwriters)
+        self.queuesize  = queuesize
+        self.npolls     = npolls
+        self.metrics    = metrics
+        self.fatal      = tuple(fatal)
+
+        self.q_alerts   = queue.Queue(maxsize=queuesize)    #consumer -> process
+        self.q_results  = queue.Queue(maxsize=queuesize)    #process -> writer
+
+        self.npolls_made    = 0
+        self.nconsumed      = 0
+        self.nprocessed     = 0
+        self.nwritten       = 0
+        self.interrupted    = False
+        self.error          = None
+
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._start = None
+
+        if self.metrics is not None:
+            self.metrics.gauge("queue_depth", self.q_alerts.qsize, queue="alerts")
+            self.metrics.gauge("queue_depth", self.q_results.qsize, queue="results")
+
+        return
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(\n"
+            f"    nconsumers={self.nconsumers!r},\n"
+            f"    nworkers={self.nworkers!r},\n"
+            f"    nwriters={self.nwriters!r},\n"
+            f"    queuesize={self.queuesize!r},\n"
+            f"    npolls={self.npolls!r},\n"
+            f"    metrics={self.metrics!r},\n"
+            f")"
+        )
+
+    def _count(self, stage:str, value:int=1):
+        if self.metrics is not None: self.metrics.inc("alerts_total", value, stage=stage)
+        return
+
+    def _next_poll(self) -> bool:
+        """reserves the next poll. returns `False` if `npolls` has been reached or a stop was requested"""
+        with self._lock:
+            if self._stop_event.is_set():
+                return False
+            if (self.npolls >= 0) and (self.npolls_made >= self.npolls):
+                return False
+            self.npolls_made += 1
+        return True
+
+    def _put(self, q:queue.Queue, item:Any):
+        """blocking put that still reacts to `stop()` requests"""
+        while True:
+            try:
+                q.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                if self._stop_event.is_set() and (item is not _SENTINEL):
+                    #drop items if a stop was requested and downstream is stalled
+                    logger.warning(f"{self.__class__.__name__}: dropping item because downstream stage is stalled during shutdown")
+                    return
+
+    def _fail(self, e:BaseException):
+        """records the first fatal exception and stops the pipeline"""
+        with self._lock:
+            if self.error is None: self.error = e
+        self.stop()
+        return
+
+    def _consumer_loop(self):
+        while self._next_poll():
+            try:
+                with self.metrics.timer("stage_seconds", stage="consume") if self.metrics is not None else nullcontext():
+                    alerts = self.consume()
+            except Exception as e:
+                logger.warning(f"{self.__class__.__name__}._consumer_loop(): exception while polling: {e}")
+                continue
+            with self._lock:
+                self.nconsumed += len(alerts)
+            self._count("consume", len(alerts))
+            for alert in alerts:
+                self._put(self.q_alerts, alert)
+            logger.info(self.stats())
+        return
+
+    def _worker_loop(self):
+        while True:
+            alert = self.q_alerts.get()
+            if alert is _SENTINEL:
+                break
+            if self.error is not None:
+                continue    #discard remaining alerts after a fatal exception
+            try:
+                result = self.process(alert)
+            except self.fatal as e:
+                logger.error(f"{self.__class__.__name__}._worker_loop(): fatal exception while processing alert, stopping: {e!r}")
+                self._fail(e)
+                continue
+            except Exception as e:
+                logger.warning(f"{self.__class__.__name__}._worker_loop(): exception while processing alert: {e}")
+                continue
+            with self._lock:
+                self.nprocessed += 1
+            self._count("process")
+            if result is not None:
+                self._put(self.q_results, result)
+        return
+
+    def _writer_loop(self):
+        finished = False
+        while not finished:
+            result = self.q_results.get()
+            if result is _SENTINEL:
+                break
+            batch = [result]
+            if self.write_batch is not None:
+                #drain all results that are available already
+                while True:
+                    try:
+                        result = self.q_results.get_nowait()
+                    except queue.Empty:
+                        break
+                    if result is _SENTINEL:
+                        finished = True
+                        break
+                    batch.append(result)
+            if self.error is not None:
+                continue    #discard remaining results after a fatal exception
+            try:
+                if self.write_batch is not None:
+                    self.write_batch(batch)
+                else:
+                    self.write(batch[0])
+            except Exception as e:
+                logger.error(f"{self.__class__.__name__}._writer_loop(): exception while writing {len(batch)} alerts, stopping: {e!r}")
+                self._fail(e)
+                continue
+            with self._lock:
+                self.nwritten += len(batch)
+            self._count("write", len(batch))
+        return
+
+    @staticmethod
+    def _join(threads:List[threading.Thread]):
+        """joins `threads` in a way that keeps the main thread responsive to signals"""
+        for t in threads:
+            while t.is_alive():
+                t.join(timeout=0.5)
+        return
+
+    def free(self) -> int:
+        """returns the number of alerts the process stage can currently take without blocking the consumers
+
+        Returns
+            - `free`
+                - `int`
+                - free slots in the queue between the consumer and the process stage
+                - `sys.maxsize` if the queue is unbounded
+        """
+        if self.queuesize <= 0: return sys.maxsize
+        return max(0, self.queuesize - self.q_alerts.qsize())
+
+    def stats(self) -> str:
+        """returns a summary of the current state of the pipeline
+
+        Returns
+            - `stats`
+                - `str`
+                - human readable summary of throughput and queue depths
+        """
+        runtime = (datetime.now() - self._start).total_seconds() if self._start is not None else 0
+        rate = self.nwritten / runtime if runtime > 0 else 0
+        return (
+            f"polls: {self.npolls_made}, "
+            f"consumed: {self.nconsumed}, processed: {self.nprocessed}, written: {self.nwritten}, "
+            f"queued (alerts/results): {self.q_alerts.qsize()}/{self.q_results.qsize()}, "
+            f"average throughput: {rate} alerts/s"
+        )
+
+    def stop(self):
+        """requests a graceful shutdown
+
+        - consumers stop polling
+        - already consumed alerts are still processed and written
+        """
+        self._stop_event.set()
+        return
+
+    def stopped(self) -> bool:
+        """whether a stop was requested (via `stop()`, a `KeyboardInterrupt` or a fatal exception)"""
+        return self._stop_event.is_set()
+
+    def run(self):
+        """runs the pipeline until `npolls` is reached or `stop()` is called
+
+        - blocks until all stages have shut down
+        - a `KeyboardInterrupt` triggers `stop()` and drains the pipeline before returning
+        - re-raises the first fatal exception (see `fatal`) once all stages have shut down
+        """
+        self._start = datetime.now()
+
+        consumers   = [threading.Thread(target=self._consumer_loop, name=f"consumer-{i}", daemon=True) for i in range(self.nconsumers)]
+        workers     = [threading.Thread(target=self._worker_loop,   name=f"worker-{i}",   daemon=True) for i in range(self.nworkers)]
+        writers     = [threading.Thread(target=self._writer_loop,   name=f"writer-{i}",   daemon=True) for i in range(self.nwriters)]
+        for t in [*consumers, *workers, *writers]:
+            t.start()
+
+        #shut down stage by stage (downstream stages drain their queues before exiting)
+        try:
+            self._join(consumers)
+        except KeyboardInterrupt:
+            logger.info(f"{self.__class__.__name__}.run(): interrupted... draining pipeline")
+            self.interrupted = True
+            self.stop()
+            self._join(consumers)
+        for _ in workers: self._put(self.q_alerts, _SENTINEL)
+        self._join(workers)
+        for _ in writers: self._put(self.q_results, _SENTINEL)
+        self._join(writers)
+
+        logger.info(f"{self.__class__.__name__}.run(): finished ({self.stats()})")
+
+        if self.error is not None:
+            raise self.error
+
+        return
@@ -1,101 +1,277 @@
 #%%imports
-from astropy.io import fits
-from io import BytesIO
 from joblib.parallel import Parallel, delayed
 import json
 import logging
 import numpy as np
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
+import os
 import polars as pl
-from typing import List
+import pyarrow.parquet as pq
+from typing import Iterable, Iterator, List, Tuple, Union
+
+from thump.data import compression as thcm
+from thump.data import container as thct
+from thump.data import encoding as thden
+from thump.data import index as thix
+from thump.data import preprocessing as thpp
+from thump.fink_lsst import checkpoint as thcp
+from thump.fink_lsst import cutouts as thco
+from thump.fink_lsst import manifest as thmf
+from thump.fink_lsst import spatial as thsp
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(filename=None, level=logging.INFO)
 
 
 #%%definitions
-def read_files(fnames:List[str]) -> pl.LazyFrame:
-    dfs = [(pl.scan_parquet(fn)
-            .select(
-                # pl.col("*"),
-                #select what is needed
-                pl.col(r"^cutout.+$"),
-                pl.col("diaObject").struct.field("diaObjectId").cast(pl.Utf8),
-                pl.col("diaSource").struct.field("diaSourceId").cast(pl.Utf8),
-                pl.col("diaSource").struct.field("midpointMjdTai").round(decimals=4),
-                pl.col("diaObject").struct.field("ra").round(decimals=2),
-                pl.col("diaObject").struct.field("dec").round(decimals=2),
-                pl.lit("").alias("comment")
+COLUMNS = [     #parquet columns (and nested fields) required by `ThumP!`
+    "cutoutScience", "cutoutTemplate", "cutoutDifference",
+    "diaObject.diaObjectId", "diaObject.ra", "diaObject.dec",
+    "diaSource.diaSourceId", "diaSource.midpointMjdTai",
+]
+
+def _select(frame:Union[pl.LazyFrame,pl.DataFrame]) -> Union[pl.LazyFrame,pl.DataFrame]:
+    """selects and filters the fields relevant for `ThumP!` (works on lazy and eager frames)"""
+    return (frame
+        .select(
+            # pl.col("*"),
+            #select what is needed
+            pl.col(r"^cutout.+$"),
+            pl.col("diaObject").struct.field("diaObjectId").cast(pl.Utf8),
+            pl.col("diaSource").struct.field("diaSourceId").cast(pl.Utf8),
+            pl.col("diaSource").struct.field("midpointMjdTai").round(decimals=4),
+            pl.col("diaObject").struct.field("ra").round(decimals=2),
+            pl.col("diaObject").struct.field("dec").round(decimals=2),
+            pl.lit("").alias("comment")
         )
         .filter(
             pl.col("diaObjectId").is_not_null(),
         )
-    ) for fn in fnames]
+    )
+
+def read_files(fnames:List[str]) -> pl.LazyFrame:
+    dfs = [_select(pl.scan_parquet(fn)) for fn in fnames]
     # for c in sorted(pl.read_parquet(fnames[0]).columns): print(c)
 
     dfs = pl.concat(dfs)
 
     return dfs
 
-def compile_file(ldf:pl.LazyFrame, chunkidx:str, chunklen:int, save_dir:str=False):
-    """compiles a single chunk of len `chunklen` into a json file
+def _batch_rows(metadata:pq.FileMetaData, row_groups:Iterable[int], batch_size:int, max_bytes:int=None) -> int:
+    """number of rows per batch such that a batch stays within `batch_size` rows and `max_bytes` bytes"""
+    row_groups = list(row_groups)
+    nrows = sum(metadata.row_group(i).num_rows for i in row_groups)
+    if (max_bytes is None) or (nrows == 0):
+        return batch_size
+    bytes_per_row = sum(metadata.row_group(i).total_byte_size for i in row_groups) / nrows
+    return int(max(1, min(batch_size, max_bytes // max(bytes_per_row, 1))))
 
-    - use lazy frame to deal with huge amount of data
+def plan_chunks(fnames:List[str], chunklen:int) -> List[List[Tuple[str,int,int,int]]]:
+    """plans chunks from parquet metadata
+
+    - assigns every chunk an explicit list of pieces to read
+        - a piece is a row range within a single row-group of a single file
+    - row counts are taken from the parquet footers
+    - rows filtered by `read_files()` (`diaObjectId` is null) are accounted for
+        - via the null-count statistics of `diaObject.diaObjectId` in the footers
+        - only for row-groups containing nulls (or lacking statistics) that single column gets read
+    - every chunk contains exactly `chunklen` alerts (the last chunk can be shorter)
+        - same chunks as slicing the output of `read_files()`
 
     Parameters
-        - `ldf`
-            - `pl.LazyFrame`
-            - each rows is a single alert
-        - `chunkidx`
-            - `str`
-            - some index/name for the extracted chunk
-            - used only in logging and name of saved file
+        - `fnames`
+            - `List[str]`
+            - parquet files downloaded via datatransfer
         - `chunklen`
             - `int`
-            - number of objects per chunk
-            - equivalent to the number of objects the generated file will contain
-        - `save_dir`
-            - `bool`, optional
-            - directory to save generated file to
+            - number of alerts per chunk
+
+    Returns
+        - `chunks`
+            - `List[List[Tuple[str,int,int,int]]]`
+            - pieces for every chunk
+            - every piece is (file, row-group, first row, last row + 1)
+                - rows are indexed within the row-group (before filtering)
     """
+    chunks, chunk, n = [], [], 0
+    for fn in fnames:
+        f = pq.ParquetFile(fn)
+        idcol = [f.metadata.schema.column(i).path for i in range(f.metadata.num_columns)].index("diaObject.diaObjectId")
+        for rg in range(f.metadata.num_row_groups):
+            md = f.metadata.row_group(rg)
+            stats = md.column(idcol).statistics
+            if (stats is not None) and stats.has_null_count and (stats.null_count == 0):
+                valid = np.arange(md.num_rows)
+            else:
+                ids = f.read_row_group(rg, columns=["diaObject.diaObjectId"]).column("diaObject").combine_chunks()
+                valid = np.flatnonzero(ids.field("diaObjectId").is_valid().to_numpy(zero_copy_only=False) & ids.is_valid().to_numpy(zero_copy_only=False))
+            while len(valid) > 0:
+                take = valid[:chunklen - n]
+                chunk.append((fn, rg, int(take[0]), int(take[-1]) + 1))
+                n += len(take)
+                valid = valid[len(take):]
+                if n == chunklen:
+                    chunks.append(chunk)
+                    chunk, n = [], 0
+    if n > 0:
+        chunks.append(chunk)
+    return chunks
+
+def plan_groups(fnames:List[str], chunklen:int, radius:float) -> List[List[Tuple[str,int,int,int]]]:
+    """plans chunks such that repeat detections of the same position end up next to each other
+
+    - alerts are grouped via friends-of-friends with linking length `radius` (see `thump.fink_lsst.spatial.SkyIndex.group()`)
+        - positions are read at full precision (only `diaObject.ra`, `diaObject.dec` and `diaObject.diaObjectId` get read)
+        - alerts without position form a group of their own
+    - groups are ordered by their first alert, alerts within a group keep their order
+        - i.e., same order as `plan_chunks()` except that repeat detections are moved up to the first detection
+    - every chunk contains exactly `chunklen` alerts (the last chunk can be shorter)
+        - groups larger than `chunklen` are split across consecutive chunks
+
+    Parameters
+        - `fnames`
+            - `List[str]`
+            - parquet files downloaded via datatransfer
+        - `chunklen`
+            - `int`
+            - number of alerts per chunk
+        - `radius`
+            - `float`
+            - linking length in arcsec
+
+    Returns
+        - `chunks`
+            - `List[List[Tuple[str,int,int,int]]]`
+            - pieces for every chunk (same format as `plan_chunks()`)
+            - pieces are in the order the alerts get written, i.e., not necessarily sorted by file and row
+    """
+    rows, ra, dec = [], [], []
+    for fn in fnames:
+        f = pq.ParquetFile(fn)
+        for rg in range(f.metadata.num_row_groups):
+            obj = f.read_row_group(rg, columns=["diaObject.diaObjectId", "diaObject.ra", "diaObject.dec"]).column("diaObject").combine_chunks()
+            valid = np.flatnonzero(obj.field("diaObjectId").is_valid().to_numpy(zero_copy_only=False) & obj.is_valid().to_numpy(zero_copy_only=False))
+            rows.extend((fn, rg, int(r)) for r in valid)
+            ra.append(obj.field("ra").to_numpy(zero_copy_only=False).astype(np.float64)[valid])
+            dec.append(obj.field("dec").to_numpy(zero_copy_only=False).astype(np.float64)[valid])
+    if len(rows) == 0:
+        return []
+    ra, dec = np.concatenate(ra), np.concatenate(dec)
+
+    #sort key: index of the first alert of the group
+    idxs = np.arange(len(rows))
+    first = idxs.copy()     #alerts without position are their own group
+    located = np.flatnonzero(np.isfinite(ra) & np.isfinite(dec))
+    if len(located) > 0:
+        labels = thsp.SkyIndex(located, ra[located], dec[located]).group(radius)
+        firsts = np.full(labels.max() + 1, len(rows))
+        np.minimum.at(firsts, labels, located)
+        first[located] = firsts[labels]
+    order = np.argsort(first, kind="stable")
+
+    chunks = []
+    for c in range(0, len(order), chunklen):
+        chunk = []
+        for i in order[c:c+chunklen]:
+            fn, rg, r = rows[i]
+            if (len(chunk) > 0) and (chunk[-1][:2] == (fn, rg)) and (chunk[-1][3] == r):
+                chunk[-1] = (fn, rg, chunk[-1][2], r + 1)   #extend the previous piece
+            else:
+                chunk.append((fn, rg, r, r + 1))
+        chunks.append(chunk)
+    return chunks
+
+def _sequential(pieces:List[Tuple[str,int,int,int]]) -> bool:
+    """whether every row-group occurs in a single run of increasing, non-overlapping pieces (as planned by `plan_chunks()`)"""
+    seen, prev = set(), None
+    for fn, rg, start, stop in pieces:
+        if (prev is not None) and ((fn, rg) == prev[:2]):
+            if start < prev[3]: return False
+        elif (fn, rg) in seen:
+            return False
+        seen.add((fn, rg))
+        prev = (fn, rg, start, stop)
+    return True
+
+def read_chunk(pieces:List[Tuple[str,int,int,int]], batch_size:int=256, max_bytes:int=None) -> Iterator[pl.DataFrame]:
+    """streams the alerts of a single planned chunk in bounded record batches
+
+    - only opens the files and reads the row-groups listed in `pieces`
+    - alerts are yielded in the order of `pieces`
+        - pieces as planned by `plan_chunks()` are streamed (every row-group is read one batch at a time)
+        - otherwise (i.e., as planned by `plan_groups()`) every listed row-group is read once and the alerts of the whole chunk are reordered in memory
+
+    Parameters
+        - `pieces`
+            - `List[Tuple[str,int,int,int]]`
+            - pieces of a chunk as returned by `plan_chunks()`
+        - `batch_size`
+            - `int`, optional
+            - maximum number of rows per batch
+            - the default is `256`
+        - `max_bytes`
+            - `int`, optional
+            - maximum (uncompressed) size of a batch in bytes
+            - the default is `None`
+                - only bounded by `batch_size`
+
+    Yields
+        - `batch`
+            - `pl.DataFrame`
+            - selected and filtered alerts (see `read_files()`)
+    """
+    files = dict()
+    if not _sequential(pieces):
+        #gather the rows of every row-group and restore the planned order
+        rows = dict()   #(file, row-group) -> (position in chunk, row)
+        pos = 0
+        for fn, rg, start, stop in pieces:
+            rows.setdefault((fn, rg), []).extend(zip(range(pos, pos + stop - start), range(start, stop)))
+            pos += stop - start
+        dfs, positions = [], []
+        for (fn, rg), entries in rows.items():
+            if fn not in files: files[fn] = pq.ParquetFile(fn)
+            positions.extend(p for p, _ in entries)
+            dfs.append(_select(pl.from_arrow(files[fn].read_row_group(rg, columns=COLUMNS).take([r for _, r in entries]))))
+        df = pl.concat(dfs)[np.argsort(positions)]
+        for start in range(0, df.height, batch_size):
+            yield df.slice(start, batch_size)
+        return
+    for fn, rg, start, stop in pieces:
+        if fn not in files: files[fn] = pq.ParquetFile(fn)
+        f = files[fn]
+        nrows = _batch_rows(f.metadata, [rg], batch_size, max_bytes)
+        offset = 0  #index of the first row of `batch` within the row-group
+        for batch in f.iter_batches(batch_size=nrows, row_groups=[rg], columns=COLUMNS):
+            lo, hi = max(start - offset, 0), min(stop - offset, batch.num_rows)
+            offset += batch.num_rows
+            if hi > lo:
+                yield _select(pl.from_arrow(batch.slice(lo, hi - lo)))
+            if offset >= stop:
+                break
+
+def _decode_batch(df:pl.DataFrame) -> dict:
+    """decodes a batch of selected alerts (see `read_files()`) into `ThumP!` format
+
+    - all cutouts of the batch are decoded at once (see `thump.fink_lsst.cutouts.decode_cutouts()`)
+        - falls back to decoding alert by alert if the cutouts differ in shape or fail to decode
+    - alerts that fail to decode are logged and skipped
+    """
+    cutout_cols = ["cutoutScience", "cutoutTemplate", "cutoutDifference"]
+    try:
+        stack = thco.decode_cutouts(df.select(cutout_cols).rows())
+    except Exception:
+        stack = None
 
-    #number of entries in dataset 
-    # height = ldf.select(ldf.collect_schema().names()[0]).collect().height
-    logger.info(f"processing chunk {chunkidx} ({chunklen=})")
-    # print(type(ldf.select("diaSource").slice(0, 1).collect()[0]))
-    
     data_json = dict()
-    for i in range(0, chunklen):
-        #only ever load one row in memory
+    for i, row in enumerate(df.iter_rows(named=True)):
+        # logger.info(f"{chunkidx=} {i=}")
         try:
-            row = ldf.slice(offset=i, length=1).select(
-                pl.col("*"),
-            ).collect()
+            #rounding and NaN handled by `thden`, cropping etc. by `thump.data.preprocessing`
+            science, template, difference = stack[i] if stack is not None else [thco.decode_cutout(row[c]) for c in cutout_cols]
         except Exception as e:
-            logger.warning(f"Exception at chunk {chunkidx}, object {i}: {e}")
+            logger.warning(f"Exception at object {i} of batch ({row['diaSourceId']=}): {e}")
             continue
 
-        if len(row) == 0:
-            #break if the chunk does not contain enough data (last file does not fill `chunklen`)
-            break
-        
-        # logger.info(f"{chunkidx=} {i=}")
-        npixels = slice(0,-10)   #for testing
-        npixels = slice(0,None)
-        hdul = fits.open(BytesIO(row["cutoutScience"][0]))
-        science = np.round(hdul[0].data, 1)[:,npixels]
-        science = np.where(np.isnan(science), None, science)    #NaN is not supported in json
-        hdul.close()
-        hdul = fits.open(BytesIO(row["cutoutTemplate"][0]))
-        template = np.round(hdul[0].data, 1)[npixels,:]
-        template = np.where(np.isnan(template), None, template) #NaN is not supported in json
-        hdul.close()
-        hdul = fits.open(BytesIO(row["cutoutDifference"][0]))
-        difference = np.round(hdul[0].data, 1)
-        difference = np.where(np.isnan(difference), None, difference)   #NaN is not supported in json
-        hdul.close()
-
         """ fig = make_subplots(1, 3)
         fig.add_traces(data=[
             dict(
@@ -113,60 +289,304 @@ def compile_file(ldf:pl.LazyFrame, chunkidx:str, chunklen:int, save_dir:str=Fals
         ], rows=[1,1,1], cols=[1,2,3])
         fig.show() """
 
-        nthumbnails = slice(0,np.random.choice([1,2,3]))  #for testing
-        nthumbnails = slice(0,None)
-        
         #required fields
-        data_json[str(row["diaSourceId"][0])] = dict(
-            link=f"https://lsst.fink-portal.org/{row['diaObjectId'][0]}",
+        data_json[str(row["diaSourceId"])] = dict(
+            link=f"https://lsst.fink-portal.org/{row['diaObjectId']}",
             thumbnailTypes=[
                 "science",
                 "template",
                 "differece",
-            ][nthumbnails],
+            ],
             thumbnails=[
-                science.tolist(),
-                template.tolist(),
-                difference.tolist(),
-            ][nthumbnails],
+                science,
+                template,
+                difference,
+            ],
         )
 
         #auxiliary fields
-        for c in row.select(pl.exclude("^cutout.+$")).columns:
-            data_json[str(row["diaSourceId"][0])][c] = row[c][0]
+        for c in df.select(pl.exclude("^cutout.+$")).columns:
+            data_json[str(row["diaSourceId"])][c] = row[c]
+
+    return data_json
+
+def compile_file(ldf:Union[pl.LazyFrame,pl.DataFrame,Iterable[pl.DataFrame]], chunkidx:str, chunklen:int, save_dir:str=False, decimals:int=1, indent:int=2, batch_size:int=256, fmt:str="json", dtype:str="int16", preprocess:thpp.ThumbnailPreprocessor=None, compression:str=None):
+    """compiles a single chunk of len `chunklen` into a json file (or binary container)
+
+    - use lazy frame to deal with huge amount of data
+    - alerts are decoded and written one batch at a time
+        - only a single batch of alerts is held in memory
+        - the json file is written incrementally
+        - for binary containers only the encoded thumbnails are held until the chunk is complete
+    - the object-to-file index of the chunk is written alongside (see `thump.data.index`)
+
+    Parameters
+        - `ldf`
+            - `pl.LazyFrame`, `pl.DataFrame`, `Iterable[pl.DataFrame]`
+            - each rows is a single alert
+            - a `pl.LazyFrame` is executed once and split into batches of `batch_size`
+            - iterables are treated as batches (i.e., as yielded by `read_chunk()`)
+        - `chunkidx`
+            - `str`
+            - some index/name for the extracted chunk
+            - used only in logging and name of saved file
+        - `chunklen`
+            - `int`
+            - number of objects per chunk
+            - equivalent to the number of objects the generated file will contain
+        - `save_dir`
+            - `bool`, optional
+            - directory to save generated file to
+        - `decimals`
+            - `int`, optional
+            - number of decimals to write for thumbnails
+            - the default is `1`
+        - `indent`
+            - `int`, optional
+            - indentation of the generated file
+            - `None` writes a compact file
+            - the default is `2`
+        - `batch_size`
+            - `int`, optional
+            - number of alerts to decode at once
+            - the default is `256`
+        - `fmt`
+            - `str`, optional
+            - format of the generated file
+            - `"json"` writes `processed_{chunkidx}.json`
+            - `"binary"` writes `processed_{chunkidx}.thump` (see `thump.data.container`)
+            - the default is `"json"`
+        - `dtype`
+            - `str`, optional
+            - storage type of the thumbnails in binary containers
+            - one of `"int16"`, `"float32"`
+            - ignored for `fmt="json"`
+            - the default is `"int16"`
+        - `preprocess`
+            - `thump.data.preprocessing.ThumbnailPreprocessor`, optional
+            - crops, downsamples and/or quantizes thumbnails before they get written
+            - the default is `None`
+                - thumbnails are written at full resolution
+        - `compression`
+            - `str`, optional
+            - compression of the generated file
+            - one of `None`, `"gzip"`, `"zstd"` (see `thump.data.compression`)
+            - the file is compressed while it is written
+            - the default is `None`
+                - uncompressed
+    """
+
+    logger.info(f"processing chunk {chunkidx} ({chunklen=})")
+
+    if isinstance(ldf, pl.LazyFrame):
+        ldf = ldf.head(chunklen).collect(engine="streaming")
+    if isinstance(ldf, pl.DataFrame):
+        ldf = ldf.iter_slices(batch_size)
+
+    if preprocess is None: preprocess = thpp.ThumbnailPreprocessor()
+
+    save = isinstance(save_dir, str)
+    fname = f"{save_dir}processed_{chunkidx:s}{thct.EXTENSION if fmt == 'binary' else '.json'}{thcm.suffix(compression)}"
+    if fmt == "binary":
+        objs, rows = [], []
+        for batch in ldf:
+            batch = batch.head(chunklen - len(objs))
+            for k, v in preprocess.apply(_decode_batch(batch)).items():
+                objs.append((k, *thct.encode_object(v, decimals=thpp.decimals(v, decimals), dtype=dtype)))
+                rows.append(dict(objectId=str(k), **thix.fields(v)))
+            if len(objs) >= chunklen:
+                break
+        with thcp.atomic_open(fname, "wb") if save else open(os.devnull, "wb") as raw, thcm.wrap(raw, compression) as f:
+            spans = thct.write(f, objs)
+        if save: thix.write(fname, [dict(row, offset=offset, length=length) for row, (offset, length) in zip(rows, spans)])
+        return
+
+    if indent is None:
+        sep, open_, close, colon = ",", "{", "}", ":"
+    else:
+        sep, open_, close, colon = ",\n" + " "*indent, "{\n" + " "*indent, "\n}", ": "
+
+    #write incrementally (only ever hold one batch in memory)
+    rows = []
+    with thcp.atomic_open(fname, "wb") if save else open(os.devnull, "wb") as raw, thcm.wrap(raw, compression, text=True) as f:
+        f.write(open_)
+        nobj, pos = 0, len(open_)   #files are ascii (characters == bytes)
+        for batch in ldf:
+            batch = batch.head(chunklen - nobj)
+            for k, v in preprocess.apply(_decode_batch(batch)).items():
+                head = (sep if nobj > 0 else "") + json.dumps(k) + colon
+                frag = thden.dumps(v, decimals=thpp.decimals(v, decimals), indent=indent, level=1)
+                f.write(head + frag)
+                rows.append(dict(objectId=str(k), offset=pos + len(head), length=len(frag), **thix.fields(v)))
+                pos += len(head) + len(frag)
+                nobj += 1
+            if nobj >= chunklen:
+                break
+        f.write(close)
+    if save: thix.write(fname, rows)
+
+    return
+
+def compile_chunk(pieces:List[Tuple[str,int,int,int]], chunkidx:str, chunklen:int, save_dir:str=False, decimals:int=1, indent:int=2, batch_size:int=256, max_bytes:int=None, fmt:str="json", dtype:str="int16", preprocess:thpp.ThumbnailPreprocessor=None, compression:str=None):
+    """compiles a single planned chunk into a json file
 
-    if isinstance(save_dir, str):
-        with open(f"{save_dir}processed_{chunkidx:s}.json", "w") as f:
-            json.dump(data_json, f, indent=2)
+    - reads only the pieces assigned to the chunk (see `read_chunk()`)
+    - cheap to send to worker processes (only `pieces` is pickled)
+    - see `compile_file()` for the remaining parameters
 
+    Parameters
+        - `pieces`
+            - `List[Tuple[str,int,int,int]]`
+            - pieces of the chunk as returned by `plan_chunks()`
+    """
+    compile_file(read_chunk(pieces, batch_size=batch_size, max_bytes=max_bytes),
+        chunkidx=chunkidx, chunklen=chunklen, save_dir=save_dir,
+        decimals=decimals, indent=indent, batch_size=batch_size,
+        fmt=fmt, dtype=dtype, preprocess=preprocess, compression=compression,
+    )
     return
 
-def compile_files(ldf:pl.LazyFrame,
+def compile_files(fnames:List[str],
     chunklen:int=100,
     chunk_start:int=0, nchunks:int=None,
     save_dir:str=False,
     n_jobs:int=1,
+    decimals:int=1, indent:int=2,
+    batch_size:int=256, max_bytes:int=None,
+    group_radius:float=None,
+    manifest:thmf.Manifest=None,
+    fmt:str="json", dtype:str="int16",
+    preprocess:thpp.ThumbnailPreprocessor=None,
+    compression:str=None,
     ):
     """extracts relevant information from all files and stores that in correct schema
 
     - created files contain `chunklen` objects
-    - use lazy frame to deal with huge amount of data
+    - chunks are planned from the parquet metadata (see `plan_chunks()`)
+        - every worker only reads the row-groups of its own chunk
+        - selecting a subset of chunks via `chunk_start` and `nchunks` does not read any other data
+    - if `group_radius` is set, repeat detections of the same position are written next to each other (see `plan_groups()`)
+    - if a `manifest` is passed, processing is incremental
+        - only new or changed files get processed
+        - chunk numbering continues at `manifest.next_chunk` (`chunk_start` and `nchunks` are relative to it)
+        - files are recorded once all chunks containing them have been written
+            - files only partially covered by `chunk_start` and `nchunks` are not recorded
+        - `manifest.next_chunk` advances to one past the highest chunk that got written
 
+    Parameters
+        - `fnames`
+            - `List[str]`
+            - parquet files downloaded via datatransfer
+        - `chunklen`
+            - `int`, optional
+            - number of objects each file shall contain
+            - the default is `100`
+        - `chunk_start`
+            - `int`, optional
+            - index of the first chunk to compile
+            - the default is `0`
+        - `nchunks`
+            - `int`, optional
+            - number of chunks to compile, starting from `chunk_start`
+            - the default is `None`
+                - compile until the end of the data
+        - `save_dir`
+            - `str`, optional
+            - directory to save generated files to
+            - the default is `False`
+        - `n_jobs`
+            - `int`, optional
+            - number of chunks to compile in parallel
+            - the default is `1`
+        - `decimals`
+            - `int`, optional
+            - number of decimals to write for thumbnails
+            - the default is `1`
+        - `indent`
+            - `int`, optional
+            - indentation of the generated files
+            - the default is `2`
+        - `batch_size`
+            - `int`, optional
+            - maximum number of rows per record batch
+            - the default is `256`
+        - `max_bytes`
+            - `int`, optional
+            - maximum size of a record batch in bytes
+            - the default is `None`
+        - `group_radius`
+            - `float`, optional
+            - linking length in arcsec to group alerts by (see `plan_groups()`)
+            - alerts are ordered and chunked by group, i.e., repeat detections end up in the same chunk
+            - the default is `None`
+                - alerts are chunked in the order they are stored in (see `plan_chunks()`)
+        - `manifest`
+            - `thump.fink_lsst.manifest.Manifest`, optional
+            - manifest of already processed files
+            - updated and saved once all chunks have been written
+            - the default is `None`
+                - all files are processed and chunks are numbered from 0
+        - `fmt`
+            - `str`, optional
+            - format of the generated files (`"json"` or `"binary"`)
+            - the default is `"json"`
+        - `dtype`
+            - `str`, optional
+            - storage type of the thumbnails in binary containers
+            - the default is `"int16"`
+        - `preprocess`
+            - `thump.data.preprocessing.ThumbnailPreprocessor`, optional
+            - crops, downsamples and/or quantizes thumbnails before they get written
+            - the default is `None`
+        - `compression`
+            - `str`, optional
+            - compression of the generated files
+            - one of `None`, `"gzip"`, `"zstd"` (see `thump.data.compression`)
+            - the file is compressed while it is written
+            - the default is `None`
+                - uncompressed
     """
 
-    #number of entries in dataset
-    height = ldf.select(ldf.collect_schema().names()[0]).collect().height
-    print(f"nobj={height}")
+    offset = 0  #index of the first chunk
+    if manifest is not None:
+        nfiles = len(fnames)
+        fnames = manifest.changed(fnames)
+        offset = manifest.next_chunk
+        print(f"{len(fnames)} of {nfiles} files are new or changed")
 
-    nchunks = height//chunklen + (height%chunklen>0) if nchunks is None else nchunks
-    print(f"{nchunks=}")
+    plan = plan_chunks(fnames, chunklen) if group_radius is None else plan_groups(fnames, chunklen, group_radius)
+    print(f"nchunks={len(plan)}")
 
-    _ = Parallel(n_jobs=n_jobs, backend="loky", verbose=1)(delayed(compile_file)(
-        ldf=ldf.slice(chunkidx*chunklen, chunklen),
-        chunkidx=f"{chunkidx:04d}",
+    chunk_stop = len(plan) if nchunks is None else min(len(plan), chunk_start + nchunks)
+
+    _ = Parallel(n_jobs=n_jobs, backend="loky", verbose=1)(delayed(compile_chunk)(
+        pieces=plan[chunkidx],
+        chunkidx=f"{offset + chunkidx:04d}",
         chunklen=chunklen,
         save_dir=save_dir,
-    ) for chunkidx in range(chunk_start, nchunks))
+        decimals=decimals, indent=indent,
+        batch_size=batch_size, max_bytes=max_bytes,
+        fmt=fmt, dtype=dtype, preprocess=preprocess, compression=compression,
+    ) for chunkidx in range(chunk_start, chunk_stop))
+
+    if manifest is not None:
+        #files only count as processed if all chunks containing them have been written
+        written = set(range(chunk_start, chunk_stop))
+        chunks_of = {fn:set() for fn in fnames}
+        for chunkidx, chunk in enumerate(plan):
+            for fn, _, _, _ in chunk: chunks_of[fn].add(chunkidx)
+        partial = []
+        for fn, chunks in chunks_of.items():
+            if chunks <= written:
+                manifest.record(fn, [offset + c for c in chunks])
+            elif len(chunks & written) > 0:
+                partial.append(fn)
+        if len(partial) > 0:
+            logger.warning(f"compile_files(): {len(partial)} files are only partially contained in chunks {chunk_start}-{chunk_stop-1}. they are not recorded and get processed again by the next run")
+        #numbering continues after the highest chunk actually written
+        if len(written) > 0:
+            manifest.next_chunk = max(manifest.next_chunk, offset + max(written) + 1)
+        manifest.save()
 
     return
 
@@ -0,0 +1,210 @@
+"""joins reviewer verdicts to the alerts they were made on
+
+- lazily joins the consolidated verdicts (see `thump.data.verdicts`) to alert packages downloaded via datatransfer
+    - `objectId` of the verdicts corresponds to `diaSource.diaSourceId` of the alerts
+- predicates on `diaSourceId`, time range (`midpointMjdTai`) and sky region (cone) are applied to the scan of the parquet files
+    - i.e., polars can skip row-groups based on their statistics and only reads the matching rows
+- only the requested columns are read (projection pushdown)
+    - nested fields are addressed via `struct.field` (i.e., `diaSource.psfFlux`)
+- allows pulling feature tables for labelled alerts out of multi-GB datatransfer dumps without loading them
+
+Exceptions
+
+Classes
+
+Functions
+    - `load_verdicts()` -- lazily load consolidated verdicts
+    - `scan_alerts()` -- lazily scan alert packages with predicates pushed down
+    - `query()` -- lazily join verdicts to alert packages
+
+Other Objects
+    - `DEFAULT_COLUMNS` -- alert columns exported if no columns are requested
+"""
+
+#%%imports
+import os
+import polars as pl
+from typing import Iterable, List, Tuple
+
+from thump.data import output as thdo
+from thump.data import verdicts as thvd
+
+#%%definitions
+DEFAULT_COLUMNS = [
+    "diaObject.diaObjectId", "diaSource.midpointMjdTai", "diaObject.ra", "diaObject.dec",
+]
+
+def _col(name:str) -> pl.Expr:
+    """expression selecting the (potentially nested) column `name` (i.e., `diaSource.psfFlux`)"""
+    parts = name.split(".")
+    expr = pl.col(parts[0])
+    for p in parts[1:]:
+        expr = expr.struct.field(p)
+    return expr
+
+def load_verdicts(path:str) -> pl.LazyFrame:
+    """lazily loads consolidated verdicts
+
+    Parameters
+        - `path`
+            - `str`
+            - one of
+                - directory of a `thump.data.verdicts.VerdictDataset`
+                - directory containing `ThumP!` output files (`thump_*.csv`)
+                    - consolidated into `{path}thump_verdicts/` first (see `thump.data.output.concat()`)
+                - parquet or (potentially compressed) csv file as written by `thump.data.output.concat()`
+
+    Returns
+        - `verdicts`
+            - `pl.LazyFrame`
+            - latest verdict of every object
+            - `objectId` is cast to `pl.Utf8`
+    """
+    path = os.path.expanduser(path)
+    if os.path.isdir(path):
+        if not os.path.isfile(os.path.join(path, "ingested.json")):
+            ds = thvd.VerdictDataset(os.path.join(path, "thump_verdicts"))
+            ds.ingest(thdo._glob(os.path.join(path, "thump_*"), [".csv"]))
+        else:
+            ds = thvd.VerdictDataset(path)
+        lf = ds.latest()
+    elif path.endswith(".parquet"):
+        lf = pl.scan_parquet(path)
+    else:
+        lf = thvd.scan_output(path)
+    return lf.with_columns(pl.col("objectId").cast(pl.Utf8))
+
+def scan_alerts(fnames:List[str],
+    columns:List[str]=None,
+    source_ids:Iterable[int]=None,
+    mjd:Tuple[float,float]=None,
+    cone:Tuple[float,float,float]=None,
+    ) -> pl.LazyFrame:
+    """lazily scans alert packages with predicates pushed down
+
+    Parameters
+        - `fnames`
+            - `List[str]`
+            - parquet files downloaded via datatransfer
+        - `columns`
+            - `List[str]`, optional
+            - (nested) columns to export (i.e., `diaSource.psfFlux`)
+            - exported columns are named after their full path
+            - the default is `None`
+                - `DEFAULT_COLUMNS`
+        - `source_ids`
+            - `Iterable[int]`, optional
+            - only keep alerts with these `diaSource.diaSourceId`
+            - the default is `None`
+                - no restriction
+        - `mjd`
+            - `Tuple[float,float]`, optional
+            - only keep alerts with `mjd[0] <= diaSource.midpointMjdTai <= mjd[1]`
+            - either limit can be `None`
+            - the default is `None`
+                - no restriction
+        - `cone`
+            - `Tuple[float,float,float]`, optional
+            - only keep alerts within a cone of radius `cone[2]` around (`cone[0]`, `cone[1]`) (`diaObject.ra`, `diaObject.dec`)
+            - all in degrees
+            - the default is `None`
+                - no restriction
+
+    Returns
+        - `alerts`
+            - `pl.LazyFrame`
+            - `objectId` (`diaSource.diaSourceId` as `pl.Utf8`) and `columns` of all alerts matching the predicates
+    """
+    if columns is None: columns = DEFAULT_COLUMNS
+
+    predicates = [_col("diaObject.diaObjectId").is_not_null()]
+    if source_ids is not None:
+        predicates.append(_col("diaSource.diaSourceId").is_in([int(i) for i in source_ids]))
+    if mjd is not None:
+        if mjd[0] is not None: predicates.append(_col("diaSource.midpointMjdTai") >= mjd[0])
+        if mjd[1] is not None: predicates.append(_col("diaSource.midpointMjdTai") <= mjd[1])
+    if cone is not None:
+        ra0, dec0, radius = cone
+        ra, dec = _col("diaObject.ra").radians(), _col("diaObject.dec").radians()
+        #cheap declination band first, exact (haversine) distance afterwards
+        predicates.append(_col("diaObject.dec").is_between(dec0 - radius, dec0 + radius))
+        hav = (
+            ((dec - pl.lit(dec0).radians()) / 2).sin()**2
+            + pl.lit(dec0).radians().cos() * dec.cos() * ((ra - pl.lit(ra0).radians()) / 2).sin()**2
+        )
+        predicates.append((2 * hav.sqrt().arcsin()).degrees() <= radius)
+
+    return (pl.scan_parquet(fnames)
+        .filter(*predicates)
+        .select(
+            _col("diaSource.diaSourceId").cast(pl.Utf8).alias("objectId"),
+            *[_col(c).alias(c) for c in columns],
+        )
+    )
+
+def query(fnames:List[str], verdicts:str,
+    columns:List[str]=None,
+    classes:List[str]=None,
+    source_ids:Iterable[int]=None,
+    mjd:Tuple[float,float]=None,
+    cone:Tuple[float,float,float]=None,
+    verdict_columns:List[str]=None,
+    ) -> pl.LazyFrame:
+    """lazily joins verdicts to alert packages
+
+    - only alerts with a verdict are kept (inner join)
+    - the (comparably small) verdicts are collected first
+        - their ids are pushed down into the scan of the alerts as a `diaSourceId` predicate
+
+    Parameters
+        - `fnames`
+            - `List[str]`
+            - parquet files downloaded via datatransfer
+        - `verdicts`
+            - `str`
+            - consolidated verdicts (see `load_verdicts()`)
+        - `columns`
+            - `List[str]`, optional
+            - (nested) alert columns to export
+            - the default is `None`
+                - `DEFAULT_COLUMNS`
+        - `classes`
+            - `List[str]`, optional
+            - only keep alerts classified as one of `classes` (i.e., `["good", "maybe"]`)
+            - the default is `None`
+                - all classes
+        - `source_ids`
+            - `Iterable[int]`, optional
+            - see `scan_alerts()`
+            - the default is `None`
+        - `mjd`
+            - `Tuple[float,float]`, optional
+            - see `scan_alerts()`
+            - the default is `None`
+        - `cone`
+            - `Tuple[float,float,float]`, optional
+            - see `scan_alerts()`
+            - the default is `None`
+        - `verdict_columns`
+            - `List[str]`, optional
+            - columns of the verdicts to export in addition to `objectId`
+            - the default is `None`
+                - `["class"]`
+
+    Returns
+        - `joined`
+            - `pl.LazyFrame`
+            - `objectId`, `verdict_columns` and `columns` of every alert matching all predicates
+    """
+    if verdict_columns is None: verdict_columns = ["class"]
+
+    lf_verdicts = load_verdicts(verdicts)
+    if classes is not None:
+        lf_verdicts = lf_verdicts.filter(pl.col("class").is_in(classes))
+    if source_ids is not None:
+        lf_verdicts = lf_verdicts.filter(pl.col("objectId").is_in([str(i) for i in source_ids]))
+    df_verdicts = lf_verdicts.select("objectId", *[c for c in verdict_columns if c != "objectId"]).collect()
+    ids = [i for i in df_verdicts["objectId"].to_list() if (i is not None) and i.isdigit()]
+
+    lf_alerts = scan_alerts(fnames, columns=columns, source_ids=ids, mjd=mjd, cone=cone)
+    return df_verdicts.lazy().join(lf_alerts, on="objectId", how="inner")
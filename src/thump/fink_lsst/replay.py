@@ -0,0 +1,321 @@
+"""rate-controlled replay of alerts downloaded via fink datatransfer
+
+- simulates a stream of alerts from a set of parquet files
+- row-group metadata of all files is read once
+    - alerts are served by index
+    - only the row-group containing the requested alert is loaded (and cached)
+- alerts are emitted following a configurable rate profile
+    - `constant` -- a constant number of alerts per second
+    - `burst` -- bursts of alerts with quiet periods in between
+    - `night` -- replays the night in the order of `midpointMjdTai`, optionally sped up
+- exposes the same interface as `fink_client.consumer.AlertConsumer`
+    - can be plugged into the consumer stage in place of a real consumer
+
+Exceptions
+
+Classes
+    - `ReplaySource` -- replays alerts from parquet files following a rate profile
+
+Functions
+
+Other Objects
+"""
+
+#%%imports
+from collections import OrderedDict
+import logging
+import numpy as np
+import pyarrow.parquet as pq
+import threading
+import time
+from typing import List, Tuple
+
+logger = logging.getLogger(__name__)
+
+#%%definitions
+class ReplaySource:
+    """replays alerts from parquet files following a rate profile
+
+    - drop-in replacement for `fink_client.consumer.AlertConsumer` in `consume_alerts()`
+    - every alert gets a due time (relative to the first call to `consume()`) assigned according to `profile`
+        - `consume()` returns alerts once they are due
+
+    Attributes
+        - `fnames`
+            - `List[str]`
+            - parquet files to replay alerts from
+        - `profile`
+            - `str`, optional
+            - rate profile to use
+            - one of
+                - `"constant"` -- emits `rate` alerts per second
+                - `"burst"` -- emits bursts of `burstsize` alerts, on average `rate` alerts per second
+                - `"night"` -- emits alerts ordered by `midpointMjdTai` at their (relative) observation time divided by `speedup`
+            - the default is `"constant"`
+        - `rate`
+            - `float`, optional
+            - average number of alerts per second
+            - ignored if `profile=="night"`
+            - non-positive values emit alerts as fast as possible
+            - the default is `10`
+        - `burstsize`
+            - `int`, optional
+            - number of alerts per burst
+            - only used if `profile=="burst"`
+            - the default is `100`
+        - `speedup`
+            - `float`, optional
+            - factor by which to speed up the replay with respect to the observed timestamps
+            - only used if `profile=="night"`
+            - the default is `1`
+        - `shuffle`
+            - `bool`, optional
+            - whether to emit alerts in random order
+            - ignored if `profile=="night"`
+            - random order hits a different row-group for almost every alert unless `cache_size` covers all row-groups
+                - i.e., a full row-group gets decoded per alert and limits the achievable rate
+            - the default is `False`
+        - `loop`
+            - `bool`, optional
+            - whether to start over once all alerts have been emitted
+            - requires at least one alert in `fnames`
+            - the default is `False`
+        - `seed`
+            - `int`, optional
+            - seed for the random order
+            - the default is `None`
+        - `cache_size`
+            - `int`, optional
+            - number of row-groups to keep in memory
+            - the default is `4`
+        - `topic`
+            - `str`, optional
+            - topic reported for every emitted alert
+            - the default is `"replay"`
+        - `nalerts`
+            - `int`
+            - total number of alerts available
+
+    Methods
+        - `alert()`
+        - `consume()`
+        - `poll()`
+        - `close()`
+    """
+
+    def __init__(self,
+        fnames:List[str],
+        profile:str="constant",
+        rate:float=10,
+        burstsize:int=100,
+        speedup:float=1,
+        shuffle:bool=False,
+        loop:bool=False,
+        seed:int=None,
+        cache_size:int=4,
+        topic:str="replay",
+        ):
+
+        if profile not in ["constant", "burst", "night"]:
+            raise ValueError(f"`profile` has to be one of `constant`, `burst`, `night` but is {profile}")
+        if len(fnames) == 0:
+            raise ValueError("`fnames` has to contain at least one file")
+
+        self.fnames     = fnames
+        self.profile    = profile
+        self.rate       = rate
+        self.burstsize  = burstsize
+        self.speedup    = speedup
+        self.shuffle    = shuffle
+        self.loop       = loop
+        self.seed       = seed
+        self.cache_size = cache_size
+        self.topic      = topic
+
+        self._rng = np.random.default_rng(seed)
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()   #consumers might poll concurrently
+        self._mjd = None
+
+        #index over all row-groups (read once)
+        self._files = [pq.ParquetFile(fn) for fn in fnames]
+        rg_file, rg_idx, rg_nrows = [], [], []
+        for fi, f in enumerate(self._files):
+            for ri in range(f.metadata.num_row_groups):
+                rg_file.append(fi)
+                rg_idx.append(ri)
+                rg_nrows.append(f.metadata.row_group(ri).num_rows)
+        self._rg_file   = np.array(rg_file, dtype=int)
+        self._rg_idx    = np.array(rg_idx, dtype=int)
+        self._rg_start  = np.concatenate([[0], np.cumsum(rg_nrows)]).astype(int)    #global index of first row in each row-group
+        self.nalerts    = int(self._rg_start[-1])
+        logger.info(f"{self.__class__.__name__}: indexed {self.nalerts} alerts in {len(rg_nrows)} row-groups of {len(fnames)} files")
+        if self.loop and (self.nalerts == 0):
+            raise ValueError("`loop` requires at least one alert but `fnames` contain none")
+
+        self._make_schedule()
+
+        return
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(\n"
+            f"    fnames={self.fnames!r},\n"
+            f"    profile={self.profile!r},\n"
+            f"    rate={self.rate!r},\n"
+            f"    burstsize={self.burstsize!r},\n"
+            f"    speedup={self.speedup!r},\n"
+            f"    shuffle={self.shuffle!r},\n"
+            f"    loop={self.loop!r},\n"
+            f"    seed={self.seed!r},\n"
+            f"    cache_size={self.cache_size!r},\n"
+            f"    topic={self.topic!r},\n"
+            f")"
+        )
+
+    def __len__(self) -> int:
+        return self.nalerts
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+        return
+
+    def _make_schedule(self):
+        """assigns an emission order and due time (in seconds) to every alert"""
+        if self.profile == "night":
+            #order by observation time (only reads a single nested column, once)
+            if self._mjd is None:
+                mjd = np.concatenate([
+                    f.read(columns=["diaSource.midpointMjdTai"]).column("diaSource").combine_chunks().field("midpointMjdTai").to_numpy(zero_copy_only=False)
+                    for f in self._files
+                ]).astype(np.float64)
+                self._mjd = np.where(np.isfinite(mjd), mjd, np.nanmin(mjd))
+            mjd = self._mjd
+            self._order = np.argsort(mjd, kind="stable")
+            self._due = (mjd[self._order] - mjd[self._order[0]]) * 86400 / self.speedup
+        else:
+            self._order = self._rng.permutation(self.nalerts) if self.shuffle else np.arange(self.nalerts)
+            if self.rate <= 0:
+                self._due = np.zeros(self.nalerts)
+            elif self.profile == "constant":
+                self._due = np.arange(self.nalerts) / self.rate
+            else:
+                #all alerts in a burst are due at once
+                self._due = (np.arange(self.nalerts) // self.burstsize) * self.burstsize / self.rate
+
+        self._pos = 0           #next alert to emit
+        self._t0 = None         #start of the replay (set on first `consume()`)
+        return
+
+    def _row_group(self, rgi:int):
+        """returns row-group `rgi` (cached)"""
+        if rgi in self._cache:
+            self._cache.move_to_end(rgi)
+        else:
+            self._cache[rgi] = self._files[self._rg_file[rgi]].read_row_group(self._rg_idx[rgi])
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return self._cache[rgi]
+
+    def alert(self, idx:int) -> Tuple[str,dict,dict]:
+        """returns the alert with global index `idx`
+
+        Parameters
+            - `idx`
+                - `int`
+                - global index of the alert (across all files)
+
+        Returns
+            - `topic`
+                - `str`
+                - `topic` of the source
+            - `alert`
+                - `dict`
+                - alert
+            - `key`
+                - `dict`
+                - alert schema
+                - ignored here
+        """
+        rgi = int(np.searchsorted(self._rg_start, idx, side="right") - 1)
+        table = self._row_group(rgi)
+        alert = table.slice(idx - self._rg_start[rgi], 1).to_pylist()[0]
+        return self.topic, alert, dict(comment="replay")
+
+    def consume(self, num_alerts:int=1, timeout:float=-1) -> List[Tuple[str,dict,dict]]:
+        """returns up to `num_alerts` alerts that are due within `timeout` seconds
+
+        - same signature as `fink_client.consumer.AlertConsumer.consume()`
+        - like kafka, blocks until `num_alerts` alerts are due or `timeout` is reached
+
+        Parameters
+            - `num_alerts`
+                - `int`, optional
+                - maximum number of alerts to return
+                - the default is `1`
+            - `timeout`
+                - `float`, optional
+                - maximum time to block waiting for alerts
+                - negative values wait indefinitely
+                - the default is `-1`
+
+        Returns
+            - `alerts`
+                - `List[Tuple[str,dict,dict]]`
+                - list of topic, alert, key
+                - empty if no alert got due within `timeout`
+        """
+        with self._lock:
+            return self._consume(num_alerts, timeout)
+
+    def _consume(self, num_alerts:int, timeout:float) -> List[Tuple[str,dict,dict]]:
+        if self._t0 is None: self._t0 = time.monotonic()
+        deadline = np.inf if timeout < 0 else time.monotonic() + timeout
+
+        alerts = []
+        while len(alerts) < num_alerts:
+            if self._pos >= self.nalerts:
+                if not self.loop:
+                    if np.isfinite(deadline):
+                        time.sleep(max(0, deadline - time.monotonic()))   #behave like an idle stream
+                    break
+                self._make_schedule()
+                self._t0 = time.monotonic()
+            due = self._t0 + self._due[self._pos]
+            now = time.monotonic()
+            if due > deadline:
+                #next alert is not due within `timeout` (like kafka, wait until `timeout` is reached)
+                time.sleep(max(0, deadline - now))
+                break
+            elif due > now:
+                time.sleep(due - now)
+            alerts.append(self.alert(int(self._order[self._pos])))
+            self._pos += 1
+
+        return alerts
+
+    def poll(self, timeout:float=-1) -> Tuple[str,dict,dict]:
+        """returns a single alert
+
+        - same signature as `fink_client.consumer.AlertConsumer.poll()`
+
+        Parameters
+            - `timeout`
+                - `float`, optional
+                - maximum time to block waiting for an alert
+                - the default is `-1`
+
+        Returns
+            - `topic`, `alert`, `key`
+                - `(None, None, None)` on timeout
+        """
+        alerts = self.consume(num_alerts=1, timeout=timeout)
+        return alerts[0] if len(alerts) > 0 else (None, None, None)
+
+    def close(self):
+        """releases cached row-groups"""
+        self._cache.clear()
+        return
@@ -0,0 +1,233 @@
+"""sky-position index of processed alerts
+
+- k-d tree (`scipy.spatial.cKDTree`) over unit vectors of (`ra`, `dec`)
+    - exact angular distances (no distortion close to the poles or at `ra = 0`)
+    - angular radii are converted to chord lengths (`2*sin(radius/2)`)
+- supports
+    - cone searches
+    - crossmatching against a local catalog (csv or parquet)
+    - grouping of detections within a radius (friends-of-friends)
+        - i.e., repeat detections of the same position
+        - groups can be used to build chunks per sky region or per object (see `thump.fink_lsst.process_data.plan_groups()`)
+- can be built from
+    - arrays of positions
+    - the object-to-file index of a directory of `ThumP!` files (see `thump.data.index`)
+        - note, `ra` and `dec` are rounded to 2 decimals (~36 arcsec) in `thump.fink_lsst.process_data.read_files()`
+    - alert packages downloaded via datatransfer (full precision, see `thump.fink_lsst.query.scan_alerts()`)
+- building the tree takes a few seconds for millions of alerts
+
+Exceptions
+
+Classes
+    - `SkyIndex` -- k-d tree over the sky positions of alerts
+
+Functions
+    - `unit_vectors()` -- convert sky positions to unit vectors
+
+Other Objects
+"""
+
+#%%imports
+import numpy as np
+import polars as pl
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
+from typing import List, Tuple
+
+from thump.data import index as thix
+from thump.fink_lsst import query as thqu
+
+#%%definitions
+def unit_vectors(ra:np.ndarray, dec:np.ndarray) -> np.ndarray:
+    """converts sky positions (in degrees) to unit vectors of shape `(N, 3)`"""
+    ra, dec = np.radians(np.asarray(ra, dtype=np.float64)), np.radians(np.asarray(dec, dtype=np.float64))
+    cosdec = np.cos(dec)
+    return np.stack([cosdec * np.cos(ra), cosdec * np.sin(ra), np.sin(dec)], axis=-1)
+
+def _chord(radius:float) -> float:
+    """chord length of an angular `radius` (in arcsec)"""
+    return 2 * np.sin(np.radians(radius / 3600) / 2)
+
+def _angle(chord:np.ndarray) -> np.ndarray:
+    """angular separation (in arcsec) of a chord length"""
+    return np.degrees(2 * np.arcsin(np.clip(chord / 2, 0, 1))) * 3600
+
+class SkyIndex:
+    """k-d tree over the sky positions of alerts
+
+    Attributes
+        - `ids`
+            - `np.ndarray`
+            - id of every alert (i.e., `diaSourceId`)
+        - `ra`
+            - `np.ndarray`
+            - right ascension of every alert in degrees
+        - `dec`
+            - `np.ndarray`
+            - declination of every alert in degrees
+        - `leafsize`
+            - `int`, optional
+            - leaf size of the k-d tree
+            - the default is `32`
+
+    Methods
+        - `from_frame()`
+        - `from_index()`
+        - `from_alerts()`
+        - `cone()`
+        - `crossmatch()`
+        - `crossmatch_catalog()`
+        - `group()`
+    """
+
+    def __init__(self,
+        ids:np.ndarray,
+        ra:np.ndarray,
+        dec:np.ndarray,
+        leafsize:int=32,
+        ):
+
+        self.ids        = np.asarray(ids)
+        self.ra         = np.asarray(ra, dtype=np.float64)
+        self.dec        = np.asarray(dec, dtype=np.float64)
+        self.leafsize   = leafsize
+
+        if not (len(self.ids) == len(self.ra) == len(self.dec)):
+            raise ValueError(f"`ids`, `ra` and `dec` have to have the same length but have {len(self.ids)}, {len(self.ra)}, {len(self.dec)}")
+
+        self._tree = cKDTree(unit_vectors(self.ra, self.dec), leafsize=self.leafsize, balanced_tree=False, compact_nodes=False)
+
+        return
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(\n"
+            f"    ids=<{len(self.ids)} alerts>,\n"
+            f"    leafsize={self.leafsize!r},\n"
+            f")"
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def from_frame(cls, df:pl.DataFrame, id_col:str="objectId", ra_col:str="ra", dec_col:str="dec", **kwargs) -> "SkyIndex":
+        """builds the index from a dataframe (rows without position are dropped)"""
+        df = df.drop_nulls([ra_col, dec_col])
+        return cls(df[id_col].to_numpy(), df[ra_col].to_numpy(), df[dec_col].to_numpy(), **kwargs)
+
+    @classmethod
+    def from_index(cls, dir:str, **kwargs) -> "SkyIndex":
+        """builds the index from the object-to-file index of the `ThumP!` files in `dir` (see `thump.data.index`)"""
+        return cls.from_frame(thix.scan(dir).select("objectId", "ra", "dec").collect(), **kwargs)
+
+    @classmethod
+    def from_alerts(cls, fnames:List[str], **kwargs) -> "SkyIndex":
+        """builds the index from alert packages downloaded via datatransfer (full precision positions)"""
+        df = thqu.scan_alerts(fnames, columns=["diaObject.ra", "diaObject.dec"]).collect(engine="streaming")
+        return cls.from_frame(df, ra_col="diaObject.ra", dec_col="diaObject.dec", **kwargs)
+
+    def cone(self, ra:float, dec:float, radius:float) -> np.ndarray:
+        """cone search
+
+        Parameters
+            - `ra`
+                - `float`
+                - right ascension of the center in degrees
+            - `dec`
+                - `float`
+                - declination of the center in degrees
+            - `radius`
+                - `float`
+                - radius of the cone in arcsec
+
+        Returns
+            - `idxs`
+                - `np.ndarray`
+                - indices (into `ids`) of all alerts within the cone (sorted)
+        """
+        idxs = self._tree.query_ball_point(unit_vectors(ra, dec), _chord(radius))
+        return np.sort(np.asarray(idxs, dtype=np.int64))
+
+    def crossmatch(self, ra:np.ndarray, dec:np.ndarray, radius:float) -> Tuple[np.ndarray,np.ndarray]:
+        """finds the closest alert of every position in (`ra`, `dec`)
+
+        Parameters
+            - `ra`
+                - `np.ndarray`
+                - right ascensions of the positions to match in degrees
+            - `dec`
+                - `np.ndarray`
+                - declinations of the positions to match in degrees
+            - `radius`
+                - `float`
+                - maximum separation in arcsec
+
+        Returns
+            - `idxs`
+                - `np.ndarray`
+                - index (into `ids`) of the closest alert
+                - `-1` if there is no alert within `radius`
+            - `sep`
+                - `np.ndarray`
+                - separation in arcsec (`np.inf` if there is no match)
+        """
+        dist, idxs = self._tree.query(unit_vectors(ra, dec), k=1, distance_upper_bound=_chord(radius))
+        matched = np.isfinite(dist)
+        return np.where(matched, idxs, -1), np.where(matched, _angle(np.where(matched, dist, 0)), np.inf)
+
+    def crossmatch_catalog(self, fname:str, radius:float, ra_col:str="ra", dec_col:str="dec") -> pl.DataFrame:
+        """crossmatches a local catalog against the indexed alerts
+
+        Parameters
+            - `fname`
+                - `str`
+                - catalog file (parquet if it ends with `.parquet`, csv otherwise)
+            - `radius`
+                - `float`
+                - maximum separation in arcsec
+            - `ra_col`
+                - `str`, optional
+                - column of the catalog containing the right ascension in degrees
+                - the default is `"ra"`
+            - `dec_col`
+                - `str`, optional
+                - column of the catalog containing the declination in degrees
+                - the default is `"dec"`
+
+        Returns
+            - `matches`
+                - `pl.DataFrame`
+                - catalog entries that have an alert within `radius`
+                - with `objectId` of the closest alert and the separation (`sep_arcsec`)
+        """
+        catalog = pl.read_parquet(fname) if fname.endswith(".parquet") else pl.read_csv(fname, comment_prefix="#")
+        idxs, sep = self.crossmatch(catalog[ra_col].to_numpy(), catalog[dec_col].to_numpy(), radius)
+        matched = idxs >= 0
+        return catalog.filter(pl.Series(matched)).with_columns(
+            pl.Series("objectId", self.ids[idxs[matched]]),
+            pl.Series("sep_arcsec", sep[matched]),
+        )
+
+    def group(self, radius:float) -> np.ndarray:
+        """groups alerts within `radius` of each other (friends-of-friends)
+
+        - two alerts end up in the same group if they are connected by a chain of alerts with separations below `radius`
+
+        Parameters
+            - `radius`
+                - `float`
+                - linking length in arcsec
+
+        Returns
+            - `groups`
+                - `np.ndarray`
+                - group label of every alert
+                - labels are consecutive integers starting at 0
+        """
+        pairs = self._tree.query_pairs(_chord(radius), output_type="ndarray")
+        n = len(self.ids)
+        graph = coo_matrix((np.ones(len(pairs), dtype=np.int8), (pairs[:,0], pairs[:,1])), shape=(n, n))
+        _, groups = connected_components(graph, directed=False)
+        return groups
@@ -8,7 +8,7 @@
 #SBATCH --reservation=rubin
 
 #SBATCH --ntasks=12
-#SBATCH --mem=4G            #~200MiB for processing 30 alerts in parallel (based on memory-profiler)
+#SBATCH --mem=4G            #~200MiB for processing 30 alerts in parallel (based on memory-profiler, see `python3 -m thump.benchmarks.pipeline` for current numbers)
 #SBATCH --time=0-11:00:00
 
 source ./_paths.sh
@@ -20,6 +20,7 @@ source ${THUMP_PATH}.venv/bin/activate
 # python3 ${THUMP_PATH}src/thump/commands/fink_from_datatransfer_lsst.py \
 #     "${THUMP_PATH}data/*/*.parquet" --save "${THUMP_PATH}data/processed/" \
 #     --chunklen 60 --chunk_start 0 --nchunks 30 \
+#     --incremental true \
 #     --njobs 5
 
 # fink_consumer --save -outdir data/fink_stream/
@@ -32,6 +33,17 @@ python3 ${THUMP_PATH}src/thump/commands/fink_stream_alerts_lsst.py \
     --maxalerts 100 \
     --npolls -1 \
     --njobs -1 \
+    --runtime pipeline \
+    --decoder process \
+    --spill true \
+    --checkpoint true \
+    --nconsumers 1 \
+    --nwriters 1 \
+    --queuesize 256 \
+    --adaptive true \
+    --minalerts 10 \
+    --mintimeout 5 \
+    --target_latency 10 \
 
 # #profiling
 # mprof run -M python "${THUMP_PATH}src/thump/commands/fink_stream_alerts_lsst.py" \
@@ -47,11 +59,13 @@ python3 ${THUMP_PATH}src/thump/commands/fink_stream_alerts_lsst.py \
 # python3 ${THUMP_PATH}/src/thump/commands/fink_stream_alerts_lsst.py \
 #      --save "${THUMP_PATH}data/fink_stream_synth/" \
 #     --chunklen 60 \
-#     --maxtimeout 0 \
+#     --maxtimeout 5 \
 #     --maxalerts 100 \
 #     --npolls -1 \
 #     --njobs -1  \
 #     --pat "${THUMP_PATH}data/*/*.parquet" \
+#     --replay_profile constant \
+#     --replay_rate 50 \
 
 #concatenating output
 # python3 ${THUMP_PATH}/src/thump/commands/concat_output.py ./ --save ./data/inspected/inspected_0000.csv
@@ -68,6 +82,7 @@ python3 ${THUMP_PATH}src/thump/commands/fink_stream_alerts_lsst.py \
 
 #commands for syncing
 # rsync -chavzP --delete "$SOURCE" "$DEST"  #SOURCE, DEST ... directories
+# rsync -chavP --delete "$SOURCE" "$DEST"   #without `-z` if files are written with `--compression gzip` (already compressed)
 
 
 deactivate